@@ -1,52 +1,21 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import IsolationForest
 from pykalman import KalmanFilter
-import osmnx as ox
 import json
 import logging
-from component.emission import calculate_co2_emissions
+from component.pipeline_profiler import PipelineProfiler
+from component.outlier_detection import detect_outliers
+from component.roads_client import snap_path_to_roads
+from component.map_matching import match_path_to_roads
+from component.smoothing import rts_smooth, pykalman_smooth, SMOOTHERS
+from component.geometry import point_distances
+from component.route_encoding import encoded_coordinates_fields
+from component.route_repository import init_firebase
+from component.elevation import (get_local_dem, get_default_elevation_cache, fetch_remote_elevation,
+                                 DEFAULT_DEM_DIR)
 import googlemaps
 import math
-import streamlit as st
-
-# Initialize Firebase if not already initialized
-def init_firebase():
-    if not firebase_admin._apps:
-        # Check if we are running with Streamlit
-        if 'streamlit' in globals() or 'streamlit' in locals() or 'st' in globals() or 'st' in locals():
-            try:
-                # Use Streamlit secrets if available
-                firebase_secrets = st.secrets["firebase"]
-                
-                # Convert secrets to the format expected by Firebase Admin SDK
-                firebase_creds = {
-                    "type": firebase_secrets["type"],
-                    "project_id": firebase_secrets["project_id"],
-                    "private_key_id": firebase_secrets["private_key_id"],
-                    "private_key": firebase_secrets["private_key"],
-                    "client_email": firebase_secrets["client_email"],
-                    "client_id": firebase_secrets["client_id"],
-                    "auth_uri": firebase_secrets["auth_uri"],
-                    "token_uri": firebase_secrets["token_uri"],
-                    "auth_provider_x509_cert_url": firebase_secrets["auth_provider_x509_cert_url"],
-                    "client_x509_cert_url": firebase_secrets["client_x509_cert_url"],
-                    "universe_domain": firebase_secrets["universe_domain"]
-                }
-                
-                cred = credentials.Certificate(firebase_creds)
-            except (KeyError, AttributeError):
-                # Fallback to file-based credentials
-                cred = credentials.Certificate('fyp-gps.json')
-        else:
-            # When not using Streamlit
-            cred = credentials.Certificate('fyp-gps.json')
-            
-        firebase_admin.initialize_app(cred)
-    
-    return firestore.client()
 
 def retrieve_data_from_firestore(collection_name):
     db = init_firebase()
@@ -79,21 +48,45 @@ def retrieve_data_from_firestore(collection_name):
 
     return df
 
-def haversine_distance(df):
-    R = 6371e3  # Earth radius in meters
-    lat = np.radians(df['latitude'])
-    lon = np.radians(df['longitude'])
-    
-    lat_prev = lat.shift()
-    lon_prev = lon.shift()
-    dlat = lat - lat_prev
-    dlon = lon - lon_prev
-    
-    a = np.sin(dlat / 2)**2 + np.cos(lat_prev) * np.cos(lat) * np.sin(dlon / 2)**2
-    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
-    return R * c
+# Layer 3 backends: Google Roads API or offline HMM matching on a local OSM graph
+MAP_MATCHERS = ['google', 'osm']
+
+# Gap (seconds) used by the dashboard and batch cleaning to split a trip into driving segments
+DEFAULT_RESAMPLE_GAP_SECONDS = 300
+
+def clean_gps_data(raw_df, google_api_key=None, profile=False, route_name=None,
+                   outlier_method='isolation_forest', outlier_options=None, snap_cache=None, snap_quota=None,
+                   map_matcher='google', road_graph_path=None, smoother='rts', resample_gap_seconds=None):
+    """
+    清洗GPS數據，返回 (cleaned_df, total_time, total_distance_km, df_with_angle_marks)
+    profile=True 時額外返回一個 PipelineProfiler，記錄每一層嘅耗時、行數同API調用次數
+    outlier_method 揀 Layer 1 用邊個異常檢測方法（見 component.outlier_detection.OUTLIER_DETECTORS）
+    snap_cache: Layer 3 用嘅 SnapToRoadsCache，None 用預設嘅磁碟緩存，False 唔用緩存
+    snap_quota: 覆蓋 component.roads_client.ROADS_API_QUOTA 嘅部分設定（速率、並發數、每條路線請求上限）
+    map_matcher: 'google' 用 Roads API，'osm' 用本地道路圖離線匹配（road_graph_path 係 GraphML 檔案）
+    smoother: Layer 4 用 'rts'（考慮時間間隔嘅等速模型，會加 smoothed_speed 欄）或者原本嘅 'pykalman'
+    resample_gap_seconds: Layer 5 喺大過呢個秒數嘅時間間隔切段各自重採樣（None = 成條軌跡一齊），
+                          段落資料喺 cleaned_df.attrs['segments']
+    """
+    profiler = PipelineProfiler(route_name)
+    result = _clean_gps_data_layers(raw_df, google_api_key, profiler,
+                                    outlier_method=outlier_method, outlier_options=outlier_options,
+                                    snap_cache=snap_cache, snap_quota=snap_quota,
+                                    map_matcher=map_matcher, road_graph_path=road_graph_path,
+                                    smoother=smoother, resample_gap_seconds=resample_gap_seconds)
+    if profile:
+        return result + (profiler,)
+    return result
+
+def _clean_gps_data_layers(raw_df, google_api_key, profiler, outlier_method='isolation_forest',
+                           outlier_options=None, snap_cache=None, snap_quota=None,
+                           map_matcher='google', road_graph_path=None, smoother='rts',
+                           resample_gap_seconds=None):
+    if map_matcher not in MAP_MATCHERS:
+        raise ValueError(f"Unknown map matcher '{map_matcher}'. Available: {', '.join(MAP_MATCHERS)}")
+    if smoother not in SMOOTHERS:
+        raise ValueError(f"Unknown smoother '{smoother}'. Available: {', '.join(SMOOTHERS)}")
 
-def clean_gps_data(raw_df, google_api_key=None):
     # Layer 0: Preprocessing
     if raw_df.empty:
         return pd.DataFrame(), 0.0, 0.0, pd.DataFrame()  # 添加空嘅角度可靠性DataFrame
@@ -108,204 +101,256 @@ def clean_gps_data(raw_df, google_api_key=None):
         return pd.DataFrame(), 0.0, 0.0, pd.DataFrame()
 
     # 新增: 角度過濾（喺異常檢測之前）
-    print("開始角度過濾...")
-    df_angle_filtered, df_with_angle_marks = filter_by_angle(df, angle_threshold=90)
-    
-    # 打印角度標記嘅統計
-    print(f"角度標記為 'X' 嘅點: {sum(df_with_angle_marks['angle_reliability'] == 'X')}")
-    print(f"角度標記為 'Y' 嘅點: {sum(df_with_angle_marks['angle_reliability'] == 'Y')}")
-    
-    # 使用過濾後嘅數據繼續處理
-    df = df_angle_filtered
+    with profiler.layer('angle_filter', len(df)) as layer:
+        print("開始角度過濾...")
+        df_angle_filtered, df_with_angle_marks = filter_by_angle(df, angle_threshold=90)
+        
+        # 打印角度標記嘅統計
+        print(f"角度標記為 'X' 嘅點: {sum(df_with_angle_marks['angle_reliability'] == 'X')}")
+        print(f"角度標記為 'Y' 嘅點: {sum(df_with_angle_marks['angle_reliability'] == 'Y')}")
+        
+        # 使用過濾後嘅數據繼續處理
+        df = df_angle_filtered
+        layer['rows_out'] = len(df)
     
     # Layer 1: Outlier Detection
-    # ... existing code ...
-    from sklearn.ensemble import IsolationForest
-    coords = df[['latitude', 'longitude']].values
-    iso_forest = IsolationForest(contamination=0.05)
-    df['is_outlier'] = iso_forest.fit_predict(coords)
-    df = df[df['is_outlier'] == 1].drop(columns=['is_outlier'])
+    with profiler.layer('outlier_detection', len(df)) as layer:
+        df, outlier_stats = detect_outliers(df, method=outlier_method, **(outlier_options or {}))
+        layer['details'] = outlier_stats
+        layer['rows_out'] = len(df)
     
     # Layer 2: Temporal Validation
-    df['time_diff'] = df['timestamp'].diff().dt.total_seconds().fillna(0)
-    df = df[df['time_diff'] > 0]
-    
-    logging.info("DataFrame before calculating distance:\n %s", df)
-
-    df['distance'] = haversine_distance(df)
-    df['speed'] = df['distance'] / df['time_diff']
-    df = df[(df['speed'] < 25) & (df['time_diff'] > 0)]  # 25 m/s (90 km/h) threshold
-    total_time = df['time_diff'].sum()
-    
-    total_distance_km = df['distance'].sum() / 1000  # Convert from meters to kilometers
-
-    # Layer 3: Geospatial Validation using Google Maps
-    try:
-        if df.empty:
-            logging.warning("No data available for geospatial validation.")
-            return df, total_time, total_distance_km, df_with_angle_marks  # Return if the DataFrame is empty
-        
-        import googlemaps
-        
-        if not google_api_key:
-            logging.error("Google Maps API key is required for map matching")
-            raise ValueError("Google Maps API key is required but not provided")
-        
-        # Initialize Google Maps client
-        gmaps = googlemaps.Client(key=google_api_key)
-        
-        logging.info("Using Google Maps API for map matching")
+    with profiler.layer('temporal_validation', len(df)) as layer:
+        df['time_diff'] = df['timestamp'].diff().dt.total_seconds().fillna(0)
+        df = df[df['time_diff'] > 0]
         
-        # Google Maps Roads API has a limit on points per request (usually 100)
-        # So we'll process in batches
-        batch_size = 90  # Slightly less than the limit to be safe
-        snapped_points = []
-        
-        # If we have too many points, sample them to stay within Google's limits
-        # Roads API has a limit of 100 points per request and daily quota limits
-        if len(df) > 500:
-            logging.info(f"Too many points ({len(df)}), sampling down to 500 to avoid API quota issues")
-            sample_indices = np.linspace(0, len(df)-1, 500, dtype=int)
-            df_sampled = df.iloc[sample_indices].copy()
-        else:
-            df_sampled = df.copy()
+        logging.info("DataFrame before calculating distance:\n %s", df)
+
+        df['distance'] = point_distances(df['latitude'], df['longitude'], method='haversine')
+        df['speed'] = df['distance'] / df['time_diff']
+        df = df[(df['speed'] < 25) & (df['time_diff'] > 0)]  # 25 m/s (90 km/h) threshold
+        total_time = df['time_diff'].sum()
         
-        for i in range(0, len(df_sampled), batch_size):
-            batch = df_sampled.iloc[i:min(i+batch_size, len(df_sampled))]
-            
-            # Format points for Google Maps API - Note they need to be in lat,lng order
-            path = [[float(row['latitude']), float(row['longitude'])] 
-                   for _, row in batch.iterrows()]
-            
-            logging.info(f"Sending {len(path)} points to Google Maps Roads API")
+        total_distance_km = df['distance'].sum() / 1000  # Convert from meters to kilometers
+        layer['rows_out'] = len(df)
+
+    # Layer 3: Geospatial Validation (Google Maps Roads API or local road graph)
+    with profiler.layer('map_matching', len(df)) as layer:
+        try:
+            if df.empty:
+                logging.warning("No data available for geospatial validation.")
+                return df, total_time, total_distance_km, df_with_angle_marks  # Return if the DataFrame is empty
             
-            # Call the snap to roads API
-            result = gmaps.snap_to_roads(
-                path,
-                interpolate=True  # Add points along the road
-            )
+            # Format points for map matching - Note they need to be in lat,lng order
+            path = df[['latitude', 'longitude']].to_numpy(dtype=float).tolist()
+            if map_matcher == 'osm':
+                logging.info("Using the local road graph for map matching")
+                snapped_points = match_path_to_roads(path, road_graph_path, layer=layer)
+            else:
+                logging.info("Using Google Maps API for map matching")
+                # Full resolution: overlapping batches are sent concurrently under the rate limit,
+                # the trace is only sampled when it needs more requests than ROADS_API_QUOTA allows
+                snapped_points = snap_path_to_roads(path, google_api_key, snap_cache=snap_cache, layer=layer,
+                                                    quota=snap_quota)
             
-            # Add snapped points to our list
-            for point in result:
-                snapped_points.append({
-                    'latitude': point['location']['latitude'],
-                    'longitude': point['location']['longitude']
-                })
+            # Create a new DataFrame with the snapped points
+            snapped_df = pd.DataFrame(snapped_points)
             
-            logging.info(f"Processed {min(i+batch_size, len(df_sampled))}/{len(df_sampled)} points with Google Maps Roads API")
-        
-        # Create a new DataFrame with the snapped points
-        snapped_df = pd.DataFrame(snapped_points)
+            if len(snapped_df) > 0:
+                snapped_df['timestamp'] = snapped_timestamps(snapped_df, df['timestamp'])
+                snapped_df = snapped_df.drop(columns='original_index', errors='ignore')
+                
+                # Calculate time differences for the snapped points
+                snapped_df['time_diff'] = snapped_df['timestamp'].diff().dt.total_seconds().fillna(0)
+                
+                # Use the snapped points for further processing
+                df = snapped_df
+                
+                # Recalculate distances and total distance
+                df['distance'] = point_distances(df['latitude'], df['longitude'], method='haversine')
+                total_distance_km = df['distance'].sum() / 1000
+                total_time = df['time_diff'].sum()
+                
+                logging.info(f"Successfully snapped {len(df)} points to roads ({map_matcher})")
+            else:
+                logging.warning("No points were returned by map matching. Using original points.")
         
-        if len(snapped_df) > 0:
-            # Create timestamps for snapped points
-            # We'll create timestamps that are evenly distributed across the original timeframe
-            original_start = df['timestamp'].min()
-            original_end = df['timestamp'].max()
-            duration = (original_end - original_start).total_seconds()
-            
-            timestamps = []
-            for i in range(len(snapped_df)):
-                fraction = i / (len(snapped_df) - 1) if len(snapped_df) > 1 else 0
-                seconds = duration * fraction
-                timestamps.append(original_start + pd.Timedelta(seconds=seconds))
-            
-            snapped_df['timestamp'] = timestamps
-            
-            # Calculate time differences for the snapped points
-            snapped_df['time_diff'] = snapped_df['timestamp'].diff().dt.total_seconds().fillna(0)
-            
-            # Use the snapped points for further processing
-            df = snapped_df
-            
-            # Recalculate distances and total distance
-            df['distance'] = haversine_distance(df)
-            total_distance_km = df['distance'].sum() / 1000
-            total_time = df['time_diff'].sum()
-            
-            logging.info(f"Successfully snapped {len(df)} points to roads using Google Maps API")
-        else:
-            logging.warning("No points were returned from Google Maps API. Using original points.")
-    
-    except Exception as e:
-        logging.error(f"Error during Google Maps geospatial validation: {str(e)}")
-        logging.error("Map matching failed. Continuing with original points.")
+        except Exception as e:
+            logging.error(f"Error during geospatial validation ({map_matcher}): {str(e)}")
+            logging.error("Map matching failed. Continuing with original points.")
+        layer['rows_out'] = len(df)
 
     # Layer 4: Smoothing & Filtering
-    if not df.empty:
-        from pykalman import KalmanFilter
-        kf = KalmanFilter(transition_matrices=np.eye(2),
-                          observation_matrices=np.eye(2),
-                          initial_state_mean=df[['latitude', 'longitude']].values[0])
-        smoothed, _ = kf.smooth(df[['latitude', 'longitude']].values)
-        df[['latitude', 'longitude']] = smoothed
-    else:
-        logging.warning("Warning: No data after filtering")
+    with profiler.layer('smoothing', len(df)) as layer:
+        if not df.empty:
+            if smoother == 'rts':
+                # 用真實時間間隔（唔係 Layer 2 嘅 time_diff，因為速度過濾後可能刪咗點）
+                time_diff = df['timestamp'].diff().dt.total_seconds().fillna(0).to_numpy()
+                lat, lon, east_velocity, north_velocity = rts_smooth(
+                    df['latitude'].to_numpy(), df['longitude'].to_numpy(), time_diff, return_velocity=True)
+                df['smoothed_speed'] = np.hypot(east_velocity, north_velocity)  # m/s
+            else:
+                lat, lon = pykalman_smooth(df['latitude'].to_numpy(), df['longitude'].to_numpy())
+            df['latitude'] = lat
+            df['longitude'] = lon
+            layer['details'] = {'smoother': smoother}
+        else:
+            logging.warning("Warning: No data after filtering")
 
     # Layer 5: Data Interpolation
-    df.set_index('timestamp', inplace=True)
-    logging.info("DataFrame before resampling:\n %s", df)  # Check before resampling
-    df = df.resample('5S').mean(numeric_only=True)  # 5-second frequency and calculate mean for numeric columns
-    df = df.ffill()  # Forward fill to fill NaN values
-
-    for col in ['latitude', 'longitude']: 
-        df[col] = df[col].interpolate(method='linear')
+    with profiler.layer('resampling', len(df)) as layer:
+        df.set_index('timestamp', inplace=True)
+        logging.info("DataFrame before resampling:\n %s", df)  # Check before resampling
+        # 5-second frequency; with resample_gap_seconds each driving segment is resampled on its own
+        df, segments = resample_by_segment(df, freq='5s', gap_seconds=resample_gap_seconds)
+        layer['details'] = {'segments': len(segments), 'gap_seconds': resample_gap_seconds}
+        layer['rows_out'] = len(df)
 
     # 返回多一個參數，即角度可靠性標記後嘅數據
-    return df.reset_index(), total_time, total_distance_km, df_with_angle_marks
+    df = df.reset_index()
+    df.attrs['segments'] = segments
+    return df, total_time, total_distance_km, df_with_angle_marks
 
-def add_elevation_data(df, max_batch_size=50, requests_per_second=15, max_retries=3):
-    """Fetch elevation data in batches and control request rate automatically."""
-    import requests
+def snapped_timestamps(snapped_df, timestamps):
+    """
+    Timestamps for map-matched points: a point snapped from input point i gets its time,
+    points added along the road in between are interpolated by position. Falls back to
+    spreading the points evenly over the trace when no source indices are available.
+    """
+    start = timestamps.iloc[0]
+    seconds = (timestamps - start).dt.total_seconds().to_numpy()
+    positions = np.arange(len(snapped_df))
+    source = pd.to_numeric(snapped_df['original_index'], errors='coerce').to_numpy() \
+        if 'original_index' in snapped_df else np.full(len(snapped_df), np.nan)
+    known = ~np.isnan(source)
+    if known.any():
+        snapped_seconds = np.interp(positions, positions[known], seconds[source[known].astype(int)])
+    else:
+        snapped_seconds = np.linspace(0, seconds[-1], len(snapped_df)) if len(snapped_df) > 1 else np.zeros(1)
+    return start + pd.to_timedelta(snapped_seconds, unit='s')
+
+def resample_by_segment(df, freq='5s', gap_seconds=None):
+    """
+    Layer 5 重採樣，df 要以 timestamp 做 index，返回 (resampled_df, segments)。
+    gap_seconds=None 同原本一樣成條軌跡一齊重採樣再 ffill；否則喺大過 gap_seconds 嘅
+    時間間隔切段，每段各自重採樣（加 segment_id 欄），停車或者斷線嘅時間唔會補滿重複點。
+    segments 係每段嘅 {segment_id, start, end, points, rows}。
+    """
+    if gap_seconds is None or df.empty:
+        parts = [df]
+    else:
+        # Segments must be further apart than one bin so their bins never overlap
+        gap_seconds = max(gap_seconds, pd.Timedelta(freq).total_seconds())
+        gaps = df.index.to_series().diff().dt.total_seconds() > gap_seconds
+        segment_ids = gaps.cumsum().to_numpy()
+        parts = [df[segment_ids == i] for i in range(segment_ids[-1] + 1)]
+
+    resampled_parts = []
+    segments = []
+    for segment_id, part in enumerate(parts):
+        resampled = part.resample(freq).mean(numeric_only=True)  # calculate mean for numeric columns
+        resampled = resampled.ffill()  # Forward fill to fill NaN values
+        for col in ['latitude', 'longitude']:
+            resampled[col] = resampled[col].interpolate(method='linear')
+        if gap_seconds is not None:
+            resampled['segment_id'] = segment_id
+        if len(resampled):
+            segments.append({'segment_id': segment_id, 'start': resampled.index[0], 'end': resampled.index[-1],
+                             'points': len(part), 'rows': len(resampled)})
+        resampled_parts.append(resampled)
+
+    return pd.concat(resampled_parts), segments
+
+def add_elevation_data(df, max_batch_size=50, requests_per_second=15, max_retries=3, provider='auto', dem_dir=None,
+                       elevation_cache=None, max_concurrency=8):
+    """
+    Add an elevation column.
+    provider='auto': local DEM tiles (component.elevation) first, Open-Elevation API only for points
+    no tile covers; 'local': tiles only (NaN where uncovered); 'remote': API only.
+    Remote lookups go through elevation_cache (None = default on-disk ElevationCache, False = off),
+    so only cache misses are requested, max_concurrency batches at a time under the rate limit.
+    Points whose batch failed are left as NaN (not 0); per-source counts and failed batches are
+    in df.attrs['elevation_stats'].
+    """
     import time
-    from requests.exceptions import RequestException
     
-    # Calling API
-    base_url = 'https://api.open-elevation.com/api/v1/lookup'
     total_points = len(df)
-    df['elevation'] = 0.0  
-    
-    for i in range(0, total_points, max_batch_size):
-        batch = df.iloc[i:i + max_batch_size]
-        locations = [{'latitude': row['latitude'], 'longitude': row['longitude']} 
-                     for _, row in batch.iterrows()]
-        
-        success = False
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(
-                    base_url,
-                    json={'locations': locations},
-                    timeout=10  # Timeout after 10 seconds
-                )
-                response.raise_for_status()
-                
-                elevations = [r['elevation'] for r in response.json()['results']]
-                df.loc[batch.index, 'elevation'] = elevations
-                print(f"Successfully processed {min(i + max_batch_size, total_points)}/{total_points} points")
-                success = True
-                break  # Exit the retry loop on success
-                
-            except RequestException as e:
-                print(f"Batch {i // max_batch_size + 1} attempt {attempt + 1} failed: {str(e)}")
-                time.sleep(2 ** attempt)  # Exponential backoff
-                
-        if not success:
-            print(f"Warning: Batch {i // max_batch_size + 1} ultimately failed, using default values")
-            df.loc[batch.index, 'elevation'] = 0.0
-        
-        # Limit API calling speed
-        if i + max_batch_size < total_points:
-            time.sleep(1 / requests_per_second)
+    df['elevation'] = np.nan
+    remote_index = df.index
+    stats = {'points': total_points, 'local_dem': 0, 'cache_hits': 0, 'cache_misses': 0, 'remote_failed': 0,
+             'failed_batches': []}
+
+    if provider in ('auto', 'local'):
+        dem = get_local_dem(dem_dir or DEFAULT_DEM_DIR)
+        if dem is not None:
+            elevation = dem.lookup(df['latitude'].to_numpy(), df['longitude'].to_numpy())
+            df['elevation'] = elevation
+            remote_index = df.index[np.isnan(elevation)]
+            stats['local_dem'] = total_points - len(remote_index)
+            print(f"Local DEM: {stats['local_dem']}/{total_points} points")
+        elif provider == 'local':
+            raise ValueError(f"DEM directory not found: {dem_dir or DEFAULT_DEM_DIR}")
+        if provider == 'local' or len(remote_index) == 0:
+            df.attrs['elevation_stats'] = stats
+            return df
+
+    cache = get_default_elevation_cache() if elevation_cache is None else elevation_cache
+    if cache and len(remote_index):
+        cached = cache.get_many(df.loc[remote_index, 'latitude'].to_numpy(), df.loc[remote_index, 'longitude'].to_numpy())
+        hit = ~np.isnan(cached)
+        df.loc[remote_index[hit], 'elevation'] = cached[hit]
+        remote_index = remote_index[~hit]
+        stats['cache_hits'] = int(hit.sum())
+        print(f"Elevation cache: {stats['cache_hits']} hits, {len(remote_index)} misses")
+    stats['cache_misses'] = len(remote_index)
+
+    # Points that fall in the same grid cell are requested once
+    duplicate_index = representative_index = remote_index[:0]
+    if cache and len(remote_index):
+        lat_q, lon_q = cache.quantize(df.loc[remote_index, 'latitude'].to_numpy(),
+                                      df.loc[remote_index, 'longitude'].to_numpy())
+        _, first, inverse = np.unique(np.column_stack([lat_q, lon_q]), axis=0,
+                                      return_index=True, return_inverse=True)
+        representative = first[inverse.ravel()]
+        is_duplicate = representative != np.arange(len(remote_index))
+        duplicate_index = remote_index[is_duplicate]
+        representative_index = remote_index[representative[is_duplicate]]
+        remote_index = remote_index[np.sort(first)]
+
+    # Calling API: batches run concurrently, failed batches stay NaN and are reported
+    remote_points = len(remote_index)
+    if remote_points:
+        start = time.perf_counter()
+        elevation, failures = fetch_remote_elevation(
+            df.loc[remote_index, 'latitude'].to_numpy(), df.loc[remote_index, 'longitude'].to_numpy(),
+            batch_size=max_batch_size, max_concurrency=max_concurrency,
+            requests_per_second=requests_per_second, max_retries=max_retries)
+        df.loc[remote_index, 'elevation'] = elevation
+        fetched = ~np.isnan(elevation)
+        if cache and fetched.any():
+            cache.put_many(df.loc[remote_index[fetched], 'latitude'].to_numpy(),
+                           df.loc[remote_index[fetched], 'longitude'].to_numpy(), elevation[fetched])
+        print(f"Fetched elevation for {int(fetched.sum())}/{remote_points} points "
+              f"in {time.perf_counter() - start:.1f} s")
+        for failure in failures:
+            print(f"Warning: elevation batch {failure['start']}-{failure['stop']} failed: {failure['error']}")
+        stats['remote_failed'] = int((~fetched).sum())
+        stats['failed_batches'] = failures
     
+    df.loc[duplicate_index, 'elevation'] = df.loc[representative_index, 'elevation'].to_numpy()
+    stats['remote_requested'] = remote_points
+    df.attrs['elevation_stats'] = stats
     return df
 
 def analyze_elevation(df):
-    """Analyze and return elevation data"""
+    """Analyze and return elevation data (points without elevation are skipped)"""
     if 'elevation' not in df.columns:
         raise ValueError("DataFrame must include elevation row")
     
-    df = df.sort_values('timestamp').reset_index(drop=True)
+    df = df.sort_values('timestamp').dropna(subset=['elevation']).reset_index(drop=True)
+    if df.empty:
+        logging.warning("No elevation data available, elevation statistics set to 0")
+        return {'total_ascent': 0.0, 'total_descent': 0.0, 'max_elevation': 0.0, 'min_elevation': 0.0}
     df['elevation_diff'] = df['elevation'].diff().fillna(0)
     
     positive = df[df['elevation_diff'] > 0]['elevation_diff'].sum()
@@ -373,10 +418,73 @@ def calculate_angle(p1, p2, p3):
         # 返回一個預設角度，唔會觸發過濾
         return 180.0
 
-def filter_by_angle(df, angle_threshold=90):
+def _elementwise(func, *arrays):
+    """對數組逐個元素調用 math 函數，返回 float 數組"""
+    return np.fromiter(map(func, *arrays), dtype=float, count=len(arrays[0]))
+
+def calculate_turning_angles(lat, lon):
+    """
+    向量化版本嘅 calculate_angle：一次過計算所有連續三點嘅轉向角度
+    返回長度為 n-2 嘅數組，第 i 個值對應點 i, i+1, i+2（中間點係 i+1）
+    任何一點座標係 NaN 嘅三點組返回 NaN
+    """
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    if len(lat) < 3:
+        return np.empty(0)
+
+    # 三角函數用 math（同逐行版本同一個 libm），NumPy 嘅 SIMD 實現喺最後一位會有誤差，
+    # 令角度值同原本唔完全一致；其餘運算都係數組運算
+    sin_lat = _elementwise(math.sin, lat)
+    cos_lat = _elementwise(math.cos, lat)
+    dlon = lon[1:] - lon[:-1]
+
+    # 每段嘅方位角（heading），公式同 calculate_angle 一樣
+    y = _elementwise(math.sin, dlon) * cos_lat[1:]
+    x = cos_lat[:-1] * sin_lat[1:] - sin_lat[:-1] * cos_lat[1:] * _elementwise(math.cos, dlon)
+    bearings = _elementwise(math.atan2, y, x)
+
+    # 相鄰兩段方位角之差，標準化到 [-π, π]
+    angle_diff_rad = bearings[1:] - bearings[:-1]
+    angle_diff_rad = np.where(angle_diff_rad > math.pi, angle_diff_rad - 2.0 * math.pi, angle_diff_rad)
+    angle_diff_rad = np.where(angle_diff_rad < -math.pi, angle_diff_rad + 2.0 * math.pi, angle_diff_rad)
+
+    turning_angle_rad = np.abs(math.pi - np.abs(angle_diff_rad))
+    return np.degrees(turning_angle_rad)
+
+def _filter_by_angle_vectorized(df, angle_threshold):
+    """用 NumPy 數組一次過計算角度同標記 X/Y，結果同逐行版本一致"""
+    lat = pd.to_numeric(df['latitude'], errors='coerce').to_numpy(dtype=float)
+    lon = pd.to_numeric(df['longitude'], errors='coerce').to_numpy(dtype=float)
+
+    angles = calculate_turning_angles(lat, lon)
+
+    # 角度值存喺中間點（i+1）
+    angle_values = np.full(len(df), np.nan)
+    angle_values[1:-1] = angles
+
+    # 角度小於閾值嘅三點組，三個點都標記為 "X"（NaN 比較結果係 False，即係跳過）
+    unreliable_triples = angles < angle_threshold
+    unreliable = np.zeros(len(df), dtype=bool)
+    unreliable[:-2] |= unreliable_triples
+    unreliable[1:-1] |= unreliable_triples
+    unreliable[2:] |= unreliable_triples
+
+    df['angle_value'] = angle_values
+    df['angle_reliability'] = np.where(unreliable, 'X', 'Y').astype(object)
+
+    filtered_df = df[~unreliable].copy()
+
+    removed_count = len(df) - len(filtered_df)
+    print(f"已根據角度可靠性移除 {removed_count} 個點 ({removed_count/len(df)*100:.1f}%)")
+
+    return filtered_df, df
+
+def filter_by_angle(df, angle_threshold=90, vectorized=True):
     """
     基於三個連續點之間嘅角度過濾GPS數據
     加入更多調試信息，並確保正確處理角度值
+    vectorized=True 使用 NumPy 向量化實現；設為 False 使用原本逐行計算（會打印調試信息），方便核對結果
     """
     if len(df) < 3:
         df['angle_reliability'] = 'Y'
@@ -387,6 +495,14 @@ def filter_by_angle(df, angle_threshold=90):
     df['angle_reliability'] = 'Y'
     df['angle_value'] = float('nan')  # 使用 NaN 而唔係 None
     
+    if vectorized:
+        try:
+            return _filter_by_angle_vectorized(df, angle_threshold)
+        except Exception as e:
+            print(f"向量化角度過濾發生錯誤，改用逐行計算: {str(e)}")
+            df['angle_reliability'] = 'Y'
+            df['angle_value'] = float('nan')
+    
     try:
         # 計算每組三個連續點之間嘅角度
         for i in range(len(df) - 2):
@@ -430,57 +546,45 @@ def filter_by_angle(df, angle_threshold=90):
     
     return filtered_df, df
 
+def route_data_to_dataframe(input_data, point_interval_seconds=5):
+    """
+    將 Firestore 入面嘅原始路線（list 或者帶 route_data 嘅 dict）轉成 clean_gps_data 需要嘅 DataFrame
+    原始數據冇時間戳，所以每個點之間用 point_interval_seconds 秒嘅時間戳
+    """
+    if isinstance(input_data, dict):
+        input_data = input_data.get('route_data', [])
+
+    points = [item for item in input_data
+              if isinstance(item, dict) and 'latitude' in item and 'longitude' in item]
+
+    df = pd.DataFrame()
+    df['timestamp'] = pd.date_range(start=pd.Timestamp.now() - pd.Timedelta(seconds=point_interval_seconds * len(points)),
+                                    periods=len(points), freq=f'{point_interval_seconds}s')
+    df['latitude'] = [item['latitude'] for item in points]
+    df['longitude'] = [item['longitude'] for item in points]
+    return df
+
+def processed_route_document(cleaned_df, total_time, total_distance, elevation_stats):
+    """
+    Build the processed route document stored as <route>_filtered_version (without the server timestamp).
+    Coordinates are stored in the compact version 2 format (component.route_encoding).
+    """
+    document = encoded_coordinates_fields(cleaned_df['latitude'].to_numpy(), cleaned_df['longitude'].to_numpy())
+    document.update({
+        "total_distance_km": total_distance,
+        "total_time_seconds": total_time,
+        "total_elevation_gain": elevation_stats['total_ascent'],
+        "total_elevation_loss": elevation_stats['total_descent'],
+        "max_elevation": elevation_stats['max_elevation'],
+        "min_elevation": elevation_stats['min_elevation']
+    })
+    return document
+
 # Main function
 if __name__ == "__main__":
-    # First, process the GPS data
-    collection_name = "processed_routes"
-    raw_data = retrieve_data_from_firestore(collection_name)
+    # Batch cleaning of every unprocessed route, e.g.
+    #   python -m component.GPS_cleaning_nonML --batch --database real_database_01 --workers 4
+    import sys
+    from component.batch_clean import main
 
-    if not raw_data.empty:
-        # Clean the GPS data
-        cleaned_data, total_time, total_distance, angle_reliability_data = clean_gps_data(raw_data, "YOUR_API_KEY_HERE")
-        
-        # Add elevation data
-        cleaned_data = add_elevation_data(cleaned_data)
-        elevation_stats = analyze_elevation(cleaned_data)
-        
-        # Calculate emissions
-        # Example parameters (you should adjust these based on your vehicle)
-        fuel_efficiency = 3.0  # km/L (example for a heavy truck)
-        payload_weight = 10.0  # tonnes
-        max_payload = 25.0    # tonnes
-        co2_emission_factor = 2640  # g/L (diesel)
-        
-        emissions = calculate_co2_emissions(
-            distance=total_distance,
-            fuel_efficiency=fuel_efficiency,
-            total_elevation_gain=elevation_stats['total_ascent'],
-            total_elevation_loss=elevation_stats['total_descent'],
-            payload_weight=payload_weight,
-            max_payload=max_payload,
-            co2_emission_factor=co2_emission_factor,
-            total_time=total_time
-        )
-        
-        print(f"\nResults:")
-        print(f"Distance: {total_distance:.2f} km")
-        print(f"Time: {total_time/3600:.2f} hours")
-        print(f"Total Ascent: {elevation_stats['total_ascent']} m")
-        print(f"Total Descent: {elevation_stats['total_descent']} m")
-        print(f"CO2 Emissions: {emissions:.2f} kg")
-
-        # The processed data is uploaded to the collection specified by 'processed_collection' variable
-        db = init_firebase()
-        doc_ref = db.collection(collection_name).document(filtered_route_name)
-        doc_ref.set({
-            "coordinates": coordinates,
-            "timestamp": firestore.SERVER_TIMESTAMP,
-            "total_distance_km": total_distance,
-            "total_time_seconds": total_time,
-            "total_elevation_gain": elevation_stats['total_ascent'],
-            "total_elevation_loss": elevation_stats['total_descent'],
-            "max_elevation": elevation_stats['max_elevation'],
-            "min_elevation": elevation_stats['min_elevation']
-        })
-    else:
-        print("No Data")
+    sys.exit(main())
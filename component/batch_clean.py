@@ -0,0 +1,201 @@
+"""
+Batch cleaning of every route that has no <route>_filtered_version document yet.
+
+Usage:
+    python -m component.GPS_cleaning_nonML --batch --database real_database_01 --workers 4
+
+Raw routes are read in the parent process, cleaned in a process pool (each
+worker loads sklearn/pykalman/googlemaps once) and the processed documents
+are written back with a Firestore BulkWriter.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+from component.route_naming import FILTERED_SUFFIX
+from component.route_index import route_index_collection, route_index_fields
+from component.route_repository import DATABASE_COLLECTIONS, GET_ALL_CHUNK_SIZE, init_firebase
+
+
+def find_unprocessed_routes(db, database, limit=None):
+    """Yield (driver_id, route_name, route_data) for every route without a processed document"""
+    processed_collection = db.collection(DATABASE_COLLECTIONS[database]["processed"])
+    found = 0
+
+    for driver_doc in db.collection(database).stream():
+        routes = driver_doc.to_dict() or {}
+        route_names = list(routes.keys())
+
+        existing = set()
+        for i in range(0, len(route_names), GET_ALL_CHUNK_SIZE):
+            refs = [processed_collection.document(name + FILTERED_SUFFIX)
+                    for name in route_names[i:i + GET_ALL_CHUNK_SIZE]]
+            # Empty field mask: only existence is needed, not the coordinates
+            for snapshot in db.get_all(refs, field_paths=[]):
+                if snapshot.exists:
+                    existing.add(snapshot.id)
+
+        for route_name in route_names:
+            if route_name + FILTERED_SUFFIX in existing:
+                continue
+            yield driver_doc.id, route_name, routes[route_name]
+            found += 1
+            if limit and found >= limit:
+                return
+
+
+def _init_worker():
+    """Load the heavy modules once per worker process instead of once per route"""
+    logging.basicConfig(level=logging.WARNING)
+    import sklearn.ensemble  # noqa: F401
+    import pykalman  # noqa: F401
+    import googlemaps  # noqa: F401
+    import component.GPS_cleaning_nonML  # noqa: F401
+
+
+def clean_route_job(driver_id, route_name, route_data, google_api_key, outlier_method,
+                    map_matcher="google", road_graph_path=None, resample_gap_seconds=None):
+    """Worker: clean one route and return the processed document (no Firestore access here)"""
+    from component.GPS_cleaning_nonML import (clean_gps_data, add_elevation_data, analyze_elevation,
+                                              route_data_to_dataframe, processed_route_document)
+
+    result = {"driver_id": driver_id, "route_name": route_name}
+    start = time.perf_counter()
+    try:
+        df = route_data_to_dataframe(route_data)
+        cleaned_df, total_time, total_distance, _, profiler = clean_gps_data(
+            df, google_api_key, profile=True, route_name=route_name, outlier_method=outlier_method,
+            map_matcher=map_matcher, road_graph_path=road_graph_path, resample_gap_seconds=resample_gap_seconds)
+
+        if cleaned_df.empty:
+            result["status"] = "empty"
+        else:
+            cleaned_df = add_elevation_data(cleaned_df)
+            elevation_stats = analyze_elevation(cleaned_df)
+            result["status"] = "ok"
+            result["document"] = processed_route_document(cleaned_df, total_time, total_distance, elevation_stats)
+        result["profile"] = profiler.to_dict()
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+
+    result["elapsed_s"] = round(time.perf_counter() - start, 2)
+    return result
+
+
+def run_batch(database, workers=None, limit=None, google_api_key=None, outlier_method="isolation_forest",
+              profile_path=None, dry_run=False, map_matcher="google", road_graph_path=None,
+              resample_gap_seconds=None):
+    """Clean every unprocessed route of `database` in parallel; returns a summary dict"""
+    from firebase_admin import firestore
+
+    db = init_firebase()
+    processed_collection = db.collection(DATABASE_COLLECTIONS[database]["processed"])
+    summary = {"submitted": 0, "ok": 0, "empty": 0, "error": 0}
+    start = time.perf_counter()
+
+    jobs = find_unprocessed_routes(db, database, limit=limit)
+    if dry_run:
+        for driver_id, route_name, _ in jobs:
+            print(f"{driver_id}\t{route_name}")
+            summary["submitted"] += 1
+        return summary
+
+    bulk_writer = db.bulk_writer()
+
+    def handle_result(result):
+        summary[result["status"]] += 1
+
+        if result["status"] == "ok":
+            document = result["document"]
+            document["timestamp"] = firestore.SERVER_TIMESTAMP
+            bulk_writer.set(processed_collection.document(result["route_name"] + FILTERED_SUFFIX), document)
+            bulk_writer.set(route_index_collection(db, database, result["driver_id"]).document(result["route_name"]),
+                            route_index_fields(result["route_name"], has_processed=True), merge=True)
+
+        if profile_path and "profile" in result:
+            with open(profile_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(result["profile"], ensure_ascii=False, default=str) + "\n")
+
+        print(f"[{summary['ok'] + summary['empty'] + summary['error']}/{summary['submitted']}] "
+              f"{result['route_name']}: {result['status']} ({result['elapsed_s']} s)"
+              + (f" - {result['error']}" if result["status"] == "error" else ""))
+
+    # Keep only a few routes per worker in flight so raw GPS data is not all held in memory
+    max_pending = (workers or os.cpu_count() or 1) * 2
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        pending = set()
+        for driver_id, route_name, route_data in jobs:
+            pending.add(executor.submit(clean_route_job, driver_id, route_name, route_data,
+                                        google_api_key, outlier_method, map_matcher, road_graph_path,
+                                        resample_gap_seconds))
+            summary["submitted"] += 1
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    handle_result(future.result())
+
+        for future in as_completed(pending):
+            handle_result(future.result())
+
+    # Flush the remaining queued writes
+    bulk_writer.close()
+    summary["elapsed_s"] = round(time.perf_counter() - start, 1)
+    return summary
+
+
+def _default_api_key():
+    api_key = os.environ.get("GOOGLE_MAPS_API_KEY")
+    if api_key:
+        return api_key
+    try:
+        import streamlit as st
+        return st.secrets["google"]["maps_api_key"]
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clean GPS routes that have no processed version yet")
+    parser.add_argument("--batch", action="store_true", help="clean every unprocessed route of the database")
+    parser.add_argument("--database", default="real_database_01", choices=list(DATABASE_COLLECTIONS))
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many routes")
+    parser.add_argument("--api-key", default=None, help="Google Maps API key (default: $GOOGLE_MAPS_API_KEY or Streamlit secrets)")
+    parser.add_argument("--outlier-method", default="isolation_forest")
+    parser.add_argument("--map-matcher", default="google", choices=["google", "osm"],
+                        help="Layer 3 backend: Google Roads API or offline matching on a local road graph")
+    parser.add_argument("--road-graph", default=None, help="GraphML road graph for --map-matcher osm")
+    parser.add_argument("--resample-gap", type=float, default=300,
+                        help="split trips at time gaps longer than this many seconds before resampling (0 = off)")
+    parser.add_argument("--profile-json", default=None, help="append per-route pipeline profiles to this JSON lines file")
+    parser.add_argument("--dry-run", action="store_true", help="only list the routes that would be cleaned")
+    args = parser.parse_args(argv)
+
+    if not args.batch:
+        parser.print_help()
+        return 1
+
+    logging.basicConfig(level=logging.WARNING)
+    summary = run_batch(
+        args.database,
+        workers=args.workers,
+        limit=args.limit,
+        google_api_key=args.api_key or _default_api_key(),
+        outlier_method=args.outlier_method,
+        profile_path=args.profile_json,
+        dry_run=args.dry_run,
+        map_matcher=args.map_matcher,
+        road_graph_path=args.road_graph,
+        resample_gap_seconds=args.resample_gap or None,
+    )
+    print(json.dumps(summary))
+    return 0 if summary.get("error", 0) == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
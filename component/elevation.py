@@ -0,0 +1,396 @@
+"""
+Local elevation lookup from DEM tiles, used by add_elevation_data before falling back to the
+Open-Elevation API.
+
+Put SRTM tiles (N22E114.hgt, 1 or 3 arc-second) and/or uncompressed single-band GeoTIFFs in
+DEM_DIR (default ./dem). Tiles are opened with numpy.memmap, so only the pages around the route
+are read from disk.
+
+Remote lookups are cached on disk in ElevationCache, keyed by a ~10 m coordinate grid, and
+fetched concurrently by fetch_remote_elevation.
+"""
+import os
+import re
+import glob
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from component.rate_limit import TokenBucket
+
+DEFAULT_DEM_DIR = os.environ.get("DEM_DIR", "dem")
+DEFAULT_ELEVATION_CACHE_PATH = os.environ.get("ELEVATION_CACHE_PATH", os.path.join("cache", "elevation.sqlite"))
+METRES_PER_DEGREE = 111320.0
+OPEN_ELEVATION_URL = "https://api.open-elevation.com/api/v1/lookup"
+
+HGT_NAME = re.compile(r"^([NS])(\d{2})([EW])(\d{3})\.hgt$", re.IGNORECASE)
+HGT_VOID = -32768
+
+# TIFF tags used to map an uncompressed GeoTIFF into memory
+TIFF_BITS_PER_SAMPLE = 258
+TIFF_COMPRESSION = 259
+TIFF_STRIP_OFFSETS = 273
+TIFF_SAMPLES_PER_PIXEL = 277
+TIFF_STRIP_BYTE_COUNTS = 279
+TIFF_PLANAR_CONFIG = 284
+TIFF_TILE_WIDTH = 322
+TIFF_SAMPLE_FORMAT = 339
+GDAL_NODATA = 42113
+GEOTIFF_PIXEL_SCALE = 33550
+GEOTIFF_TIEPOINT = 33922
+GEOTIFF_KEY_DIRECTORY = 34735
+GT_RASTER_TYPE_KEY = 1025
+RASTER_PIXEL_IS_POINT = 2
+
+
+class DemRaster:
+    """
+    One memory-mapped elevation grid in geographic coordinates.
+
+    `west`/`north` are the coordinates of grid node (0, 0) and `lon_step`/`lat_step`
+    the spacing in degrees, so node (row, col) sits at
+    (north - row * lat_step, west + col * lon_step).
+    """
+
+    def __init__(self, path, data, west, north, lon_step, lat_step, nodata=None):
+        self.path = path
+        self.data = data
+        self.west = west
+        self.north = north
+        self.lon_step = lon_step
+        self.lat_step = lat_step
+        self.nodata = nodata
+        rows, cols = data.shape
+        self.east = west + (cols - 1) * lon_step
+        self.south = north - (rows - 1) * lat_step
+
+    def contains(self, lat, lon):
+        return (lat >= self.south) & (lat <= self.north) & (lon >= self.west) & (lon <= self.east)
+
+    def sample(self, lat, lon):
+        """Bilinear interpolation at the given points (all inside the raster); NaN near voids"""
+        rows, cols = self.data.shape
+        row = (self.north - lat) / self.lat_step
+        col = (lon - self.west) / self.lon_step
+        row0 = np.clip(np.floor(row).astype(int), 0, rows - 2)
+        col0 = np.clip(np.floor(col).astype(int), 0, cols - 2)
+        fy = np.clip(row - row0, 0, 1)
+        fx = np.clip(col - col0, 0, 1)
+
+        corners = np.stack([self.data[row0, col0], self.data[row0, col0 + 1],
+                            self.data[row0 + 1, col0], self.data[row0 + 1, col0 + 1]]).astype(float)
+        if self.nodata is not None:
+            corners[corners == self.nodata] = np.nan
+        weights = np.stack([(1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy])
+        # Corners with zero weight (points on a grid line) must not spread a void's NaN
+        corners[weights == 0] = 0.0
+        return (corners * weights).sum(axis=0)
+
+
+def open_hgt(path):
+    """SRTM .hgt tile: big-endian int16 square grid, node (0, 0) at the north-west corner"""
+    match = HGT_NAME.match(os.path.basename(path))
+    if not match:
+        raise ValueError(f"Not an SRTM tile name: {path}")
+    lat = int(match.group(2)) * (1 if match.group(1).upper() == "N" else -1)
+    lon = int(match.group(4)) * (1 if match.group(3).upper() == "E" else -1)
+    size = int(round(np.sqrt(os.path.getsize(path) / 2)))
+    if size * size * 2 != os.path.getsize(path):
+        raise ValueError(f"Unexpected SRTM tile size: {path}")
+    data = np.memmap(path, dtype=">i2", mode="r", shape=(size, size))
+    step = 1.0 / (size - 1)
+    return DemRaster(path, data, lon, lat + 1, step, step, nodata=HGT_VOID)
+
+
+def open_geotiff(path):
+    """
+    Uncompressed, single-band, strip-organised GeoTIFF in EPSG:4326. The TIFF header
+    is read with Pillow (pixels are not decoded) and the pixel block is memory-mapped.
+    """
+    from PIL import Image
+
+    with Image.open(path) as image:
+        tags = image.tag_v2
+        width, height = image.size
+        if tags.get(TIFF_COMPRESSION, 1) != 1 or TIFF_TILE_WIDTH in tags:
+            raise ValueError(f"GeoTIFF must be uncompressed and stored in strips: {path}")
+        if tags.get(TIFF_SAMPLES_PER_PIXEL, 1) != 1 or tags.get(TIFF_PLANAR_CONFIG, 1) != 1:
+            raise ValueError(f"GeoTIFF must have a single band: {path}")
+        offsets = tags[TIFF_STRIP_OFFSETS]
+        counts = tags[TIFF_STRIP_BYTE_COUNTS]
+        offsets = offsets if isinstance(offsets, tuple) else (offsets,)
+        counts = counts if isinstance(counts, tuple) else (counts,)
+        if any(offsets[i] + counts[i] != offsets[i + 1] for i in range(len(offsets) - 1)):
+            raise ValueError(f"GeoTIFF strips are not contiguous: {path}")
+
+        bits = tags.get(TIFF_BITS_PER_SAMPLE, 16)
+        bits = bits[0] if isinstance(bits, tuple) else bits
+        sample_format = tags.get(TIFF_SAMPLE_FORMAT, 1)
+        sample_format = sample_format[0] if isinstance(sample_format, tuple) else sample_format
+        kind = {1: "u", 2: "i", 3: "f"}[sample_format]
+        byte_order = "<" if _tiff_is_little_endian(path) else ">"
+        dtype = np.dtype(f"{byte_order}{kind}{bits // 8}")
+
+        scale_x, scale_y = tags[GEOTIFF_PIXEL_SCALE][:2]
+        tie_col, tie_row, _, tie_x, tie_y = tags[GEOTIFF_TIEPOINT][:5]
+        keys = tags.get(GEOTIFF_KEY_DIRECTORY, ())
+        raster_type = dict((keys[i], keys[i + 3]) for i in range(4, len(keys), 4)).get(GT_RASTER_TYPE_KEY, 1)
+        nodata = tags.get(GDAL_NODATA)
+
+    # Grid nodes are pixel centres unless the file says PixelIsPoint
+    shift = 0.0 if raster_type == RASTER_PIXEL_IS_POINT else 0.5
+    west = tie_x + (shift - tie_col) * scale_x
+    north = tie_y - (shift - tie_row) * scale_y
+    data = np.memmap(path, dtype=dtype, mode="r", offset=offsets[0], shape=(height, width))
+    nodata = float(str(nodata).strip("\x00 ")) if nodata not in (None, "") else None
+    return DemRaster(path, data, west, north, scale_x, scale_y, nodata=nodata)
+
+
+def _tiff_is_little_endian(path):
+    with open(path, "rb") as file:
+        return file.read(2) == b"II"
+
+
+class LocalDem:
+    """All DEM tiles of a directory; .hgt tiles are indexed by their 1x1 degree cell"""
+
+    def __init__(self, directory=DEFAULT_DEM_DIR):
+        self.directory = directory
+        self.hgt_tiles = {}
+        self.rasters = []
+        for path in glob.glob(os.path.join(directory, "**", "*"), recursive=True):
+            name = os.path.basename(path).lower()
+            try:
+                if name.endswith(".hgt"):
+                    tile = open_hgt(path)
+                    self.hgt_tiles[(int(round(tile.south)), int(round(tile.west)))] = tile
+                elif name.endswith((".tif", ".tiff")):
+                    self.rasters.append(open_geotiff(path))
+            except (ValueError, KeyError, OSError) as e:
+                logging.warning(f"Skipping DEM file {path}: {e}")
+        logging.info(f"Loaded {len(self.hgt_tiles)} SRTM tiles and {len(self.rasters)} GeoTIFFs from {directory}")
+
+    def lookup(self, lat, lon):
+        """Elevation in metres for every point; NaN where no tile covers the point"""
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        elevation = np.full(lat.shape, np.nan)
+
+        if self.hgt_tiles:
+            cells = np.column_stack([np.floor(lat), np.floor(lon)]).astype(int)
+            unique_cells, inverse = np.unique(cells, axis=0, return_inverse=True)
+            for i, (cell_lat, cell_lon) in enumerate(unique_cells):
+                tile = self.hgt_tiles.get((cell_lat, cell_lon))
+                if tile is not None:
+                    in_cell = inverse.ravel() == i
+                    elevation[in_cell] = tile.sample(lat[in_cell], lon[in_cell])
+
+        for raster in self.rasters:
+            missing = np.isnan(elevation) & raster.contains(lat, lon)
+            if missing.any():
+                elevation[missing] = raster.sample(lat[missing], lon[missing])
+        return elevation
+
+
+@lru_cache(maxsize=4)
+def get_local_dem(directory=DEFAULT_DEM_DIR):
+    """Open the tiles of a DEM directory once per process; None when the directory does not exist"""
+    if not os.path.isdir(directory):
+        return None
+    return LocalDem(directory)
+
+
+class ElevationCache:
+    """
+    On-disk cache of remote elevation lookups.
+
+    Points are quantized to a grid of `grid_m` metres (in latitude; the longitude
+    step is the same number of degrees), so every later point in the same cell
+    reuses the stored elevation. Entries are evicted least-recently-used above
+    max_entries. Hit/miss counters are kept per instance.
+    """
+
+    def __init__(self, path=DEFAULT_ELEVATION_CACHE_PATH, grid_m=10.0, max_entries=2000000):
+        self.path = path
+        self.grid_m = grid_m
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # The grid size is part of the key so caches built with another grid are not mixed up
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS elevation_cache ("
+            " grid REAL NOT NULL, lat_q INTEGER NOT NULL, lon_q INTEGER NOT NULL,"
+            " elevation REAL NOT NULL, last_access REAL NOT NULL,"
+            " PRIMARY KEY (grid, lat_q, lon_q)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS elevation_cache_last_access ON elevation_cache (last_access)")
+        self._conn.commit()
+
+    def quantize(self, lat, lon):
+        step = self.grid_m / METRES_PER_DEGREE
+        return (np.round(np.asarray(lat, dtype=float) / step).astype(np.int64),
+                np.round(np.asarray(lon, dtype=float) / step).astype(np.int64))
+
+    def get_many(self, lat, lon, chunk_size=400):
+        """Cached elevation for every point, NaN for misses"""
+        lat_q, lon_q = self.quantize(lat, lon)
+        cells, inverse = np.unique(np.column_stack([lat_q, lon_q]), axis=0, return_inverse=True)
+        found = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(cells), chunk_size):
+                chunk = cells[i:i + chunk_size].tolist()
+                values = ", ".join(["(?, ?)"] * len(chunk))
+                params = [self.grid_m] + [v for cell in chunk for v in cell]
+                rows = self._conn.execute(
+                    f"SELECT lat_q, lon_q, elevation FROM elevation_cache "
+                    f"WHERE grid = ? AND (lat_q, lon_q) IN (VALUES {values})", params).fetchall()
+                found.update(((lat_cell, lon_cell), elevation) for lat_cell, lon_cell, elevation in rows)
+            if found:
+                self._conn.executemany(
+                    "UPDATE elevation_cache SET last_access = ? WHERE grid = ? AND lat_q = ? AND lon_q = ?",
+                    [(now, self.grid_m, lat_cell, lon_cell) for lat_cell, lon_cell in found])
+                self._conn.commit()
+
+        cell_elevation = np.array([found.get((a, b), np.nan) for a, b in cells.tolist()], dtype=float)
+        elevation = cell_elevation[inverse.ravel()]
+        hits = int((~np.isnan(elevation)).sum())
+        self.hits += hits
+        self.misses += len(elevation) - hits
+        return elevation
+
+    def put_many(self, lat, lon, elevation):
+        """Store elevations; NaN values (failed lookups) are skipped"""
+        elevation = np.asarray(elevation, dtype=float)
+        valid = ~np.isnan(elevation)
+        lat_q, lon_q = self.quantize(np.asarray(lat)[valid], np.asarray(lon)[valid])
+        now = time.time()
+        rows = [(self.grid_m, a, b, e, now) for a, b, e in zip(lat_q.tolist(), lon_q.tolist(), elevation[valid].tolist())]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO elevation_cache (grid, lat_q, lon_q, elevation, last_access) "
+                "VALUES (?, ?, ?, ?, ?)", rows)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        entries = self._conn.execute("SELECT COUNT(*) FROM elevation_cache").fetchone()[0]
+        if entries > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM elevation_cache WHERE (grid, lat_q, lon_q) IN "
+                "(SELECT grid, lat_q, lon_q FROM elevation_cache ORDER BY last_access LIMIT ?)",
+                (entries - self.max_entries,))
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM elevation_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "grid_m": self.grid_m,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM elevation_cache")
+            self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        self._conn.close()
+
+
+_default_cache = None
+
+
+def get_default_elevation_cache():
+    """Process-wide cache shared by the dashboard and batch workers"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ElevationCache()
+    return _default_cache
+
+
+async def _fetch_batch(session_post, url, lat, lon, start, stop, elevation, semaphore, limiter,
+                       max_retries, timeout):
+    """Fetch one batch into elevation[start:stop]; returns None or a failure record"""
+    import requests
+
+    locations = [{"latitude": a, "longitude": b} for a, b in zip(lat[start:stop].tolist(), lon[start:stop].tolist())]
+    error = None
+    for attempt in range(max_retries):
+        if attempt:
+            # Back off outside the semaphore so other batches can use the slot meanwhile
+            await asyncio.sleep(2 ** (attempt - 1))  # Exponential backoff
+        async with semaphore:
+            await limiter.acquire_async()
+            try:
+                # requests is blocking, so each call runs in a worker thread
+                response = await asyncio.get_running_loop().run_in_executor(
+                    None, partial(session_post, url, json={"locations": locations}, timeout=timeout))
+                response.raise_for_status()
+                results = response.json()["results"]
+                if len(results) != stop - start:
+                    raise ValueError(f"expected {stop - start} results, got {len(results)}")
+                elevation[start:stop] = [r["elevation"] for r in results]
+                return None
+            except (requests.RequestException, ValueError, KeyError) as e:
+                error = str(e)
+                logging.warning(f"Elevation batch {start}-{stop} attempt {attempt + 1} failed: {error}")
+    return {"start": start, "stop": stop, "points": stop - start, "error": error}
+
+
+async def _fetch_all(lat, lon, url, batch_size, max_concurrency, requests_per_second, max_retries, timeout):
+    import requests
+
+    elevation = np.full(len(lat), np.nan)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limiter = TokenBucket(requests_per_second)
+    # One thread per concurrent request; the default executor may be smaller than max_concurrency
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=max_concurrency))
+    with requests.Session() as session:
+        tasks = [_fetch_batch(session.post, url, lat, lon, start, min(start + batch_size, len(lat)),
+                              elevation, semaphore, limiter, max_retries, timeout)
+                 for start in range(0, len(lat), batch_size)]
+        failures = [failure for failure in await asyncio.gather(*tasks) if failure]
+    return elevation, failures
+
+
+def fetch_remote_elevation(lat, lon, url=OPEN_ELEVATION_URL, batch_size=50, max_concurrency=8,
+                           requests_per_second=15, max_retries=3, timeout=10):
+    """
+    Fetch elevations from the Open-Elevation API with many batches in flight.
+
+    Payloads are built straight from the lat/lon arrays, batches run concurrently
+    under a semaphore and a shared rate limiter, and results are written into one
+    preallocated array. Returns (elevation, failures): points of failed batches
+    are NaN and every failed batch is listed with its index range and last error.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    if len(lat) == 0:
+        return np.empty(0), []
+    coroutine = _fetch_all(lat, lon, url, batch_size, max_concurrency, requests_per_second, max_retries, timeout)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    # Already inside an event loop (e.g. a notebook): run ours in a separate thread
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
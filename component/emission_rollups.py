@@ -0,0 +1,298 @@
+"""
+Materialized daily and monthly emission rollups.
+
+For every estimated-result collection there is a rollup collection
+<estimated collection>_rollups with
+
+    day_YYYY-MM-DD   totals of the routes of that day, a per-driver breakdown and a
+                     per-route map {route_name: {co2_emissions_kg, total_distance_km, driver_id}}
+    month_YYYY-MM    the same totals and per-driver breakdown (no route map, so the
+                     document stays small)
+    _meta            when the rollups were last rebuilt
+
+An estimated result is written in the same transaction that updates its day and
+month documents, so the rollups always agree with the stored results. The day
+document's route map holds the route's previous contribution, so rewriting a
+result replaces it instead of adding it twice.
+
+period_totals() sums a period from whole-month documents plus the day documents of
+the partial months; period_routes() reads the per-route entries of every day for
+reports that list routes. Both are O(days) small reads instead of O(routes).
+
+Rebuild (e.g. after the estimated_results backfill, or to repair drift):
+
+    python -m component.emission_rollups --database real_database_01 [--start 2025-01-01 --end 2025-12-31]
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+import datetime
+
+from component.route_naming import base_route_name, route_date
+
+ROLLUP_SUFFIX = "_rollups"
+META_DOCUMENT = "_meta"
+UNKNOWN_DRIVER = "_unknown"
+GET_ALL_CHUNK_SIZE = 100
+BATCH_SIZE = 450
+
+
+def rollup_collection_name(estimated_collection):
+    return estimated_collection + ROLLUP_SUFFIX
+
+
+def day_id(date):
+    return f"day_{date.isoformat()}"
+
+
+def month_id(date):
+    return f"month_{date:%Y-%m}"
+
+
+def route_contribution(document, driver_id=None):
+    """Rollup entry of one estimated result, None if its numbers are not usable"""
+    emission = document.get("co2_emissions_kg", 0)
+    distance = document.get("total_distance_km", 0)
+    if not (isinstance(emission, (int, float)) and isinstance(distance, (int, float))):
+        return None
+    return {"co2_emissions_kg": float(emission), "total_distance_km": float(distance),
+            "driver_id": driver_id or document.get("driver_id") or UNKNOWN_DRIVER}
+
+
+def _empty_totals():
+    return {"co2_emissions_kg": 0.0, "total_distance_km": 0.0, "route_count": 0, "drivers": {}}
+
+
+def _add(totals, entry, sign=1):
+    """Add (sign=1) or remove (sign=-1) one route entry from totals with a per-driver breakdown"""
+    driver = totals["drivers"].setdefault(entry["driver_id"], {"co2_emissions_kg": 0.0, "total_distance_km": 0.0,
+                                                               "route_count": 0})
+    for target in (totals, driver):
+        target["co2_emissions_kg"] += sign * entry["co2_emissions_kg"]
+        target["total_distance_km"] += sign * entry["total_distance_km"]
+        target["route_count"] += sign
+    if driver["route_count"] <= 0:
+        del totals["drivers"][entry["driver_id"]]
+
+
+def _day_document(date, routes):
+    totals = _empty_totals()
+    for entry in routes.values():
+        _add(totals, entry)
+    return {"period": "day", "period_start": date.isoformat(), **totals, "routes": routes}
+
+
+def _month_document(date, totals):
+    return {"period": "month", "period_start": date.replace(day=1).isoformat(), **totals}
+
+
+def update_rollups(db, estimated_collection, route_name, document, driver_id=None, result_ref=None):
+    """
+    Put one route's estimated result (None removes it) into its day and month rollups in a
+    single transaction. With result_ref the result document itself is written (or deleted)
+    in the same transaction. Returns False for route names without a date, which only get
+    the result write.
+    """
+    from firebase_admin import firestore
+
+    route_name = base_route_name(route_name)
+    date = route_date(route_name)
+    if date is None:
+        if result_ref is not None:
+            result_ref.set(document) if document is not None else result_ref.delete()
+        return False
+    entry = route_contribution(document, driver_id) if document is not None else None
+    rollups = db.collection(rollup_collection_name(estimated_collection))
+    day_ref, month_ref = rollups.document(day_id(date)), rollups.document(month_id(date))
+
+    @firestore.transactional
+    def apply(transaction):
+        # All reads before any write
+        day = day_ref.get(transaction=transaction)
+        month = month_ref.get(transaction=transaction)
+        routes = dict((day.to_dict() or {}).get("routes", {})) if day.exists else {}
+        month_totals = _empty_totals()
+        if month.exists:
+            month_data = month.to_dict()
+            month_totals.update({key: month_data[key] for key in month_totals if key in month_data})
+            month_totals["drivers"] = {driver: dict(values) for driver, values in month_totals["drivers"].items()}
+
+        previous = routes.pop(route_name, None)
+        if previous is not None:
+            _add(month_totals, previous, -1)
+        if entry is not None:
+            routes[route_name] = entry
+            _add(month_totals, entry)
+
+        if result_ref is not None:
+            if document is not None:
+                transaction.set(result_ref, document)
+            else:
+                transaction.delete(result_ref)
+        transaction.set(day_ref, {**_day_document(date, routes), "updated_at": firestore.SERVER_TIMESTAMP})
+        transaction.set(month_ref, {**_month_document(date, month_totals), "updated_at": firestore.SERVER_TIMESTAMP})
+
+    apply(db.transaction())
+    return True
+
+
+def _date_range(start_date, end_date):
+    return [start_date + datetime.timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+
+
+def _period_document_ids(start_date, end_date):
+    """Month documents for the months fully inside [start_date, end_date], day documents for the rest"""
+    ids = []
+    day = start_date
+    while day <= end_date:
+        next_month = (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+        month_end = next_month - datetime.timedelta(days=1)
+        if day.day == 1 and month_end <= end_date:
+            ids.append(month_id(day))
+        else:
+            ids.extend(day_id(date) for date in _date_range(day, min(month_end, end_date)))
+        day = next_month
+    return ids
+
+
+def rollups_built(db, estimated_collection):
+    """True once the rollups of the collection have been rebuilt at least once"""
+    return db.collection(rollup_collection_name(estimated_collection)).document(META_DOCUMENT).get().exists
+
+
+def period_totals(db, estimated_collection, start_date, end_date):
+    """
+    Totals of [start_date, end_date] (datetime.date, inclusive) from the rollups:
+    co2_emissions_kg, total_distance_km, route_count, drivers and documents_read.
+    """
+    rollups = db.collection(rollup_collection_name(estimated_collection))
+    doc_ids = _period_document_ids(start_date, end_date)
+    totals = _empty_totals()
+    for i in range(0, len(doc_ids), GET_ALL_CHUNK_SIZE):
+        refs = [rollups.document(doc_id) for doc_id in doc_ids[i:i + GET_ALL_CHUNK_SIZE]]
+        for snapshot in db.get_all(refs, field_paths=["co2_emissions_kg", "total_distance_km", "route_count",
+                                                      "drivers"]):
+            if not snapshot.exists:
+                continue
+            data = snapshot.to_dict()
+            for key in ("co2_emissions_kg", "total_distance_km", "route_count"):
+                totals[key] += data.get(key, 0)
+            for driver_id, values in data.get("drivers", {}).items():
+                driver = totals["drivers"].setdefault(driver_id, {"co2_emissions_kg": 0.0, "total_distance_km": 0.0,
+                                                                  "route_count": 0})
+                for key in driver:
+                    driver[key] += values.get(key, 0)
+    totals["documents_read"] = len(doc_ids)
+    return totals
+
+
+def period_routes(db, estimated_collection, start_date, end_date):
+    """
+    Per-route entries of [start_date, end_date] from the day rollups:
+    ({route_name: {co2_emissions_kg, total_distance_km, driver_id, route_date}}, documents read)
+    """
+    rollups = db.collection(rollup_collection_name(estimated_collection))
+    doc_ids = [day_id(date) for date in _date_range(start_date, end_date)]
+    routes = {}
+    for i in range(0, len(doc_ids), GET_ALL_CHUNK_SIZE):
+        refs = [rollups.document(doc_id) for doc_id in doc_ids[i:i + GET_ALL_CHUNK_SIZE]]
+        for snapshot in db.get_all(refs, field_paths=["period_start", "routes"]):
+            if not snapshot.exists:
+                continue
+            data = snapshot.to_dict()
+            for route_name, entry in data.get("routes", {}).items():
+                routes[route_name] = {**entry, "route_date": data.get("period_start")}
+    return routes, len(doc_ids)
+
+
+def rebuild_rollups(db, estimated_collection, start_date=None, end_date=None):
+    """
+    Recompute the rollups from the estimated results, for every date or only for whole
+    months touching [start_date, end_date]. Rollup documents that no longer have routes are deleted.
+    """
+    from firebase_admin import firestore
+    from component.estimated_results import query_estimated_results
+
+    start = time.perf_counter()
+    fields = ["co2_emissions_kg", "total_distance_km", "driver_id", "route_date"]
+    if start_date is not None or end_date is not None:
+        # Months are rebuilt as a whole, so widen the range to month boundaries
+        start_date = (start_date or datetime.date(1970, 1, 1)).replace(day=1)
+        end_date = ((end_date or datetime.date.today()).replace(day=28) + datetime.timedelta(days=4)).replace(day=1) \
+            - datetime.timedelta(days=1)
+        snapshots = query_estimated_results(db, estimated_collection, start_date, end_date, field_paths=fields)
+    else:
+        snapshots = db.collection(estimated_collection).select(fields).stream()
+
+    days = {}
+    months = {}
+    summary = {"collection": estimated_collection, "routes": 0, "skipped": 0}
+    for snapshot in snapshots:
+        data = snapshot.to_dict()
+        route_name = base_route_name(snapshot.id)
+        date = datetime.date.fromisoformat(data["route_date"]) if data.get("route_date") else route_date(route_name)
+        entry = route_contribution(data)
+        if date is None or entry is None:
+            summary["skipped"] += 1
+            continue
+        days.setdefault(date, {})[route_name] = entry
+        _add(months.setdefault(date.replace(day=1), _empty_totals()), entry)
+        summary["routes"] += 1
+
+    rollups = db.collection(rollup_collection_name(estimated_collection))
+    stale = []
+    for ref in rollups.list_documents():
+        if ref.id == META_DOCUMENT:
+            continue
+        kind, _, period = ref.id.partition("_")
+        period_date = datetime.date.fromisoformat(period if kind == "day" else period + "-01")
+        if start_date is not None and not (start_date <= period_date <= end_date):
+            continue
+        if (kind == "day" and period_date not in days) or (kind == "month" and period_date not in months):
+            stale.append(ref)
+
+    writes = [(rollups.document(day_id(date)), _day_document(date, routes)) for date, routes in days.items()]
+    writes += [(rollups.document(month_id(date)), _month_document(date, totals)) for date, totals in months.items()]
+    operations = [(ref, None) for ref in stale]
+    operations += [(ref, {**document, "updated_at": firestore.SERVER_TIMESTAMP}) for ref, document in writes]
+    batch = db.batch()
+    pending = 0
+    for ref, document in operations:
+        if document is None:
+            batch.delete(ref)
+        else:
+            batch.set(ref, document)
+        pending += 1
+        # Firestore batches take at most 500 writes
+        if pending >= BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    batch.set(rollups.document(META_DOCUMENT), {"rebuilt_at": firestore.SERVER_TIMESTAMP}, merge=True)
+    batch.commit()
+
+    summary.update({"days": len(days), "months": len(months), "deleted": len(stale),
+                    "elapsed_s": round(time.perf_counter() - start, 2)})
+    return summary
+
+
+def main(argv=None):
+    from component.route_repository import DATABASE_COLLECTIONS, init_firebase
+
+    parser = argparse.ArgumentParser(description="Rebuild the daily and monthly emission rollups")
+    parser.add_argument("--database", default="real_database_01", choices=list(DATABASE_COLLECTIONS))
+    parser.add_argument("--start", type=datetime.date.fromisoformat, default=None, help="YYYY-MM-DD")
+    parser.add_argument("--end", type=datetime.date.fromisoformat, default=None, help="YYYY-MM-DD")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    summary = rebuild_rollups(init_firebase(), DATABASE_COLLECTIONS[args.database]["estimated"],
+                              args.start, args.end)
+    print(json.dumps(summary))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
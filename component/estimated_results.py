@@ -0,0 +1,187 @@
+"""
+Date-indexed estimated results.
+
+<route>_estimated_result_version documents carry the route date ("YYYY-MM-DD",
+parsed from the route name) and the driver id, so period reports run a range
+query on route_date instead of streaming the whole collection and parsing every
+document id. A range on one field is served by Firestore's automatic single-field
+index, so no composite index has to be deployed.
+
+period_summary() answers a reporting period in one pass (totals, route ids and a
+per-route table) and shares the result for a few minutes, so the analysis and
+the PDF of the same period read Firestore once.
+
+Documents written before these fields existed are migrated with:
+
+    python -m component.estimated_results --database real_database_01 [--dry-run]
+"""
+import sys
+import copy
+import json
+import time
+import logging
+import argparse
+import threading
+
+from component.route_naming import base_route_name, route_date
+from component.emission_rollups import route_contribution, rollups_built, period_routes
+
+BATCH_SIZE = 450
+PERIOD_SUMMARY_TTL_SECONDS = 300
+
+# (collection, id(client), start_date, end_date) -> (computed at, summary)
+_period_summary_cache = {}
+_period_summary_lock = threading.Lock()
+
+
+def estimated_result_fields(route_name, driver_id=None):
+    """route_date/driver_id fields stored on the estimated result of a route"""
+    date = route_date(base_route_name(route_name))
+    return {"route_date": date.isoformat() if date else None, "driver_id": driver_id}
+
+
+def query_estimated_results(db, collection, start_date, end_date, field_paths=None):
+    """Stream the estimated results with start_date <= route_date <= end_date (datetime.date, inclusive)"""
+    from firebase_admin import firestore
+
+    query = (db.collection(collection)
+             .where(filter=firestore.FieldFilter("route_date", ">=", start_date.isoformat()))
+             .where(filter=firestore.FieldFilter("route_date", "<=", end_date.isoformat())))
+    if field_paths is not None:
+        query = query.select(field_paths)
+    return query.stream()
+
+
+def _scan_period(db, collection, start_date, end_date):
+    """Per-route entries of the period from one range query, and the number of documents read"""
+    routes = {}
+    documents = 0
+    for snapshot in query_estimated_results(db, collection, start_date, end_date,
+                                            field_paths=["co2_emissions_kg", "total_distance_km", "driver_id",
+                                                         "route_date"]):
+        documents += 1
+        data = snapshot.to_dict()
+        entry = route_contribution(data)
+        # Make sure we only count valid numeric values
+        if entry is not None:
+            routes[base_route_name(snapshot.id)] = {**entry, "route_date": data.get("route_date")}
+    return routes, documents
+
+
+def period_summary(db, collection, start_date, end_date, ttl_seconds=PERIOD_SUMMARY_TTL_SECONDS):
+    """
+    Everything a period report needs, from a single pass over the day rollups (or one
+    route_date range query before the rollups are built):
+
+        co2_emissions_kg, total_distance_km, route_count,
+        route_ids   route names ordered by date
+        routes      [{route_name, route_date, driver_id, co2_emissions_kg, total_distance_km}]
+        source, documents_read
+
+    The result is shared by all requests of the process for ttl_seconds.
+    """
+    key = (collection, id(db), start_date, end_date)
+    with _period_summary_lock:
+        cached = _period_summary_cache.get(key)
+    if cached is not None and time.monotonic() - cached[0] < ttl_seconds:
+        return copy.deepcopy(cached[1])
+
+    if rollups_built(db, collection):
+        source = "rollups"
+        routes, documents_read = period_routes(db, collection, start_date, end_date)
+    else:
+        source = "estimated_results"
+        routes, documents_read = _scan_period(db, collection, start_date, end_date)
+
+    rows = sorted(({"route_name": route_name, **entry} for route_name, entry in routes.items()),
+                  key=lambda row: (row["route_date"] or "", row["route_name"]))
+    summary = {
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "co2_emissions_kg": sum(row["co2_emissions_kg"] for row in rows),
+        "total_distance_km": sum(row["total_distance_km"] for row in rows),
+        "route_count": len(rows),
+        "route_ids": [row["route_name"] for row in rows],
+        "routes": rows,
+        "source": source,
+        "documents_read": documents_read,
+    }
+    with _period_summary_lock:
+        _period_summary_cache[key] = (time.monotonic(), summary)
+    return copy.deepcopy(summary)
+
+
+def invalidate_period_summaries(collection=None):
+    """Drop the cached period summaries (of one collection) after its results changed"""
+    with _period_summary_lock:
+        for key in [key for key in _period_summary_cache if collection is None or key[0] == collection]:
+            del _period_summary_cache[key]
+
+
+def _route_drivers(db, database):
+    """{route_name: driver_id} from the route index of every driver"""
+    from component.route_repository import RouteRepository
+
+    repository = RouteRepository(database, db)
+    route_drivers = {}
+    for driver_id in repository.driver_ids():
+        for route_name in repository.route_names(driver_id) or []:
+            route_drivers[route_name] = driver_id
+    return route_drivers
+
+
+def backfill_estimated_results(db, database, collection, dry_run=False):
+    """Add route_date/driver_id to every estimated result of `database` that lacks them"""
+    summary = {"database": database, "documents": 0, "updated": 0, "no_date": 0, "no_driver": 0}
+    start = time.perf_counter()
+    route_drivers = _route_drivers(db, database)
+
+    batch = db.batch()
+    pending = 0
+    for snapshot in db.collection(collection).select(["route_date", "driver_id"]).stream():
+        summary["documents"] += 1
+        current = snapshot.to_dict()
+        route_name = base_route_name(snapshot.id)
+        computed = estimated_result_fields(route_name, route_drivers.get(route_name))
+        # Only fill in missing fields; routes no longer in any driver document get no driver_id
+        fields = {key: value for key, value in computed.items() if current.get(key) is None and value is not None}
+        summary["no_date"] += (current.get("route_date") or computed["route_date"]) is None
+        summary["no_driver"] += (current.get("driver_id") or computed["driver_id"]) is None
+        if not fields:
+            continue
+
+        summary["updated"] += 1
+        if dry_run:
+            print(f"{snapshot.id}\t{fields}")
+            continue
+        batch.update(snapshot.reference, fields)
+        pending += 1
+        # Firestore batches take at most 500 writes
+        if pending >= BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+
+    summary["elapsed_s"] = round(time.perf_counter() - start, 2)
+    return summary
+
+
+def main(argv=None):
+    from component.route_repository import DATABASE_COLLECTIONS, init_firebase
+
+    parser = argparse.ArgumentParser(description="Add route_date and driver_id to existing estimated results")
+    parser.add_argument("--database", default="real_database_01", choices=list(DATABASE_COLLECTIONS))
+    parser.add_argument("--dry-run", action="store_true", help="only list the documents that would change")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    summary = backfill_estimated_results(init_firebase(), args.database,
+                                         DATABASE_COLLECTIONS[args.database]["estimated"], dry_run=args.dry_run)
+    print(json.dumps(summary))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from component.GPS_cleaning_nonML import calculate_turning_angles
+from component.geometry import point_distances
+
+
+class GpsCleaner:
+    """
+    Streaming version of clean_gps_data for traces that do not fit in memory.
+
+    Points are fed in timestamp order, chunk by chunk, and cleaned points are
+    returned as soon as they can no longer change. Only a bounded amount of
+    state is carried between chunks:
+
+    - angle filter: the last two points (a point's X/Y flag depends on the two
+      points after it)
+    - temporal/speed validation: the previous accepted timestamp and position
+    - smoothing: the last `smoothing_lag` filtered Kalman states
+    - resampling: the rows of the current 5 second bin and the last emitted row
+
+    Tolerance against the batch pipeline: the IsolationForest layer (a whole
+    trace fit) and Google snap-to-roads are not applied. Compared with
+    clean_gps_data(..., smoother='pykalman') on the same sorted trace with
+    those two layers skipped, the time_diff, distance and speed columns are
+    identical, the running total_time / total_distance_km agree up to
+    summation order, and latitude / longitude differ by less than 1e-9 degrees (about 0.1 mm) with the
+    default smoothing_lag of 20. Each step of lag shrinks the error by ~0.38,
+    because the fixed-lag smoother uses the same model as the pykalman call
+    (identity transition/observation, unit covariances). Input must be in
+    timestamp order across chunks; points with tied timestamps keep their
+    input order, whereas the batch path's sort leaves ties in arbitrary order.
+    """
+
+    def __init__(self, angle_threshold=90, max_speed=25, resample_freq='5s', smoothing_lag=20):
+        self.angle_threshold = angle_threshold
+        self.max_speed = max_speed
+        self.resample_freq = resample_freq
+        self.smoothing_lag = smoothing_lag
+
+        self.total_time = 0.0
+        self.total_distance_km = 0.0
+        self.points_in = 0
+        self.points_out = 0
+
+        # Angle filter state: last two points, their angle values and flags
+        self._angle_carry = None
+        # Temporal validation state
+        self._last_angle_timestamp = None
+        self._last_valid_point = None
+        # Kalman state: last filtered mean/covariance and the unemitted window
+        self._kalman_mean = None
+        self._kalman_cov = None
+        self._smooth_window = None
+        # Resampling state
+        self._bin_rows = None
+        self._last_emitted = None
+
+    def process(self, chunk):
+        """Feed one chunk of raw points; returns the cleaned rows that are now final"""
+        chunk = self._prepare(chunk)
+        self.points_in += len(chunk)
+        df = self._angle_stage(chunk, final=False)
+        df = self._temporal_stage(df)
+        df = self._smoothing_stage(df, final=False)
+        return self._resample_stage(df, final=False)
+
+    def flush(self):
+        """Finish the trace and return the remaining cleaned rows"""
+        df = self._angle_stage(None, final=True)
+        df = self._temporal_stage(df)
+        df = self._smoothing_stage(df, final=True)
+        return self._resample_stage(df, final=True)
+
+    def stream(self, chunks):
+        """Generator over cleaned DataFrames, one per input chunk plus the final flush"""
+        for chunk in chunks:
+            cleaned = self.process(chunk)
+            if not cleaned.empty:
+                yield cleaned
+        cleaned = self.flush()
+        if not cleaned.empty:
+            yield cleaned
+
+    def _prepare(self, chunk):
+        df = pd.DataFrame(chunk).copy()
+        if 'latitude' not in df.columns or 'longitude' not in df.columns:
+            raise ValueError("Chunk must contain 'latitude' and 'longitude' columns")
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        return df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+    def _angle_stage(self, chunk, final):
+        if chunk is None:
+            window = self._angle_carry
+        elif self._angle_carry is None:
+            window = chunk.assign(angle_value=np.nan, _unreliable=False)
+        else:
+            window = pd.concat([self._angle_carry, chunk.assign(angle_value=np.nan, _unreliable=False)],
+                               ignore_index=True)
+        if window is None or window.empty:
+            return pd.DataFrame()
+
+        lat = pd.to_numeric(window['latitude'], errors='coerce').to_numpy(dtype=float)
+        lon = pd.to_numeric(window['longitude'], errors='coerce').to_numpy(dtype=float)
+
+        if chunk is not None and len(window) >= 3:
+            # Every triple in the window is new: the carry holds at most two points
+            angles = calculate_turning_angles(lat, lon)
+            angle_values = window['angle_value'].to_numpy(dtype=float).copy()
+            angle_values[1:-1] = angles
+            unreliable = window['_unreliable'].to_numpy(dtype=bool).copy()
+            bad = angles < self.angle_threshold
+            unreliable[:-2] |= bad
+            unreliable[1:-1] |= bad
+            unreliable[2:] |= bad
+            window = window.assign(angle_value=angle_values, _unreliable=unreliable)
+
+        if final:
+            done, self._angle_carry = window, None
+        else:
+            done, self._angle_carry = window.iloc[:-2], window.iloc[-2:].reset_index(drop=True)
+
+        return done[~done['_unreliable']].drop(columns=['_unreliable']).reset_index(drop=True)
+
+    def _temporal_stage(self, df):
+        if df.empty:
+            return df
+
+        timestamps = df['timestamp']
+        previous = timestamps.shift()
+        if self._last_angle_timestamp is not None:
+            previous.iloc[0] = self._last_angle_timestamp
+        self._last_angle_timestamp = timestamps.iloc[-1]
+
+        df = df.assign(time_diff=(timestamps - previous).dt.total_seconds().fillna(0))
+        df = df[df['time_diff'] > 0].reset_index(drop=True)
+        if df.empty:
+            return df
+
+        # Distance is measured from the previous point that passed the time check,
+        # even if that point is later rejected by the speed check (same as the batch path)
+        if self._last_valid_point is not None:
+            with_previous = pd.concat([self._last_valid_point, df[['latitude', 'longitude']]], ignore_index=True)
+            distance = point_distances(with_previous['latitude'], with_previous['longitude'])[1:]
+        else:
+            distance = point_distances(df['latitude'], df['longitude'])
+        self._last_valid_point = df[['latitude', 'longitude']].iloc[[-1]]
+
+        df = df.assign(distance=distance)
+        df['speed'] = df['distance'] / df['time_diff']
+        df = df[(df['speed'] < self.max_speed) & (df['time_diff'] > 0)].reset_index(drop=True)
+
+        self.total_time += df['time_diff'].sum()
+        self.total_distance_km += df['distance'].sum() / 1000
+        return df
+
+    def _smoothing_stage(self, df, final):
+        # Kalman model of the batch Layer 4: x_t = x_{t-1} + w, z_t = x_t + v with
+        # identity covariances. The covariance is the same scalar for lat and lon.
+        if not df.empty:
+            observations = df[['latitude', 'longitude']].to_numpy(dtype=float)
+            filtered_means = np.empty_like(observations)
+            filtered_covs = np.empty(len(observations))
+            predicted_covs = np.empty(len(observations))
+
+            mean, cov = self._kalman_mean, self._kalman_cov
+            for i, observation in enumerate(observations):
+                if mean is None:
+                    # pykalman starts from initial_state_mean = first observation, covariance I
+                    mean, predicted_cov = observation.copy(), 1.0
+                else:
+                    predicted_cov = cov + 1.0
+                gain = predicted_cov / (predicted_cov + 1.0)
+                mean = mean + gain * (observation - mean)
+                cov = (1.0 - gain) * predicted_cov
+                filtered_means[i] = mean
+                filtered_covs[i] = cov
+                predicted_covs[i] = predicted_cov
+            self._kalman_mean, self._kalman_cov = mean, cov
+
+            new_rows = df.assign(_filtered_lat=filtered_means[:, 0], _filtered_lon=filtered_means[:, 1],
+                                 _filtered_cov=filtered_covs, _predicted_cov=predicted_covs)
+            if self._smooth_window is None:
+                self._smooth_window = new_rows
+            else:
+                self._smooth_window = pd.concat([self._smooth_window, new_rows], ignore_index=True)
+
+        window = self._smooth_window
+        if window is None or window.empty:
+            return pd.DataFrame()
+
+        # Backward (Rauch-Tung-Striebel) pass over the window
+        means = window[['_filtered_lat', '_filtered_lon']].to_numpy()
+        filtered_covs = window['_filtered_cov'].to_numpy()
+        predicted_covs = window['_predicted_cov'].to_numpy()
+        smoothed = means.copy()
+        for i in range(len(window) - 2, -1, -1):
+            smoother_gain = filtered_covs[i] / predicted_covs[i + 1]
+            smoothed[i] = means[i] + smoother_gain * (smoothed[i + 1] - means[i])
+
+        emit_count = len(window) if final else max(len(window) - self.smoothing_lag, 0)
+        done = window.iloc[:emit_count].copy()
+        done[['latitude', 'longitude']] = smoothed[:emit_count]
+        self._smooth_window = window.iloc[emit_count:].reset_index(drop=True)
+        return done.drop(columns=['_filtered_lat', '_filtered_lon', '_filtered_cov', '_predicted_cov'])
+
+    def _resample_stage(self, df, final):
+        if self._bin_rows is not None and not df.empty:
+            df = pd.concat([self._bin_rows, df], ignore_index=True)
+        elif self._bin_rows is not None:
+            df = self._bin_rows
+        if df.empty:
+            return pd.DataFrame()
+
+        bins = df['timestamp'].dt.floor(self.resample_freq)
+        if final:
+            done, self._bin_rows = df, None
+        else:
+            # The last bin can still receive points from the next chunk
+            is_last_bin = bins == bins.iloc[-1]
+            done, self._bin_rows = df[~is_last_bin], df[is_last_bin].reset_index(drop=True)
+        if done.empty:
+            return pd.DataFrame()
+
+        resampled = done.set_index('timestamp').resample(self.resample_freq).mean(numeric_only=True)
+
+        # Empty bins between chunks are forward filled from the last emitted row
+        if self._last_emitted is not None:
+            gap_start = self._last_emitted.index[0] + pd.Timedelta(self.resample_freq)
+            full_index = pd.date_range(gap_start, resampled.index[-1], freq=self.resample_freq)
+            resampled = pd.concat([self._last_emitted, resampled.reindex(full_index)])
+            resampled = resampled.ffill().iloc[1:]
+        else:
+            resampled = resampled.ffill()
+
+        for col in ['latitude', 'longitude']:
+            resampled[col] = resampled[col].interpolate(method='linear')
+
+        self._last_emitted = resampled.iloc[[-1]]
+        self.points_out += len(resampled)
+        logging.debug("GpsCleaner emitted %d rows", len(resampled))
+        return resampled.rename_axis('timestamp').reset_index()
+
+
+def clean_gps_stream(chunks, **kwargs):
+    """Clean an iterable of raw point chunks, yielding cleaned DataFrames as they become final"""
+    cleaner = GpsCleaner(**kwargs)
+    yield from cleaner.stream(chunks)
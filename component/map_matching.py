@@ -0,0 +1,298 @@
+"""
+Offline map matching for Layer 3 on a local OSM road graph.
+
+Download a graph once (needs network), then clean routes without the Roads API:
+    python -m component.map_matching --place "Hong Kong" --output data/road_graph.graphml
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+from functools import lru_cache
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from component.geometry import EARTH_RADIUS_M
+
+DEFAULT_ROAD_GRAPH_PATH = os.environ.get("ROAD_GRAPH_PATH", os.path.join("data", "road_graph.graphml"))
+
+
+class OsmMapMatcher:
+    """
+    HMM map matcher (Newson & Krumm style) over an osmnx road graph.
+
+    Edges are split into straight segments in a local metric projection and
+    densified every `sample_spacing_m`; a cKDTree over those samples finds the
+    candidate edges around each GPS point, and the point is projected onto
+    them. Emission probability is Gaussian in the GPS-to-road distance,
+    transition probability decays with |GPS step - road step|, where the road
+    step is measured along the edge, through a shared junction, or, for edges
+    that do not touch, as the straight distance plus `non_adjacent_penalty_m`.
+    Viterbi runs over the whole trace with one K x K numpy step per point.
+    Travel direction (oneway) is not enforced.
+    """
+
+    def __init__(self, graph, sample_spacing_m=10.0, search_radius_m=50.0, max_candidates=8,
+                 gps_sigma_m=5.0, transition_beta_m=10.0, non_adjacent_penalty_m=100.0):
+        self.sample_spacing_m = sample_spacing_m
+        self.search_radius_m = search_radius_m
+        self.max_candidates = max_candidates
+        self.gps_sigma_m = gps_sigma_m
+        self.transition_beta_m = transition_beta_m
+        self.non_adjacent_penalty_m = non_adjacent_penalty_m
+        self._build_index(graph)
+
+    @classmethod
+    def from_graphml(cls, path, **options):
+        import osmnx as ox
+        logging.info(f"Loading road graph from {path}")
+        return cls(ox.load_graphml(path), **options)
+
+    def _project(self, lat, lon):
+        x = np.radians(lon) * EARTH_RADIUS_M * self._cos_lat0
+        y = np.radians(lat) * EARTH_RADIUS_M
+        return np.column_stack([x, y])
+
+    def _unproject(self, xy):
+        lat = np.degrees(xy[:, 1] / EARTH_RADIUS_M)
+        lon = np.degrees(xy[:, 0] / (EARTH_RADIUS_M * self._cos_lat0))
+        return lat, lon
+
+    def _build_index(self, graph):
+        nodes = list(graph.nodes)
+        node_position = {node: i for i, node in enumerate(nodes)}
+        node_lat = np.array([graph.nodes[n]['y'] for n in nodes], dtype=float)
+        node_lon = np.array([graph.nodes[n]['x'] for n in nodes], dtype=float)
+        self._cos_lat0 = np.cos(np.radians(node_lat.mean())) if len(nodes) else 1.0
+        self.node_latlon = np.column_stack([node_lat, node_lon])
+        node_xy = self._project(node_lat, node_lon)
+
+        edge_u, edge_v, segment_edge, points = [], [], [], []
+        seen = set()
+        for u, v, key, data in graph.edges(keys=True, data=True):
+            # Direction is not enforced, so the reverse twin of a two-way street is indexed once
+            road = (min(u, v), max(u, v), key)
+            if road in seen:
+                continue
+            seen.add(road)
+            edge_id = len(edge_u)
+            edge_u.append(node_position[u])
+            edge_v.append(node_position[v])
+            if 'geometry' in data:
+                lon, lat = np.asarray(data['geometry'].coords, dtype=float).T
+                coords = self._project(lat, lon)
+            else:
+                coords = node_xy[[node_position[u], node_position[v]]]
+            points.append(coords)
+            segment_edge.append(np.full(len(coords) - 1, edge_id))
+        if not points:
+            raise ValueError("Road graph has no edges")
+
+        self.edge_u = np.array(edge_u)
+        self.edge_v = np.array(edge_v)
+
+        # Segments of every edge polyline, with their offset from the start of the edge
+        self.segment_edge = np.concatenate(segment_edge)
+        self.segment_start = np.concatenate([p[:-1] for p in points])
+        self.segment_end = np.concatenate([p[1:] for p in points])
+        segment_length = np.linalg.norm(self.segment_end - self.segment_start, axis=1)
+        self.edge_length = np.bincount(self.segment_edge, weights=segment_length, minlength=len(edge_u))
+        cumulative = np.cumsum(segment_length) - segment_length
+        edge_first_segment = np.searchsorted(self.segment_edge, np.arange(len(edge_u)))
+        self.segment_offset = cumulative - cumulative[edge_first_segment][self.segment_edge]
+
+        # Densified sample points for the spatial index
+        counts = np.maximum(np.ceil(segment_length / self.sample_spacing_m).astype(int), 1) + 1
+        sample_segment = np.repeat(np.arange(len(counts)), counts)
+        position = np.arange(len(sample_segment)) - np.repeat(np.cumsum(counts) - counts, counts)
+        fraction = (position / (counts[sample_segment] - 1))[:, None]
+        samples = self.segment_start[sample_segment] + fraction * (
+            self.segment_end[sample_segment] - self.segment_start[sample_segment])
+        self.sample_segment = sample_segment
+        self.tree = cKDTree(samples)
+        logging.info(f"Indexed {len(edge_u)} edges ({len(samples)} sample points)")
+
+    def _candidates(self, xy):
+        """Best projection onto the K nearest edges of every point; padded with inf distance"""
+        n_points = len(xy)
+        k = self.max_candidates
+        k_query = min(k * 8, self.tree.n)
+        radius = self.search_radius_m + self.sample_spacing_m
+        dist, sample = self.tree.query(xy, k=k_query, distance_upper_bound=radius)
+        dist = dist.reshape(n_points, -1)
+        sample = sample.reshape(n_points, -1)
+
+        found = np.isfinite(dist)
+        rows = np.nonzero(found)[0]
+        segments = self.sample_segment[sample[found]]
+
+        # Exact projection of each point onto the candidate segments
+        start = self.segment_start[segments]
+        direction = self.segment_end[segments] - start
+        length_sq = np.einsum('ij,ij->i', direction, direction)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.clip(np.einsum('ij,ij->i', xy[rows] - start, direction) / length_sq, 0, 1)
+        t = np.nan_to_num(t)
+        projected = start + t[:, None] * direction
+        distance = np.linalg.norm(xy[rows] - projected, axis=1)
+        edges = self.segment_edge[segments]
+        offset = self.segment_offset[segments] + t * np.sqrt(length_sq)
+
+        # Keep the closest projection per (point, edge), then the k closest edges per point
+        order = np.lexsort((distance, edges, rows))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (rows[order][1:] != rows[order][:-1]) | (edges[order][1:] != edges[order][:-1])
+        keep = order[first & (distance[order] <= self.search_radius_m)]
+        keep = keep[np.lexsort((distance[keep], rows[keep]))]
+        kept_rows = rows[keep]
+        group_start = np.searchsorted(kept_rows, kept_rows)
+        rank = np.arange(len(keep)) - group_start
+        keep, kept_rows, rank = keep[rank < k], kept_rows[rank < k], rank[rank < k]
+
+        cand_distance = np.full((n_points, k), np.inf)
+        cand_edge = np.zeros((n_points, k), dtype=int)
+        cand_offset = np.zeros((n_points, k))
+        cand_xy = np.zeros((n_points, k, 2))
+        cand_distance[kept_rows, rank] = distance[keep]
+        cand_edge[kept_rows, rank] = edges[keep]
+        cand_offset[kept_rows, rank] = offset[keep]
+        cand_xy[kept_rows, rank] = projected[keep]
+        return cand_edge, cand_offset, cand_distance, cand_xy
+
+    def _road_distance(self, edge_a, offset_a, xy_a, edge_b, offset_b, xy_b):
+        """K x K distance along the road between the candidates of two consecutive points"""
+        ea, eb = edge_a[:, None], edge_b[None, :]
+        oa, ob = offset_a[:, None], offset_b[None, :]
+        a_to_u, a_to_v = oa, self.edge_length[ea] - oa
+        u_to_b, v_to_b = ob, self.edge_length[eb] - ob
+        ua, va = self.edge_u[ea], self.edge_v[ea]
+        ub, vb = self.edge_u[eb], self.edge_v[eb]
+
+        distance = np.where(ea == eb, np.abs(ob - oa), np.inf)
+        distance = np.minimum(distance, np.where(va == ub, a_to_v + u_to_b, np.inf))
+        distance = np.minimum(distance, np.where(va == vb, a_to_v + v_to_b, np.inf))
+        distance = np.minimum(distance, np.where(ua == ub, a_to_u + u_to_b, np.inf))
+        distance = np.minimum(distance, np.where(ua == vb, a_to_u + v_to_b, np.inf))
+
+        straight = np.linalg.norm(xy_a[:, None, :] - xy_b[None, :, :], axis=2)
+        return np.where(np.isfinite(distance), distance, straight + self.non_adjacent_penalty_m)
+
+    def _viterbi(self, emission, cand_edge, cand_offset, cand_xy, gps_step):
+        n_points, k = emission.shape
+        backpointer = np.zeros((n_points, k), dtype=int)
+        score = emission[0]
+        for t in range(1, n_points):
+            road = self._road_distance(cand_edge[t - 1], cand_offset[t - 1], cand_xy[t - 1],
+                                       cand_edge[t], cand_offset[t], cand_xy[t])
+            total = score[:, None] - np.abs(gps_step[t - 1] - road) / self.transition_beta_m
+            backpointer[t] = np.argmax(total, axis=0)
+            score = total[backpointer[t], np.arange(k)] + emission[t]
+
+        states = np.empty(n_points, dtype=int)
+        states[-1] = np.argmax(score)
+        for t in range(n_points - 1, 0, -1):
+            states[t - 1] = backpointer[t, states[t]]
+        return states
+
+    def match(self, path, interpolate=True):
+        """
+        Match [lat, lng] points; returns (snapped_points, stats) in the same point format as
+        component.roads_client.snap_path_to_roads. Points with no road within search_radius_m
+        are dropped and split the trace into independently matched runs. With interpolate=True
+        the junction between two consecutive matches on different edges is inserted.
+        """
+        start_time = time.perf_counter()
+        latlon = np.asarray(path, dtype=float).reshape(-1, 2)
+        xy = self._project(latlon[:, 0], latlon[:, 1])
+        cand_edge, cand_offset, cand_distance, cand_xy = self._candidates(xy)
+        emission = -0.5 * (cand_distance / self.gps_sigma_m) ** 2
+        gps_step = np.linalg.norm(np.diff(xy, axis=0), axis=1)
+
+        matched = np.isfinite(cand_distance[:, 0])
+        states = np.full(len(xy), -1)
+        # Runs of consecutive points that have at least one candidate
+        edges = np.diff(np.concatenate([[0], matched.astype(int), [0]]))
+        for run_start, run_end in zip(np.nonzero(edges == 1)[0], np.nonzero(edges == -1)[0]):
+            run = slice(run_start, run_end)
+            states[run] = self._viterbi(emission[run], cand_edge[run], cand_offset[run], cand_xy[run],
+                                        gps_step[run_start:run_end - 1])
+
+        index = np.nonzero(matched)[0]
+        chosen_edge = cand_edge[index, states[index]]
+        lat, lon = self._unproject(cand_xy[index, states[index]])
+
+        snapped_points = []
+        for i in range(len(index)):
+            if interpolate and i > 0 and index[i] == index[i - 1] + 1 and chosen_edge[i] != chosen_edge[i - 1]:
+                previous, current = chosen_edge[i - 1], chosen_edge[i]
+                shared = {self.edge_u[previous], self.edge_v[previous]} & {self.edge_u[current], self.edge_v[current]}
+                if shared:
+                    node_lat, node_lon = self.node_latlon[shared.pop()]
+                    snapped_points.append({'latitude': float(node_lat), 'longitude': float(node_lon),
+                                           'original_index': None})
+            snapped_points.append({'latitude': float(lat[i]), 'longitude': float(lon[i]),
+                                   'original_index': int(index[i])})
+
+        stats = {
+            'matcher': 'osm',
+            'points': len(xy),
+            'matched_points': int(matched.sum()),
+            'unmatched_points': int((~matched).sum()),
+            'match_elapsed_s': round(time.perf_counter() - start_time, 4),
+        }
+        return snapped_points, stats
+
+
+@lru_cache(maxsize=2)
+def get_map_matcher(road_graph_path=DEFAULT_ROAD_GRAPH_PATH):
+    """Load and index a road graph once per process"""
+    if not os.path.exists(road_graph_path):
+        raise FileNotFoundError(f"Road graph not found: {road_graph_path} "
+                                f"(create it with python -m component.map_matching --place ...)")
+    return OsmMapMatcher.from_graphml(road_graph_path)
+
+
+def match_path_to_roads(path, road_graph_path=None, interpolate=True, layer=None):
+    """Offline counterpart of snap_path_to_roads for Layer 3"""
+    matcher = get_map_matcher(road_graph_path or DEFAULT_ROAD_GRAPH_PATH)
+    snapped_points, stats = matcher.match(path, interpolate=interpolate)
+    logging.info(f"Matched {stats['matched_points']}/{stats['points']} points on the local road graph")
+    if layer is not None:
+        layer['details'].update(stats)
+    return snapped_points
+
+
+def download_road_graph(output, place=None, bbox=None, network_type="drive"):
+    """Download the drivable OSM network for a place name or (west, south, east, north) bbox"""
+    import osmnx as ox
+    if place:
+        graph = ox.graph_from_place(place, network_type=network_type)
+    else:
+        # osmnx 2.x signature: one (west, south, east, north) tuple
+        graph = ox.graph_from_bbox(bbox, network_type=network_type)
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    ox.save_graphml(graph, output)
+    return graph
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download an OSM road graph for offline map matching")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--place", help="place name, e.g. 'Hong Kong'")
+    group.add_argument("--bbox", type=float, nargs=4, metavar=("WEST", "SOUTH", "EAST", "NORTH"))
+    parser.add_argument("--output", default=DEFAULT_ROAD_GRAPH_PATH)
+    parser.add_argument("--network-type", default="drive")
+    args = parser.parse_args(argv)
+
+    graph = download_road_graph(args.output, place=args.place, bbox=tuple(args.bbox) if args.bbox else None,
+                                network_type=args.network_type)
+    print(f"Saved {graph.number_of_nodes()} nodes / {graph.number_of_edges()} edges to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,20 @@
 from fpdf import FPDF
 import os
 import folium
-from firebase_admin import credentials, firestore
 import datetime
-import firebase_admin
 from selenium import webdriver
 import time
 from PIL import Image
 import random
+import numpy as np
 from itertools import cycle
-import re
-import streamlit as st
+from component.route_encoding import route_coordinates, route_coordinate_arrays
+from component.simplify import (simplify_routes, reduce_route, PIXEL_TOLERANCE, MAP_WIDTH_PX as SCREENSHOT_WIDTH_PX,
+                                 MAP_HEIGHT_PX as SCREENSHOT_HEIGHT_PX)
+from component.static_map import MAP_RENDERER, MAP_WIDTH_PX, MAP_HEIGHT_PX, render_static_map
+from component.route_repository import RouteRepository
+from component.route_store import get_route_store
+from component.calculate_emission_distance import calculate_period_summary
 
 class PDF(FPDF):
     def __init__(self, start_date, end_date):
@@ -233,99 +237,22 @@ class PDF(FPDF):
         
         self.chapter_body(summary_text)
 
-# Initialize Firebase if not already initialized
-def init_firebase():
-    if not firebase_admin._apps:
-        # Check if we are running with Streamlit
-        if 'streamlit' in globals() or 'streamlit' in locals() or 'st' in globals() or 'st' in locals():
-            try:
-                # Use Streamlit secrets if available
-                firebase_secrets = st.secrets["firebase"]
-                
-                # Convert secrets to the format expected by Firebase Admin SDK
-                firebase_creds = {
-                    "type": firebase_secrets["type"],
-                    "project_id": firebase_secrets["project_id"],
-                    "private_key_id": firebase_secrets["private_key_id"],
-                    "private_key": firebase_secrets["private_key"],
-                    "client_email": firebase_secrets["client_email"],
-                    "client_id": firebase_secrets["client_id"],
-                    "auth_uri": firebase_secrets["auth_uri"],
-                    "token_uri": firebase_secrets["token_uri"],
-                    "auth_provider_x509_cert_url": firebase_secrets["auth_provider_x509_cert_url"],
-                    "client_x509_cert_url": firebase_secrets["client_x509_cert_url"],
-                    "universe_domain": firebase_secrets["universe_domain"]
-                }
-                
-                cred = credentials.Certificate(firebase_creds)
-            except (KeyError, AttributeError):
-                # Fallback to file-based credentials
-                cred = credentials.Certificate('fyp-gps.json')
-        else:
-            # When not using Streamlit
-            cred = credentials.Certificate('fyp-gps.json')
-            
-        firebase_admin.initialize_app(cred)
-    
-    return firestore.client()
-
-def fetch_route_ids_within_period(start_date, end_date):
-    db = init_firebase()
-    route_ids = []
-
-    start_date = datetime.datetime.strptime(start_date, '%d-%m-%Y')
-    end_date = datetime.datetime.strptime(end_date, '%d-%m-%Y')
-
-    # Updated to use the real_estimated_result collection
-    docs = db.collection('real_estimated_result').stream()
-    
-    # Regular expression pattern to match the route naming format
-    # Pattern: Route_{userID}_{ddmmyyyy}_{no of route of that date}_estimated_result_version
-    pattern = re.compile(r'Route_[^_]+_(\d{8})_\d+_estimated_result_version')
-    
-    for doc in docs:
-        doc_id = doc.id
-        match = pattern.match(doc_id)
-        
-        if match:
-            try:
-                date_str = match.group(1)  # Extract the date part (ddmmyyyy)
-                doc_date = datetime.datetime.strptime(date_str, '%d%m%Y')
-                
-                if start_date <= doc_date <= end_date:
-                    # Convert to filtered_version format for map visualization
-                    route_id = doc_id.replace('_estimated_result_version', '')
-                    route_ids.append(route_id)
-            except (IndexError, ValueError):
-                continue
+def fetch_route_ids_within_period(start_date, end_date, database="real_database_01", db=None):
+    # Served from the cached period summary when the analysis of the same period already ran
+    return calculate_period_summary(start_date, end_date, database, db)['route_ids']
 
-    return route_ids
-
-def fetch_processed_data(route_id):
-    db = init_firebase()
-    
-    # Add '_filtered_version' suffix if it's not already present
-    if not route_id.endswith('_filtered_version'):
-        route_id = route_id + '_filtered_version'
-        
-    # Update to use real_processed_routes_ricky collection
-    doc_ref = db.collection('real_processed_routes_ricky').document(route_id)
-    doc = doc_ref.get()
-
-    if doc.exists:
-        processed_data = doc.to_dict()
-    else:
-        processed_data = []
-
-    return processed_data
+def fetch_processed_data(route_id, database="real_database_01", db=None):
+    # Single route; the '_filtered_version' suffix is optional
+    processed_data = RouteRepository(database, db, get_route_store()).processed_route(route_id)
+    return processed_data if processed_data is not None else []
 
 def translate_processed_data(data):
-    coordinates = data.get("coordinates", [])
-    return [(coord["latitude"], coord["longitude"]) for coord in coordinates]
+    # Handles both the legacy coordinate list and the compact encoded format
+    return route_coordinates(data)
 
 
-def create_map_with_gps_data(route_ids):
-    all_gps_data = []
+def create_map_with_gps_data(route_ids, database="real_database_01", db=None, simplify=True, renderer=MAP_RENDERER):
+    build_start = time.perf_counter()
     color_cycle = cycle(['red', 'blue', 'green', 'purple', 'orange', 'darkred', 'lightred', 'beige', 'darkblue', 'darkgreen', 'cadetblue', 'darkpurple', 'white', 'pink', 'lightblue', 'lightgreen', 'gray', 'black', 'lightgray'])  # Cycle through colors
     
     # Create map with a larger initial zoom level to ensure all points are visible
@@ -333,29 +260,69 @@ def create_map_with_gps_data(route_ids):
     
     success_count = 0  # Track how many routes we successfully add to the map
     
-    for route_id in route_ids:
-        processed_data = fetch_processed_data(route_id)
-        if processed_data:
-            translated_coords = translate_processed_data(processed_data)
-            if translated_coords:
-                color = next(color_cycle)
-                # Use a thicker line for better visibility
-                folium.PolyLine(translated_coords, color=color, weight=4).add_to(map_plot)
-                # Only add markers for start and end points to reduce clutter
-                folium.CircleMarker(location=translated_coords[0], radius=6, color=color, fill=True, 
-                                    popup=f"Start: {route_id}").add_to(map_plot)
-                folium.CircleMarker(location=translated_coords[-1], radius=6, color=color, fill=True,
-                                    popup=f"End: {route_id}").add_to(map_plot)
-                all_gps_data.extend(translated_coords)
-                success_count += 1
+    # Processed routes arrive in get_all chunks fetched in parallel. Each one is decoded and
+    # reduced to a quarter pixel of a map of its own extent as it arrives, so only the reduced
+    # coordinates are kept until the combined extent is known and the map is drawn
+    static = renderer != "selenium"
+    map_size = (MAP_WIDTH_PX, MAP_HEIGHT_PX) if static else (SCREENSHOT_WIDTH_PX, SCREENSHOT_HEIGHT_PX)
+    reduce = static or simplify
+    repository = RouteRepository(database, db, get_route_store())
+    route_names = []
+    routes = []
+    points_loaded = 0
+    for route_id, processed_data in repository.iter_processed_routes(route_ids):
+        if not processed_data:
+            continue
+        lat, lon = route_coordinate_arrays(processed_data)
+        if not len(lat):
+            continue
+        points_loaded += len(lat)
+        route_names.append(route_id)
+        routes.append(reduce_route(lat, lon, *map_size, PIXEL_TOLERANCE / 2) if reduce else (lat, lon))
+    load_time = time.perf_counter() - build_start
 
-    print(f"Added {success_count} routes to the map out of {len(route_ids)} route IDs")
+    if static:
+        # Pillow renderer: no HTML and no browser; it simplifies to its own pixel grid
+        map_dir = "maps"
+        os.makedirs(map_dir, exist_ok=True)
+        map_image_path = os.path.join(map_dir, 'map_image.png')
+        lines = [{"lat": lat, "lon": lon, "color": next(color_cycle), "markers": "ends"} for lat, lon in routes]
+        stats = render_static_map(lines, map_image_path)
+        print(f"Added {len(routes)} routes to the map out of {len(route_ids)} route IDs "
+              f"({repository.reads} documents read in {load_time:.1f}s)")
+        print(f"Static map rendered in {stats['elapsed_s']:.2f}s: {points_loaded} -> {stats['points']} points, "
+              f"zoom {stats['zoom']:.1f}, {stats['tiles']} tiles")
+        return map_image_path, len(routes)
 
-    if all_gps_data:
+    # Detail below half a pixel of the screenshot is invisible: simplify before building the HTML
+    if simplify:
+        routes, stats = simplify_routes(routes, pixel_tolerance=PIXEL_TOLERANCE / 2)
+    else:
+        stats = {}
+    stats.update(points_before=points_loaded, points_after=sum(len(lat) for lat, _ in routes))
+
+    for route_id, (lat, lon) in zip(route_names, routes):
+        translated_coords = list(zip(lat.tolist(), lon.tolist()))
+        color = next(color_cycle)
+        # Use a thicker line for better visibility
+        folium.PolyLine(translated_coords, color=color, weight=4).add_to(map_plot)
+        # Only add markers for start and end points to reduce clutter
+        folium.CircleMarker(location=translated_coords[0], radius=6, color=color, fill=True, 
+                            popup=f"Start: {route_id}").add_to(map_plot)
+        folium.CircleMarker(location=translated_coords[-1], radius=6, color=color, fill=True,
+                            popup=f"End: {route_id}").add_to(map_plot)
+        success_count += 1
+
+    print(f"Added {success_count} routes to the map out of {len(route_ids)} route IDs "
+          f"({repository.reads} documents read in {load_time:.1f}s)")
+
+    if routes:
         try:
             # Calculate the bounds of all GPS data to adjust the map view
-            sw = [min(map(lambda x: x[0], all_gps_data)), min(map(lambda x: x[1], all_gps_data))]
-            ne = [max(map(lambda x: x[0], all_gps_data)), max(map(lambda x: x[1], all_gps_data))]
+            all_lat = np.concatenate([lat for lat, _ in routes])
+            all_lon = np.concatenate([lon for _, lon in routes])
+            sw = [float(all_lat.min()), float(all_lon.min())]
+            ne = [float(all_lat.max()), float(all_lon.max())]
             
             # Add padding to the bounds to ensure all points are visible (0.05 degrees)
             sw[0] -= 0.05  # Latitude padding
@@ -406,6 +373,9 @@ def create_map_with_gps_data(route_ids):
     with open(map_html_path, 'w') as file:
         file.write(content)
 
+    print(f"Map HTML built in {time.perf_counter() - build_start:.2f}s: {os.path.getsize(map_html_path) / 1024:.0f} KB, "
+          f"{stats['points_before']} -> {stats['points_after']} points")
+
     # Convert the HTML map to PNG with improved settings
     map_image_path = os.path.join(map_dir, 'map_image.png')
     options = webdriver.ChromeOptions()
@@ -454,7 +424,7 @@ def create_map_with_gps_data(route_ids):
 
     return map_image_path, success_count
 
-def generate_muti_pdf(start_date, end_date, total_emission, total_distance, route_count=0):
+def generate_muti_pdf(start_date, end_date, total_emission, total_distance, route_count=0, summary=None):
     # Convert the route IDs to more readable date format for display
     start_date_obj = datetime.datetime.strptime(start_date, '%d-%m-%Y')
     end_date_obj = datetime.datetime.strptime(end_date, '%d-%m-%Y')
@@ -463,8 +433,11 @@ def generate_muti_pdf(start_date, end_date, total_emission, total_distance, rout
     formatted_start = start_date_obj.strftime('%d %B %Y')
     formatted_end = end_date_obj.strftime('%d %B %Y')
     
-    # Always get route IDs within period for map visualization
-    route_ids = fetch_route_ids_within_period(start_date, end_date)
+    # Route IDs and per-route figures of the period: the analysis' summary when given,
+    # otherwise the cached period summary (one Firestore pass per period)
+    if summary is None:
+        summary = calculate_period_summary(start_date, end_date)
+    route_ids = summary['route_ids']
     
     # Update route_count if it wasn't provided
     if route_count <= 0:
@@ -545,24 +518,19 @@ def generate_muti_pdf(start_date, end_date, total_emission, total_distance, rout
     
     # 4.2 Route List
     if route_ids:
-        # Format the route IDs for better readability
+        # Format the route rows for better readability
         formatted_routes = []
-        for i, route_id in enumerate(route_ids):
-            parts = route_id.split('_')
-            if len(parts) >= 3:
-                try:
-                    date_part = parts[2]
-                    formatted_date = f"{date_part[0:2]}/{date_part[2:4]}/{date_part[4:8]}"
-                    route_num = i + 1
-                    formatted_routes.append([route_num, formatted_date, route_id])
-                except:
-                    formatted_routes.append([i + 1, "Unknown", route_id])
-            else:
-                formatted_routes.append([i + 1, "Unknown", route_id])
+        for i, route in enumerate(summary['routes']):
+            try:
+                formatted_date = datetime.date.fromisoformat(route['route_date']).strftime('%d/%m/%Y')
+            except (TypeError, ValueError):
+                formatted_date = "Unknown"
+            formatted_routes.append([i + 1, formatted_date, route['route_name'],
+                                     f"{route['co2_emissions_kg']:.2f}", f"{route['total_distance_km']:.2f}"])
         
         # Add route table with headers
-        table_data = [["#", "Date", "Route ID"]] + formatted_routes
-        col_widths = [15, 40, 125]  # Adjust column widths as needed
+        table_data = [["#", "Date", "Route ID", "CO2 (kg)", "km"]] + formatted_routes
+        col_widths = [12, 26, 102, 22, 18]  # Adjust column widths as needed
         pdf.add_table(table_data, col_widths, "Routes Included in This Report")
     else:
         if route_count > 0:
@@ -0,0 +1,120 @@
+import time
+import logging
+
+import numpy as np
+import pandas as pd
+
+from component.geometry import segment_distances
+
+
+def _isolation_forest(df, contamination=0.05, random_state=0):
+    """
+    Original Layer 1: fit a new IsolationForest on every point of the route. Seeded, so
+    an unchanged route keeps the same points and its snap-to-roads batches hit the cache.
+    """
+    from sklearn.ensemble import IsolationForest
+    coords = df[['latitude', 'longitude']].values
+    iso_forest = IsolationForest(contamination=contamination, random_state=random_state)
+    return iso_forest.fit_predict(coords) == 1
+
+
+def _isolation_forest_sampled(df, sample_size=2000, contamination=0.05, random_state=0):
+    """Fit IsolationForest on a random subsample, then score every point with it"""
+    from sklearn.ensemble import IsolationForest
+    coords = df[['latitude', 'longitude']].values
+    if len(coords) > sample_size:
+        rng = np.random.default_rng(random_state)
+        sample = coords[rng.choice(len(coords), size=sample_size, replace=False)]
+    else:
+        sample = coords
+    iso_forest = IsolationForest(contamination=contamination, random_state=random_state)
+    iso_forest.fit(sample)
+    return iso_forest.predict(coords) == 1
+
+
+def _kinematic(df, window=15, n_mad=5.0, min_speed=5.0, max_speed=40.0, max_acceleration=6.0):
+    """
+    Speed/acceleration spike filter.
+
+    A point is an outlier when the speeds into and out of it are both far above
+    the local (rolling median + n_mad * MAD) speed, or both exceed max_speed, or
+    when it needs an impossible acceleration on both sides. Single-point jumps
+    are removed, while a sustained change of speed is kept.
+    """
+    seconds = pd.to_datetime(df['timestamp']).to_numpy(dtype='datetime64[ns]').astype(np.int64) / 1e9
+    distance = segment_distances(df['latitude'].to_numpy(dtype=float), df['longitude'].to_numpy(dtype=float),
+                                 method='haversine')
+    dt = np.diff(seconds)
+
+    # speed_in[i] is the speed from point i-1 to point i; duplicate timestamps are left to Layer 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        segment_speed = np.where(dt > 0, distance / dt, np.nan)
+    speed_in = np.concatenate([[np.nan], segment_speed])
+    speed_out = np.concatenate([segment_speed, [np.nan]])
+
+    speed_series = pd.Series(speed_in)
+    rolling_median = speed_series.rolling(window, center=True, min_periods=1).median()
+    abs_deviation = (speed_series - rolling_median).abs()
+    rolling_mad = abs_deviation.rolling(window, center=True, min_periods=1).median()
+    threshold = np.maximum((rolling_median + n_mad * 1.4826 * rolling_mad).to_numpy(), min_speed)
+
+    # Threshold of the point itself is used for both sides so a spike is judged against one baseline
+    spike = ((speed_in > threshold) & (speed_out > threshold)) | ((speed_in > max_speed) & (speed_out > max_speed))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dt_in = np.concatenate([[np.nan], dt])
+        acceleration_in = np.abs(np.diff(speed_in, prepend=np.nan)) / dt_in
+        acceleration_out = np.concatenate([acceleration_in[1:], [np.nan]])
+    jump = (acceleration_in > max_acceleration) & (acceleration_out > max_acceleration)
+
+    return ~(spike | jump)
+
+
+def _no_outlier_detection(df):
+    return np.ones(len(df), dtype=bool)
+
+
+# Available Layer 1 backends; each returns a boolean mask of the points to keep
+OUTLIER_DETECTORS = {
+    'isolation_forest': _isolation_forest,
+    'isolation_forest_sampled': _isolation_forest_sampled,
+    'kinematic': _kinematic,
+    'none': _no_outlier_detection,
+}
+
+
+def detect_outliers(df, method='isolation_forest', **options):
+    """
+    Run one outlier detection backend and drop the flagged points.
+    Returns (filtered_df, stats) where stats include the throughput of the backend.
+    """
+    if method not in OUTLIER_DETECTORS:
+        raise ValueError(f"Unknown outlier detection method '{method}'. "
+                         f"Available: {', '.join(OUTLIER_DETECTORS)}")
+
+    start = time.perf_counter()
+    if len(df) == 0:
+        keep = np.ones(0, dtype=bool)
+    else:
+        keep = np.asarray(OUTLIER_DETECTORS[method](df, **options), dtype=bool)
+    elapsed = time.perf_counter() - start
+
+    stats = {
+        'method': method,
+        'points': len(df),
+        'outliers': int((~keep).sum()),
+        'elapsed_s': round(elapsed, 4),
+        'points_per_second': round(len(df) / elapsed, 1) if elapsed > 0 else float('inf'),
+    }
+    logging.info("Outlier detection (%s): removed %d of %d points, %.0f points/s",
+                 method, stats['outliers'], stats['points'], stats['points_per_second'])
+    return df[keep].copy(), stats
+
+
+def benchmark_outlier_detectors(df, methods=None):
+    """Run every backend on the same trace and return a table of outlier counts and throughput"""
+    rows = []
+    for method in methods or OUTLIER_DETECTORS:
+        _, stats = detect_outliers(df, method=method)
+        rows.append(stats)
+    return pd.DataFrame(rows)
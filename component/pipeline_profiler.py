@@ -0,0 +1,79 @@
+import json
+import time
+import datetime
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+class PipelineProfiler:
+    """
+    Collect per-layer timings for the GPS cleaning pipeline.
+
+    Each layer records wall time, CPU time, rows in/out and the number of
+    external API calls it made. The report can be shown as a table in
+    Streamlit or appended to a JSON lines file for trend tracking.
+    """
+
+    def __init__(self, route_name=None):
+        self.route_name = route_name
+        self.created_at = datetime.datetime.now().isoformat(timespec='seconds')
+        self.layers = []
+
+    @contextmanager
+    def layer(self, name, rows_in=0):
+        """Time one layer; the yielded record can be updated with rows_out, api_calls and details."""
+        record = {
+            'layer': name,
+            'wall_time_s': 0.0,
+            'cpu_time_s': 0.0,
+            'rows_in': int(rows_in),
+            'rows_out': int(rows_in),
+            'api_calls': 0,
+            'details': {},
+        }
+        self.layers.append(record)
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_time_s'] = round(time.perf_counter() - wall_start, 4)
+            record['cpu_time_s'] = round(time.process_time() - cpu_start, 4)
+
+    @property
+    def total_wall_time(self):
+        return sum(record['wall_time_s'] for record in self.layers)
+
+    @property
+    def total_cpu_time(self):
+        return sum(record['cpu_time_s'] for record in self.layers)
+
+    @property
+    def total_api_calls(self):
+        return sum(record['api_calls'] for record in self.layers)
+
+    def to_dict(self):
+        return {
+            'route_name': self.route_name,
+            'created_at': self.created_at,
+            'total_wall_time_s': round(self.total_wall_time, 4),
+            'total_cpu_time_s': round(self.total_cpu_time, 4),
+            'total_api_calls': self.total_api_calls,
+            'layers': self.layers,
+        }
+
+    def to_dataframe(self):
+        """One row per layer, suitable for st.table / st.dataframe"""
+        columns = ['layer', 'wall_time_s', 'cpu_time_s', 'rows_in', 'rows_out', 'api_calls']
+        return pd.DataFrame([{col: record[col] for col in columns} for record in self.layers], columns=columns)
+
+    def to_json(self, indent=None):
+        return json.dumps(self.to_dict(), indent=indent, ensure_ascii=False, default=str)
+
+    def dump_json(self, path):
+        """Append the report as one JSON line so repeated batch runs build a history"""
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write(self.to_json() + '\n')
+        return path
@@ -0,0 +1,139 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import googlemaps
+
+from component.snap_cache import get_default_snap_cache
+from component.rate_limit import TokenBucket
+
+# Google Roads API limits used by Layer 3; adjust to the project's quota
+ROADS_API_QUOTA = {
+    "max_points_per_request": 100,   # hard limit of snapToRoads
+    "overlap_points": 10,            # points shared by neighbouring batches so segments join cleanly
+    "requests_per_second": 50,       # token bucket refill rate (per process)
+    "burst": 10,                     # token bucket capacity
+    "max_concurrent_requests": 8,    # thread pool size
+    "max_requests_per_route": 500,   # above this the trace is sampled down to fit
+}
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def _get_rate_limiter(quota):
+    """One bucket per (rate, burst) per process, shared by every route cleaned in it"""
+    key = (quota["requests_per_second"], quota["burst"])
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            _rate_limiters[key] = TokenBucket(*key)
+        return _rate_limiters[key]
+
+
+def plan_batches(n_points, batch_size, overlap):
+    """Start/end indices of overlapping batches covering n_points"""
+    if n_points <= batch_size:
+        return [(0, n_points)]
+    step = batch_size - overlap
+    starts = list(range(0, n_points - overlap, step))
+    return [(start, min(start + batch_size, n_points)) for start in starts]
+
+
+def _stitch(batches, results, overlap):
+    """
+    Join per-batch responses into one list of snapped points.
+
+    Every snapped point is assigned to the original input point before it
+    (interpolated points carry no originalIndex). Neighbouring batches are cut
+    in the middle of their overlap, so each road segment appears exactly once.
+    """
+    snapped_points = []
+    for k, ((start, _), result) in enumerate(zip(batches, results)):
+        lower = start + overlap // 2 if k > 0 else -np.inf
+        upper = batches[k + 1][0] + overlap // 2 if k + 1 < len(batches) else np.inf
+
+        segment = start - 0.5
+        for point in result:
+            original_index = None
+            if 'originalIndex' in point:
+                original_index = start + point['originalIndex']
+                segment = original_index
+            if lower <= segment < upper:
+                snapped_points.append({
+                    'latitude': point['location']['latitude'],
+                    'longitude': point['location']['longitude'],
+                    'original_index': original_index,
+                })
+    return snapped_points
+
+
+def snap_path_to_roads(path, google_api_key=None, interpolate=True, snap_cache=None, layer=None, quota=None):
+    """
+    Snap [lat, lng] points to roads with the Google Roads API at full resolution.
+
+    The path is split into overlapping batches that are submitted concurrently
+    through a bounded thread pool and a shared token-bucket rate limiter; each
+    batch is looked up in the snap cache first. Returned points carry the index
+    of the input point they were snapped from (None for interpolated points).
+    """
+    quota = {**ROADS_API_QUOTA, **(quota or {})}
+    cache = get_default_snap_cache() if snap_cache is None else snap_cache
+    batch_size = quota["max_points_per_request"]
+    overlap = quota["overlap_points"]
+
+    index = np.arange(len(path))
+    batches = plan_batches(len(path), batch_size, overlap)
+    if len(batches) > quota["max_requests_per_route"]:
+        max_points = quota["max_requests_per_route"] * (batch_size - overlap) + overlap
+        logging.info(f"Too many points ({len(path)}) for the per-route request quota, sampling down to {max_points}")
+        index = np.linspace(0, len(path) - 1, max_points, dtype=int)
+        path = [path[i] for i in index]
+        batches = plan_batches(len(path), batch_size, overlap)
+
+    limiter = _get_rate_limiter(quota)
+    clients = threading.local()
+    counters = {'hits': 0, 'misses': 0}
+    counters_lock = threading.Lock()
+
+    def snap_batch(bounds):
+        batch = path[bounds[0]:bounds[1]]
+        result = cache.get(batch, interpolate) if cache else None
+        if result is not None:
+            with counters_lock:
+                counters['hits'] += 1
+            return result
+
+        if not google_api_key:
+            logging.error("Google Maps API key is required for map matching")
+            raise ValueError("Google Maps API key is required but not provided")
+        if not hasattr(clients, 'gmaps'):
+            # One client (and HTTP session) per thread
+            clients.gmaps = googlemaps.Client(key=google_api_key, queries_per_second=quota["requests_per_second"])
+
+        limiter.acquire()
+        logging.info(f"Sending {len(batch)} points to Google Maps Roads API")
+        result = clients.gmaps.snap_to_roads(batch, interpolate=interpolate)
+        with counters_lock:
+            counters['misses'] += 1
+        if cache:
+            cache.put(batch, interpolate, result)
+        return result
+
+    with ThreadPoolExecutor(max_workers=quota["max_concurrent_requests"]) as executor:
+        results = list(executor.map(snap_batch, batches))
+
+    snapped_points = _stitch(batches, results, overlap)
+    # Map indices back to the caller's path when the trace was sampled
+    for point in snapped_points:
+        if point['original_index'] is not None:
+            point['original_index'] = int(index[point['original_index']])
+
+    logging.info(f"Snapped {len(path)} points in {len(batches)} batches "
+                 f"({counters['hits']} cached, {counters['misses']} API calls)")
+    if layer is not None:
+        layer['api_calls'] += counters['misses']
+        layer['details'].update(snap_cache_hits=counters['hits'], snap_cache_misses=counters['misses'],
+                                snap_batches=len(batches), snap_points_sent=len(path))
+    return snapped_points
@@ -0,0 +1,180 @@
+"""
+Per-driver route index.
+
+Every driver document <database>/<driver_id> holds all of the driver's raw GPS
+routes, so reading it just to list route names downloads megabytes. The index is
+a subcollection with one small document per route:
+
+    <database>/<driver_id>/route_index/<route_name>
+        route_name, route_date ("YYYY-MM-DD" or None), point_count,
+        has_processed, has_estimated, updated_at
+
+Processed/estimated writes from the dashboard and the batch cleaner set the
+flags; raw routes are added by the backfill:
+
+    python -m component.route_index --database real_database_01 [--driver ID] [--changed-only]
+
+--changed-only skips drivers whose document has not changed since their last
+backfill (recorded in route_index/_meta), so it can run on a schedule to pick up
+new routes uploaded by the app.
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+
+from component.route_naming import FILTERED_SUFFIX, ESTIMATED_SUFFIX, route_date
+
+ROUTE_INDEX_COLLECTION = "route_index"
+META_DOCUMENT = "_meta"
+GET_ALL_CHUNK_SIZE = 100
+
+
+def route_index_collection(db, database, driver_id):
+    return db.collection(database).document(driver_id).collection(ROUTE_INDEX_COLLECTION)
+
+
+def route_point_count(route_data):
+    if isinstance(route_data, dict):
+        route_data = route_data.get("route_data", [])
+    return sum(1 for item in route_data or []
+               if isinstance(item, dict) and "latitude" in item and "longitude" in item)
+
+
+def route_index_fields(route_name, **fields):
+    """Index document fields of a route; pass point_count/has_processed/has_estimated to set them"""
+    from firebase_admin import firestore
+
+    date = route_date(route_name)
+    return {
+        "route_name": route_name,
+        "route_date": date.isoformat() if date else None,
+        **fields,
+        "updated_at": firestore.SERVER_TIMESTAMP,
+    }
+
+
+def mark_route(db, database, driver_id, route_name, **flags):
+    """Merge flags (e.g. has_processed=True) into the index entry of one route"""
+    route_index_collection(db, database, driver_id).document(route_name).set(
+        route_index_fields(route_name, **flags), merge=True)
+
+
+def list_routes(db, database, driver_id, start_date=None, end_date=None, limit=None, start_after=None,
+                descending=False):
+    """
+    Index entries of a driver ordered by route date (then name), optionally within
+    [start_date, end_date]. Page with limit and start_after=<last entry of the previous page>.
+    """
+    from firebase_admin import firestore
+
+    query = route_index_collection(db, database, driver_id)
+    if start_date is not None:
+        query = query.where(filter=firestore.FieldFilter("route_date", ">=", start_date.isoformat()))
+    if end_date is not None:
+        query = query.where(filter=firestore.FieldFilter("route_date", "<=", end_date.isoformat()))
+    direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+    query = query.order_by("route_date", direction=direction).order_by("__name__", direction=direction)
+    if start_after is not None:
+        query = query.start_after({"route_date": start_after["route_date"], "__name__": start_after["route_name"]})
+    if limit is not None:
+        query = query.limit(limit)
+    return [snapshot.to_dict() for snapshot in query.stream()]
+
+
+def _existing_ids(db, collection_ref, doc_ids):
+    """Ids among doc_ids that exist, read with an empty field mask in get_all chunks"""
+    existing = set()
+    for i in range(0, len(doc_ids), GET_ALL_CHUNK_SIZE):
+        refs = [collection_ref.document(doc_id) for doc_id in doc_ids[i:i + GET_ALL_CHUNK_SIZE]]
+        for snapshot in db.get_all(refs, field_paths=[]):
+            if snapshot.exists:
+                existing.add(snapshot.id)
+    return existing
+
+
+def build_driver_index(db, database, driver_id, routes, collections, source_update_time=None):
+    """
+    (Re)write the index of one driver from its routes dict; entries of routes that no
+    longer exist are deleted. Returns the number of indexed routes.
+    """
+    route_names = list(routes)
+    processed = _existing_ids(db, db.collection(collections["processed"]),
+                              [name + FILTERED_SUFFIX for name in route_names])
+    estimated = _existing_ids(db, db.collection(collections["estimated"]),
+                              [name + ESTIMATED_SUFFIX for name in route_names])
+
+    index_ref = route_index_collection(db, database, driver_id)
+    batch = db.batch()
+    pending = 0
+    stale = {ref.id for ref in index_ref.list_documents()} - set(route_names) - {META_DOCUMENT}
+    for doc_id in stale:
+        batch.delete(index_ref.document(doc_id))
+        pending += 1
+    for route_name in route_names:
+        batch.set(index_ref.document(route_name), route_index_fields(
+            route_name,
+            point_count=route_point_count(routes[route_name]),
+            has_processed=route_name + FILTERED_SUFFIX in processed,
+            has_estimated=route_name + ESTIMATED_SUFFIX in estimated,
+        ))
+        pending += 1
+        # Firestore batches take at most 500 writes
+        if pending >= 450:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    batch.set(index_ref.document(META_DOCUMENT), {"source_update_time": source_update_time,
+                                                 "route_count": len(route_names)})
+    batch.commit()
+    return len(route_names)
+
+
+def backfill_route_index(db, database, collections, driver_ids=None, changed_only=False):
+    """Build the route index of every (or the given) driver of `database`; returns a summary"""
+    summary = {"database": database, "drivers": 0, "skipped": 0, "routes": 0}
+    start = time.perf_counter()
+    drivers_ref = db.collection(database)
+
+    if driver_ids is None:
+        # Empty field mask: ids and update times only
+        snapshots = drivers_ref.select([]).stream()
+    else:
+        snapshots = db.get_all([drivers_ref.document(driver_id) for driver_id in driver_ids], field_paths=[])
+    update_times = {snapshot.id: snapshot.update_time.isoformat() for snapshot in snapshots if snapshot.exists}
+
+    for driver_id, update_time in update_times.items():
+        if changed_only:
+            meta = route_index_collection(db, database, driver_id).document(META_DOCUMENT).get()
+            if meta.exists and meta.get("source_update_time") == update_time:
+                summary["skipped"] += 1
+                continue
+        routes = drivers_ref.document(driver_id).get().to_dict() or {}
+        summary["routes"] += build_driver_index(db, database, driver_id, routes, collections, update_time)
+        summary["drivers"] += 1
+        logging.info("Indexed %d routes of %s/%s", len(routes), database, driver_id)
+
+    summary["elapsed_s"] = round(time.perf_counter() - start, 2)
+    return summary
+
+
+def main(argv=None):
+    from component.route_repository import DATABASE_COLLECTIONS, init_firebase
+
+    parser = argparse.ArgumentParser(description="Build the per-driver route index")
+    parser.add_argument("--database", default="real_database_01", choices=list(DATABASE_COLLECTIONS))
+    parser.add_argument("--driver", action="append", help="only this driver (repeatable)")
+    parser.add_argument("--changed-only", action="store_true",
+                        help="skip drivers whose document has not changed since the last backfill")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    summary = backfill_route_index(init_firebase(), args.database, DATABASE_COLLECTIONS[args.database],
+                                   driver_ids=args.driver, changed_only=args.changed_only)
+    print(json.dumps(summary))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
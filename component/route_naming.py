@@ -0,0 +1,33 @@
+"""
+Route and document naming.
+
+Routes are named Route_{userID}_{ddmmyyyy}_{no of route of that date}; the processed
+and estimated documents append a suffix to the route name.
+"""
+import re
+import datetime
+
+FILTERED_SUFFIX = "_filtered_version"
+ESTIMATED_SUFFIX = "_estimated_result_version"
+
+ROUTE_NAME_PATTERN = re.compile(r'Route_[^_]+_(\d{8})_\d+')
+ROUTE_DATE_FORMAT = '%d%m%Y'
+
+
+def base_route_name(doc_id):
+    """Route name of a raw, processed or estimated document id"""
+    for suffix in (FILTERED_SUFFIX, ESTIMATED_SUFFIX):
+        if doc_id.endswith(suffix):
+            return doc_id[:-len(suffix)]
+    return doc_id
+
+
+def route_date(name):
+    """datetime.date encoded in a route name or document id, None if it does not follow the pattern"""
+    match = ROUTE_NAME_PATTERN.match(name)
+    if not match:
+        return None
+    try:
+        return datetime.datetime.strptime(match.group(1), ROUTE_DATE_FORMAT).date()
+    except ValueError:
+        return None
@@ -0,0 +1,379 @@
+"""
+Data access for driver routes.
+
+RouteRepository owns the Firestore client and the collection names of a driver
+database. Create one per request (one Streamlit rerun): every document read is
+memoized for the lifetime of the repository, so a page that needs the same
+processed route twice reads it once, and the processed/estimated/details
+documents of a route are fetched together with one db.get_all call.
+
+While the local Parquet store (component.route_store) is fresh, reads are served
+from it and Firestore is only asked for what the store does not have.
+"""
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from component.route_naming import FILTERED_SUFFIX, ESTIMATED_SUFFIX, base_route_name
+from component.route_index import (route_index_collection, list_routes, build_driver_index, mark_route,
+                                   META_DOCUMENT)
+from component.route_store import sync_route_store
+from component.estimated_results import estimated_result_fields, invalidate_period_summaries
+from component.emission_rollups import update_rollups
+
+# Collections that belong to each driver database; the database collection itself
+# holds one document per driver with every raw route as a field
+DATABASE_COLLECTIONS = {
+    "real_database_01": {
+        "routes": "real_routes_detail_01",
+        "processed": "real_processed_routes_ricky",
+        "estimated": "real_estimated_result",
+    },
+    "test_database_02": {
+        "routes": "test_routes_detail_02",
+        "processed": "processed_routes",
+        "estimated": "estimated_result",
+    },
+    "test_database_01": {
+        "routes": "test_routes_detail_01",
+        "processed": "processed_routes",
+        "estimated": "estimated_result",
+    },
+}
+
+DRIVER_NAME_COLLECTION = "Driver_Name"
+GET_ALL_CHUNK_SIZE = 100
+# Bulk processed-route loading: processed documents are large, so fetch them in small
+# get_all chunks with a bounded number of concurrent requests
+PROCESSED_CHUNK_SIZE = 20
+FETCH_WORKERS = 4
+# How long the driver directory (ids and display names) is reused across requests
+DRIVER_DIRECTORY_TTL_SECONDS = 300
+
+# (database, id(client)) -> (loaded at, {driver_id: display name})
+_driver_directory_cache = {}
+_driver_directory_lock = threading.Lock()
+
+
+def _firebase_credentials():
+    from firebase_admin import credentials
+
+    try:
+        # Use Streamlit secrets if available
+        import streamlit as st
+        firebase_secrets = st.secrets["firebase"]
+
+        # Convert secrets to the format expected by Firebase Admin SDK
+        firebase_creds = {
+            "type": firebase_secrets["type"],
+            "project_id": firebase_secrets["project_id"],
+            "private_key_id": firebase_secrets["private_key_id"],
+            "private_key": firebase_secrets["private_key"],
+            "client_email": firebase_secrets["client_email"],
+            "client_id": firebase_secrets["client_id"],
+            "auth_uri": firebase_secrets["auth_uri"],
+            "token_uri": firebase_secrets["token_uri"],
+            "auth_provider_x509_cert_url": firebase_secrets["auth_provider_x509_cert_url"],
+            "client_x509_cert_url": firebase_secrets["client_x509_cert_url"],
+            "universe_domain": firebase_secrets["universe_domain"]
+        }
+        return credentials.Certificate(firebase_creds)
+    except (ImportError, KeyError, AttributeError, FileNotFoundError):
+        # Fallback to file-based credentials (also when running outside Streamlit without secrets.toml)
+        return credentials.Certificate('fyp-gps.json')
+
+
+# Initialize Firebase if not already initialized
+def init_firebase():
+    import firebase_admin
+    from firebase_admin import firestore
+
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(_firebase_credentials())
+
+    return firestore.client()
+
+
+class RouteRepository:
+    """Memoized, batched reads and writes of the routes of one driver database"""
+
+    def __init__(self, database, db=None, store=None):
+        self.database = database
+        self.collections = DATABASE_COLLECTIONS[database]
+        self._db = db
+        # The store is only used if it was synced recently enough
+        self.store = store if store is not None and store.is_fresh(database) else None
+        self._memo = {}
+        self.reads = 0
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = init_firebase()
+        return self._db
+
+    def _collection_name(self, kind):
+        if kind == "drivers":
+            return self.database
+        if kind == "driver_name":
+            return DRIVER_NAME_COLLECTION
+        return self.collections[kind]
+
+    # Reads
+
+    def _get(self, kind, doc_id):
+        """Memoized document read; None if the document does not exist"""
+        key = (kind, doc_id)
+        if key not in self._memo:
+            self.reads += 1
+            snapshot = self.db.collection(self._collection_name(kind)).document(doc_id).get()
+            self._memo[key] = snapshot.to_dict() if snapshot.exists else None
+        return self._memo[key]
+
+    def _get_many(self, keys):
+        """Memoized read of many (kind, doc_id) documents with batched db.get_all calls"""
+        missing = [key for key in dict.fromkeys(keys) if key not in self._memo]
+        for i in range(0, len(missing), GET_ALL_CHUNK_SIZE):
+            chunk = missing[i:i + GET_ALL_CHUNK_SIZE]
+            refs = [self.db.collection(self._collection_name(kind)).document(doc_id) for kind, doc_id in chunk]
+            keys_by_path = {ref.path: key for ref, key in zip(refs, chunk)}
+            self.reads += len(chunk)
+            # get_all does not keep the order of the references
+            for snapshot in self.db.get_all(refs):
+                self._memo[keys_by_path[snapshot.reference.path]] = snapshot.to_dict() if snapshot.exists else None
+        return {key: self._memo.get(key) for key in keys}
+
+    def driver_ids(self):
+        """Ids of the driver documents, listed without downloading their routes"""
+        if self.store is not None:
+            return self.store.driver_ids(self.database)
+        # Empty field mask; list_documents() would also return deleted drivers whose
+        # route_index subcollection is left
+        driver_ids = [snapshot.id for snapshot in self.db.collection(self.database).select([]).stream()]
+        self.reads += len(driver_ids)
+        return driver_ids
+
+    def driver_names(self, driver_ids):
+        """{driver_id: display name} from the Driver_Name collection with batched get_all calls"""
+        documents = self._get_many([("driver_name", driver_id) for driver_id in driver_ids])
+        return {driver_id: (documents[("driver_name", driver_id)] or {}).get("displayName", driver_id)
+                for driver_id in driver_ids}
+
+    def driver_name(self, driver_id):
+        """Display name from the Driver_Name collection, the driver id if there is none"""
+        return self.driver_names([driver_id])[driver_id]
+
+    def driver_directory(self, ttl_seconds=DRIVER_DIRECTORY_TTL_SECONDS):
+        """
+        {driver_id: display name} of every driver of the database. The result is shared
+        by all requests of the process for ttl_seconds, so reruns do not list the drivers again.
+        """
+        key = (self.database, id(self.db))
+        with _driver_directory_lock:
+            cached = _driver_directory_cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < ttl_seconds:
+            return dict(cached[1])
+
+        directory = self.driver_names(self.driver_ids())
+        with _driver_directory_lock:
+            _driver_directory_cache[key] = (time.monotonic(), directory)
+        return dict(directory)
+
+    def _ensure_route_index(self, driver_id):
+        """
+        False if the driver does not exist. The index is checked against the update time of
+        the driver document (read without its fields) and rebuilt if routes were added since.
+        """
+        key = ("route_index", driver_id)
+        if key not in self._memo:
+            self.reads += 2
+            driver = self.db.collection(self.database).document(driver_id).get(field_paths=[])
+            if not driver.exists:
+                self._memo[key] = False
+                return False
+            update_time = driver.update_time.isoformat()
+            meta = route_index_collection(self.db, self.database, driver_id).document(META_DOCUMENT).get()
+            if not meta.exists or meta.get("source_update_time") != update_time:
+                build_driver_index(self.db, self.database, driver_id, self._get("drivers", driver_id) or {},
+                                   self.collections, update_time)
+            self._memo[key] = True
+        return self._memo[key]
+
+    def list_routes(self, driver_id, start_date=None, end_date=None, limit=None, start_after=None,
+                    descending=False):
+        """
+        Route index entries of a driver (route_name, route_date, point_count, has_processed,
+        has_estimated) by date, optionally within [start_date, end_date]; page with limit and
+        start_after=<last entry of the previous page>. None if the driver does not exist.
+        """
+        if not self._ensure_route_index(driver_id):
+            return None
+        entries = list_routes(self.db, self.database, driver_id, start_date, end_date, limit, start_after,
+                              descending)
+        self.reads += len(entries)
+        return entries
+
+    def route_names(self, driver_id):
+        """Route names of a driver, None if the driver document does not exist"""
+        if self.store is not None:
+            names = self.store.route_names(self.database, driver_id)
+            if names:
+                return names
+        entries = self.list_routes(driver_id)
+        return [entry["route_name"] for entry in entries] if entries is not None else None
+
+    def raw_route(self, driver_id, route_name):
+        """Raw route (list of points or dict with route_data), None if it does not exist"""
+        key = ("raw", driver_id, route_name)
+        if self.store is not None and key not in self._memo:
+            self._memo[key] = self.store.raw_route(self.database, driver_id, route_name)
+        if self._memo.get(key) is not None:
+            return self._memo[key]
+        document = self._get("drivers", driver_id)
+        return document.get(route_name) if document is not None else None
+
+    def _from_store(self, kind, route_name):
+        """Memoize the store copy of a processed/estimated document; False if the store does not have it"""
+        if self.store is None or kind == "routes":
+            return False
+        read = self.store.processed_route if kind == "processed" else self.store.estimated_result
+        document = read(self.database, route_name)
+        if document is None:
+            return False
+        self._memo[(kind, self._doc_id(kind, route_name))] = document
+        return True
+
+    def _route_document(self, kind, route_name):
+        route_name = base_route_name(route_name)
+        key = (kind, self._doc_id(kind, route_name))
+        if key not in self._memo:
+            self._from_store(kind, route_name)
+        return self._get(*key)
+
+    @staticmethod
+    def _doc_id(kind, route_name):
+        return route_name + {"processed": FILTERED_SUFFIX, "estimated": ESTIMATED_SUFFIX}.get(kind, "")
+
+    def processed_route(self, route_name):
+        """<route>_filtered_version document (route name with or without the suffix), None if missing"""
+        return self._route_document("processed", route_name)
+
+    def estimated_result(self, route_name):
+        return self._route_document("estimated", route_name)
+
+    def route_details(self, route_name):
+        return self._route_document("routes", route_name)
+
+    def prefetch_routes(self, route_names, kinds=("processed", "estimated", "routes")):
+        """Fetch the related documents of many routes together; later reads are memo hits"""
+        keys = []
+        for route_name in route_names:
+            route_name = base_route_name(route_name)
+            for kind in kinds:
+                key = (kind, self._doc_id(kind, route_name))
+                if key not in self._memo and not self._from_store(kind, route_name):
+                    keys.append(key)
+        self._get_many(keys)
+
+    def iter_processed_routes(self, route_names, chunk_size=PROCESSED_CHUNK_SIZE, max_workers=FETCH_WORKERS):
+        """
+        Yield (route_name, processed document or None) for many routes: memo and store hits
+        first, then the rest in the order of route_names, from get_all chunks fetched by a
+        bounded thread pool. At most max_workers chunks are fetched ahead of the consumer and
+        fetched documents are not memoized, so a month of routes is not held in memory.
+        """
+        missing = []
+        for route_name in dict.fromkeys(base_route_name(name) for name in route_names):
+            key = ("processed", self._doc_id("processed", route_name))
+            if key in self._memo:
+                yield route_name, self._memo[key]
+                continue
+            document = self.store.processed_route(self.database, route_name) if self.store is not None else None
+            if document is not None:
+                yield route_name, document
+            else:
+                missing.append(route_name)
+        if not missing:
+            return
+
+        collection = self.db.collection(self.collections["processed"])
+
+        def fetch(chunk):
+            refs = [collection.document(self._doc_id("processed", route_name)) for route_name in chunk]
+            # get_all does not keep the order of the references
+            documents = {base_route_name(snapshot.id): snapshot.to_dict() if snapshot.exists else None
+                         for snapshot in self.db.get_all(refs)}
+            return [(route_name, documents.get(route_name)) for route_name in chunk]
+
+        chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+        self.reads += len(missing)
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(fetch, chunk))
+                if len(pending) > max_workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+
+    def route_bundle(self, route_name):
+        """processed, estimated and details documents of one route with a single batched read"""
+        self.prefetch_routes([route_name])
+        return {
+            "processed": self.processed_route(route_name),
+            "estimated": self.estimated_result(route_name),
+            "details": self.route_details(route_name),
+        }
+
+    # Writes
+
+    def _save(self, kind, route_name, document, driver_id=None):
+        from firebase_admin import firestore
+
+        route_name = base_route_name(route_name)
+        doc_id = self._doc_id(kind, route_name)
+        document = dict(document)
+        if kind == "estimated":
+            # Date and driver make the result reachable by period range queries
+            document.update(estimated_result_fields(route_name, driver_id))
+        document["timestamp"] = firestore.SERVER_TIMESTAMP
+        result_ref = self.db.collection(self._collection_name(kind)).document(doc_id)
+        if kind == "estimated":
+            # The result and its day rollup entry are written in one transaction
+            update_rollups(self.db, self.collections["estimated"], route_name, document, driver_id,
+                           result_ref=result_ref)
+            invalidate_period_summaries(self.collections["estimated"])
+        else:
+            result_ref.set(document)
+        self._memo[(kind, doc_id)] = {key: value for key, value in document.items() if key != "timestamp"}
+        if self.store is not None:
+            self.store.store_document(self.database, kind, doc_id, document)
+        if driver_id is not None:
+            mark_route(self.db, self.database, driver_id, route_name, **{f"has_{kind}": True})
+        return doc_id
+
+    def save_processed_route(self, route_name, document, driver_id=None):
+        """Write <route>_filtered_version (with a server timestamp) and flag it in the driver's route index"""
+        return self._save("processed", route_name, document, driver_id)
+
+    def save_estimated_result(self, route_name, document, driver_id=None):
+        """
+        Write <route>_estimated_result_version (with a server timestamp), flag it in the route
+        index and add it to the daily emission rollups
+        """
+        return self._save("estimated", route_name, document, driver_id)
+
+    def invalidate_driver_directory(self):
+        with _driver_directory_lock:
+            _driver_directory_cache.pop((self.database, id(self.db)), None)
+
+    def sync_store(self, store):
+        """Incremental sync of the local store with this database"""
+        summary = sync_route_store(self.db, self.database, {kind: self.collections[kind]
+                                                           for kind in ("processed", "estimated")}, store)
+        self.store = store
+        if summary["raw"]["fetched"] or summary["raw"]["removed"]:
+            self.invalidate_driver_directory()
+        return summary
+
@@ -0,0 +1,453 @@
+"""
+Local Parquet store of raw routes, processed routes and estimated results.
+
+Layout (one file per partition):
+    <root>/<database>/<table>/driver_id=<id>/date=<YYYY-MM-DD>/part.parquet
+    <root>/<database>/_manifest.json
+
+Tables:
+    raw_points         route_name, point_index, latitude, longitude
+    processed_points   route_name, point_index, latitude, longitude
+    processed_routes   route_name + the scalar fields of <route>_filtered_version
+    estimated_results  route_name + the scalar fields of <route>_estimated_result_version
+
+Incremental sync:
+    python -m component.route_store --database real_database_01
+
+Every collection is listed with an empty field mask (document ids and update
+times only, no GPS arrays); only documents whose update time differs from the
+manifest are fetched, and only the partitions they touch are rewritten.
+Documents that disappeared from Firestore are removed from the store.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import datetime
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from component.route_encoding import route_coordinate_arrays, encoded_coordinates_fields
+from component.route_naming import base_route_name, route_date
+
+DEFAULT_ROUTE_STORE_DIR = os.environ.get("ROUTE_STORE_DIR", os.path.join("cache", "route_store"))
+# The dashboard reads the local store only if it was synced within this many seconds
+DEFAULT_MAX_AGE_SECONDS = 15 * 60
+
+UNKNOWN_DRIVER = "_unknown"
+UNKNOWN_DATE = "unknown"
+PARTITION_FILE = "part.parquet"
+MANIFEST_FILE = "_manifest.json"
+
+# Document kind -> Parquet tables written from it
+KIND_TABLES = {
+    "raw": ["raw_points"],
+    "processed": ["processed_points", "processed_routes"],
+    "estimated": ["estimated_results"],
+}
+
+POINT_SCHEMA = pa.schema([
+    ("route_name", pa.string()),
+    ("point_index", pa.int32()),
+    ("latitude", pa.float64()),
+    ("longitude", pa.float64()),
+])
+
+GET_ALL_CHUNK_SIZE = {"raw": 10, "processed": 50, "estimated": 100}
+
+
+def _raw_points(route_data):
+    """Raw route (list or dict with route_data) -> (lat, lon) arrays of the points with coordinates"""
+    if isinstance(route_data, dict):
+        route_data = route_data.get("route_data", [])
+    points = [item for item in route_data or []
+              if isinstance(item, dict) and "latitude" in item and "longitude" in item]
+    lat = np.fromiter((item["latitude"] for item in points), dtype=float, count=len(points))
+    lon = np.fromiter((item["longitude"] for item in points), dtype=float, count=len(points))
+    return lat, lon
+
+
+def _points_frame(route_name, lat, lon):
+    return pd.DataFrame({
+        "route_name": route_name,
+        "point_index": np.arange(len(lat), dtype=np.int32),
+        "latitude": lat,
+        "longitude": lon,
+    })
+
+
+def _scalar_fields(document):
+    """Document fields that fit a Parquet column; lists and maps are kept as JSON text"""
+    row = {}
+    for key, value in document.items():
+        if key.startswith("coordinates"):
+            continue
+        if value is None or isinstance(value, (bool, int, float, str, datetime.datetime)):
+            row[key] = value
+        elif isinstance(value, (list, dict)):
+            row[key] = json.dumps(value, ensure_ascii=False, default=str)
+        # Anything else (e.g. a SERVER_TIMESTAMP sentinel) is not stored
+    return row
+
+
+def _row_document(frame):
+    """First row of a document table as a plain dict, without route_name and missing fields"""
+    document = {}
+    for key, value in frame.iloc[0].items():
+        if key == "route_name" or (isinstance(value, float) and np.isnan(value)) or value is pd.NaT:
+            continue
+        document[key] = value.item() if isinstance(value, np.generic) else value
+    return document
+
+
+def _timestamp(value):
+    return value.isoformat() if value is not None else None
+
+
+class RouteStore:
+    """Partitioned Parquet copy of one or more driver databases"""
+
+    def __init__(self, root=DEFAULT_ROUTE_STORE_DIR):
+        self.root = root
+        self._manifests = {}
+
+    # Manifest
+
+    def _manifest_path(self, database):
+        return os.path.join(self.root, database, MANIFEST_FILE)
+
+    def manifest(self, database):
+        """Sync state of `database`: last sync time, per-document update times and the route index"""
+        path = self._manifest_path(database)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return {"last_sync": None, "documents": {kind: {} for kind in KIND_TABLES},
+                    "routes": {}, "drivers": {}}
+        cached = self._manifests.get(database)
+        if cached is None or cached[0] != mtime:
+            with open(path, "r", encoding="utf-8") as file:
+                cached = (mtime, json.load(file))
+            self._manifests[database] = cached
+        return cached[1]
+
+    def _save_manifest(self, database, manifest):
+        path = self._manifest_path(database)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so a dashboard reading at the same time never sees half a file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._manifests.pop(database, None)
+
+    def last_sync(self, database):
+        value = self.manifest(database).get("last_sync")
+        return datetime.datetime.fromisoformat(value) if value else None
+
+    def is_fresh(self, database, max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
+        last_sync = self.last_sync(database)
+        if last_sync is None:
+            return False
+        age = datetime.datetime.now(datetime.timezone.utc) - last_sync
+        return age.total_seconds() <= max_age_seconds
+
+    # Partitions
+
+    def _partition_path(self, database, table, driver_id, date):
+        return os.path.join(self.root, database, table, f"driver_id={quote(driver_id, safe='')}",
+                            f"date={date}", PARTITION_FILE)
+
+    def _partition_paths(self, database, table, date=None):
+        """Partition files of `table`, optionally only the ones of one date (any driver)"""
+        table_dir = os.path.join(self.root, database, table)
+        if not os.path.isdir(table_dir):
+            return []
+        paths = []
+        for driver_dir in sorted(os.listdir(table_dir)):
+            driver_path = os.path.join(table_dir, driver_dir)
+            dates = [f"date={date}"] if date else sorted(os.listdir(driver_path))
+            for date_dir in dates:
+                path = os.path.join(driver_path, date_dir, PARTITION_FILE)
+                if os.path.exists(path):
+                    paths.append(path)
+        return paths
+
+    def _read_partition(self, path, route_name=None, columns=None):
+        filters = [("route_name", "==", route_name)] if route_name is not None else None
+        try:
+            return pq.read_table(path, columns=columns, filters=filters).to_pandas()
+        except FileNotFoundError:
+            return pd.DataFrame()
+
+    def _write_partition(self, path, frame, schema=None):
+        if frame.empty:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+
+    def _replace_routes(self, database, table, driver_id, date, route_names, frame):
+        """Rewrite one partition with the rows of `route_names` replaced by `frame`"""
+        path = self._partition_path(database, table, driver_id, date)
+        existing = self._read_partition(path)
+        if not existing.empty:
+            existing = existing[~existing["route_name"].isin(route_names)]
+        parts = [part for part in (existing, frame) if part is not None and not part.empty]
+        merged = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+        if not merged.empty:
+            sort_by = ["route_name", "point_index"] if "point_index" in merged else ["route_name"]
+            merged = merged.sort_values(sort_by, ignore_index=True)
+        schema = POINT_SCHEMA if table.endswith("_points") else None
+        self._write_partition(path, merged, schema)
+
+    # Writes
+
+    def _route_location(self, manifest, route_name):
+        """(driver_id, date) partition of a route"""
+        driver_id, _ = manifest["routes"].get(route_name, (UNKNOWN_DRIVER, None))
+        date = route_date(route_name)
+        return driver_id, date.isoformat() if date else UNKNOWN_DATE
+
+    def _store_driver(self, database, manifest, driver_id, routes):
+        """Replace every raw route of one driver document"""
+        for route_name in manifest["drivers"].pop(driver_id, []):
+            manifest["routes"].pop(route_name, None)
+        driver_dir = os.path.dirname(os.path.dirname(
+            self._partition_path(database, "raw_points", driver_id, UNKNOWN_DATE)))
+        shutil.rmtree(driver_dir, ignore_errors=True)
+        if routes is None:
+            return 0
+
+        by_date = {}
+        for route_name, route_data in routes.items():
+            date = route_date(route_name)
+            date = date.isoformat() if date else UNKNOWN_DATE
+            lat, lon = _raw_points(route_data)
+            by_date.setdefault(date, []).append(_points_frame(route_name, lat, lon))
+            manifest["routes"][route_name] = [driver_id, date]
+        manifest["drivers"][driver_id] = list(routes.keys())
+
+        for date, frames in by_date.items():
+            frame = pd.concat(frames, ignore_index=True)
+            self._write_partition(self._partition_path(database, "raw_points", driver_id, date), frame, POINT_SCHEMA)
+        return len(routes)
+
+    def _store_route_documents(self, database, manifest, kind, documents):
+        """Upsert (document is a dict) or delete (document is None) processed/estimated documents"""
+        known = manifest["documents"][kind]
+        partitions = {}
+        for doc_id, document in documents.items():
+            route_name = base_route_name(doc_id)
+            locations = {self._route_location(manifest, route_name)}
+            if doc_id in known and known[doc_id][1] is not None:
+                locations.add((known[doc_id][1], known[doc_id][2]))
+            for location in locations:
+                partitions.setdefault(location, {})[route_name] = None
+            if document is not None:
+                partitions[self._route_location(manifest, route_name)][route_name] = document
+
+        for (driver_id, date), routes in partitions.items():
+            route_names = list(routes)
+            present = {name: document for name, document in routes.items() if document is not None}
+            for table in KIND_TABLES[kind]:
+                if table.endswith("_points"):
+                    frames = [_points_frame(name, *route_coordinate_arrays(document))
+                              for name, document in present.items()]
+                else:
+                    frames = [pd.DataFrame([{"route_name": name, **_scalar_fields(document)}])
+                              for name, document in present.items()]
+                frame = pd.concat(frames, ignore_index=True) if frames else None
+                self._replace_routes(database, table, driver_id, date, route_names, frame)
+
+    def store_document(self, database, kind, doc_id, document):
+        """
+        Write-through of a processed/estimated document the dashboard has just saved to
+        Firestore, so the store does not serve the old version until the next sync.
+        """
+        manifest = self.manifest(database)
+        if kind not in ("processed", "estimated") or manifest.get("last_sync") is None:
+            return
+        self._store_route_documents(database, manifest, kind, {doc_id: document})
+        driver_id, date = self._route_location(manifest, base_route_name(doc_id))
+        # No update time yet: the next sync fetches the document once more
+        manifest["documents"][kind][doc_id] = [None, driver_id, date]
+        self._save_manifest(database, manifest)
+
+    # Reads
+
+    def driver_ids(self, database):
+        return list(self.manifest(database)["drivers"])
+
+    def route_names(self, database, driver_id):
+        return list(self.manifest(database)["drivers"].get(driver_id, []))
+
+    def raw_route(self, database, driver_id, route_name):
+        """Raw route as [{'latitude': ..., 'longitude': ...}, ...], None if it is not in the store"""
+        location = self.manifest(database)["routes"].get(route_name)
+        if not location or location[0] != driver_id:
+            return None
+        frame = self._read_partition(self._partition_path(database, "raw_points", driver_id, location[1]),
+                                     route_name, columns=["point_index", "latitude", "longitude"])
+        if frame.empty:
+            return []
+        frame = frame.sort_values("point_index")
+        return [{"latitude": lat, "longitude": lon}
+                for lat, lon in zip(frame["latitude"].tolist(), frame["longitude"].tolist())]
+
+    def _route_rows(self, database, table, route_name, columns=None):
+        date = route_date(route_name)
+        frames = [self._read_partition(path, route_name, columns)
+                  for path in self._partition_paths(database, table, date.isoformat() if date else UNKNOWN_DATE)]
+        frames = [frame for frame in frames if not frame.empty]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def processed_route(self, database, route_name):
+        """Processed route document (compact coordinate format), None if it is not in the store"""
+        route_name = base_route_name(route_name)
+        meta = self._route_rows(database, "processed_routes", route_name)
+        if meta.empty:
+            return None
+        points = self._route_rows(database, "processed_points", route_name).sort_values("point_index")
+        document = _row_document(meta)
+        document.update(encoded_coordinates_fields(points["latitude"].to_numpy(), points["longitude"].to_numpy()))
+        return document
+
+    def estimated_result(self, database, route_name):
+        """Estimated result document, None if it is not in the store"""
+        rows = self._route_rows(database, "estimated_results", base_route_name(route_name))
+        if rows.empty:
+            return None
+        return _row_document(rows)
+
+    def estimated_results(self, database, start_date=None, end_date=None):
+        """All estimated results (one row per route), optionally within [start_date, end_date]"""
+        frames = []
+        for path in self._partition_paths(database, "estimated_results"):
+            date = os.path.basename(os.path.dirname(path))[len("date="):]
+            if start_date or end_date:
+                if date == UNKNOWN_DATE:
+                    continue
+                day = datetime.date.fromisoformat(date)
+                if (start_date and day < start_date) or (end_date and day > end_date):
+                    continue
+            frame = self._read_partition(path)
+            frame["driver_id"] = unquote(os.path.basename(os.path.dirname(os.path.dirname(path)))[len("driver_id="):])
+            frame["route_date"] = date
+            frames.append(frame)
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def _changed_documents(collection_ref, known):
+    """Ids and update times of documents added/changed since the manifest, plus the removed ids"""
+    # Empty field mask: only ids and update times come back, not the GPS arrays
+    current = {snapshot.id: _timestamp(snapshot.update_time) for snapshot in collection_ref.select([]).stream()}
+    changed = {doc_id: update_time for doc_id, update_time in current.items()
+               if doc_id not in known or known[doc_id][0] != update_time}
+    removed = [doc_id for doc_id in known if doc_id not in current]
+    return current, changed, removed
+
+
+def _fetch_documents(db, collection_ref, doc_ids, chunk_size):
+    """Yield (doc_id, dict or None) for `doc_ids`, fetched with batched get_all calls"""
+    for i in range(0, len(doc_ids), chunk_size):
+        refs = [collection_ref.document(doc_id) for doc_id in doc_ids[i:i + chunk_size]]
+        for snapshot in db.get_all(refs):
+            yield snapshot.id, snapshot.to_dict() if snapshot.exists else None
+
+
+def sync_route_store(db, database, collections, store=None):
+    """
+    Bring the local store of `database` up to date with Firestore.
+
+    `collections` maps "processed" and "estimated" to the collection names of the
+    database (the raw routes live in the database collection itself, one document
+    per driver). Returns a summary of the documents fetched and removed.
+    """
+    store = store or get_route_store()
+    manifest = store.manifest(database)
+    sync_started = datetime.datetime.now(datetime.timezone.utc)
+    summary = {"database": database}
+    start = time.perf_counter()
+
+    collection_names = {"raw": database, **collections}
+    # Raw routes first: they decide which driver partition a processed/estimated route goes to
+    for kind in ("raw", "processed", "estimated"):
+        collection_ref = db.collection(collection_names[kind])
+        known = manifest["documents"][kind]
+        current, changed, removed = _changed_documents(collection_ref, known)
+
+        if kind == "raw":
+            for driver_id in removed:
+                store._store_driver(database, manifest, driver_id, None)
+                known.pop(driver_id, None)
+            for driver_id, routes in _fetch_documents(db, collection_ref, list(changed), GET_ALL_CHUNK_SIZE[kind]):
+                store._store_driver(database, manifest, driver_id, routes)
+                known[driver_id] = [changed[driver_id], driver_id, None]
+        else:
+            # Routes stored before their driver document was synced are fetched again
+            # so they move to the right driver partition
+            for doc_id, entry in known.items():
+                location = store._route_location(manifest, base_route_name(doc_id))
+                if doc_id in current and doc_id not in changed and tuple(entry[1:]) != location:
+                    changed[doc_id] = current[doc_id]
+            documents = dict.fromkeys(removed)
+            documents.update(_fetch_documents(db, collection_ref, list(changed), GET_ALL_CHUNK_SIZE[kind]))
+            store._store_route_documents(database, manifest, kind, documents)
+            for doc_id, document in documents.items():
+                if document is None:
+                    known.pop(doc_id, None)
+                else:
+                    known[doc_id] = [changed[doc_id], *store._route_location(manifest, base_route_name(doc_id))]
+
+        summary[kind] = {"fetched": len(changed), "removed": len(removed), "documents": len(known)}
+        logging.info("Route store %s/%s: %d changed, %d removed", database, kind, len(changed), len(removed))
+
+    manifest["last_sync"] = sync_started.isoformat()
+    store._save_manifest(database, manifest)
+    summary["elapsed_s"] = round(time.perf_counter() - start, 2)
+    return summary
+
+
+_default_store = None
+
+
+def get_route_store():
+    """Process-wide store shared by the dashboard and the sync job"""
+    global _default_store
+    if _default_store is None:
+        _default_store = RouteStore()
+    return _default_store
+
+
+def main(argv=None):
+    from component.route_repository import DATABASE_COLLECTIONS, init_firebase
+
+    parser = argparse.ArgumentParser(description="Sync the local Parquet route store with Firestore")
+    parser.add_argument("--database", action="append", choices=list(DATABASE_COLLECTIONS),
+                        help="database to sync (repeatable, default: all)")
+    parser.add_argument("--root", default=DEFAULT_ROUTE_STORE_DIR, help="store directory")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    db = init_firebase()
+    store = RouteStore(args.root)
+    for database in args.database or list(DATABASE_COLLECTIONS):
+        collections = {kind: DATABASE_COLLECTIONS[database][kind] for kind in ("processed", "estimated")}
+        print(json.dumps(sync_route_store(db, database, collections, store)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Zoom-adaptive route simplification for period maps.
+
+A period map is a fixed-size image, so detail smaller than a pixel cannot be seen.
+Routes are projected to Web Mercator and simplified with a vectorized
+Douglas-Peucker whose tolerance is a fraction of a pixel at the scale the
+combined extent of all routes is drawn at. Fitting the map to the extent can only
+pick that scale or a coarser one, so the simplified map looks the same.
+
+Benchmark the folium period map with and without simplification:
+    python -m component.simplify [routes] [points per route]
+"""
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+
+from component.geometry import web_mercator
+
+# Size of the screenshot the PDF period map is taken from
+MAP_WIDTH_PX = 1920
+MAP_HEIGHT_PX = 1080
+PIXEL_TOLERANCE = 0.5
+
+
+def douglas_peucker_mask(x, y, tolerance, breaks=None):
+    """
+    Boolean mask of the points Douglas-Peucker keeps at `tolerance` (units of x/y).
+
+    All open segments are split at the same time: every iteration measures the
+    distance of every remaining point to the chord of its segment and keeps the
+    farthest point of each segment that is farther than the tolerance, so the
+    number of numpy passes is the recursion depth, not the number of kept points.
+    Points at the indices in `breaks` are always kept, which simplifies several
+    concatenated lines (break at the first and last point of each) in one call.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    keep = np.zeros(n, dtype=bool)
+    if n <= 2:
+        keep[:] = True
+        return keep
+    keep[0] = keep[-1] = True
+    if breaks is not None:
+        keep[np.asarray(breaks, dtype=int)] = True
+    pending = ~keep
+
+    while True:
+        idx = np.flatnonzero(pending)
+        if len(idx) == 0:
+            break
+        kept = np.flatnonzero(keep)
+        segment = np.searchsorted(kept, idx) - 1
+        a, b = kept[segment], kept[segment + 1]
+        dx, dy = x[b] - x[a], y[b] - y[a]
+        px, py = x[idx] - x[a], y[idx] - y[a]
+        chord = np.hypot(dx, dy)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # Distance to the chord line, or to its start when the chord is a single point
+            distance = np.where(chord > 0, np.abs(dx * py - dy * px) / chord, np.hypot(px, py))
+
+        # idx is sorted, so the points of a segment are contiguous
+        starts = np.flatnonzero(np.r_[True, segment[1:] != segment[:-1]])
+        segment_max = np.maximum.reduceat(distance, starts)
+        counts = np.diff(np.r_[starts, len(idx)])
+        split = segment_max > tolerance
+
+        # First farthest point of every segment that is split
+        is_max = (distance == np.repeat(segment_max, counts)) & np.repeat(split, counts)
+        max_positions = np.flatnonzero(is_max)
+        _, first = np.unique(segment[max_positions], return_index=True)
+        new_points = idx[max_positions[first]]
+        keep[new_points] = True
+        pending[new_points] = False
+        # Segments within the tolerance are done
+        pending[idx[~np.repeat(split, counts)]] = False
+    return keep
+
+
+def concatenated_mask(x, y, lengths, tolerance):
+    """Douglas-Peucker mask of several lines concatenated in x/y, simplified in one pass"""
+    lengths = np.asarray(lengths, dtype=int)
+    ends = np.cumsum(lengths)
+    non_empty = lengths > 0
+    breaks = np.r_[(ends - lengths)[non_empty], (ends - 1)[non_empty]]
+    return douglas_peucker_mask(x, y, tolerance, breaks=breaks)
+
+
+def map_tolerance(x, y, width_px=MAP_WIDTH_PX, height_px=MAP_HEIGHT_PX, pixel_tolerance=PIXEL_TOLERANCE):
+    """Tolerance in projected metres: pixel_tolerance pixels when x/y are fitted into width_px x height_px"""
+    metres_per_pixel = max((np.max(x) - np.min(x)) / width_px, (np.max(y) - np.min(y)) / height_px)
+    return pixel_tolerance * metres_per_pixel
+
+
+def simplify_routes(routes, width_px=MAP_WIDTH_PX, height_px=MAP_HEIGHT_PX, pixel_tolerance=PIXEL_TOLERANCE):
+    """
+    Simplify routes drawn together on one map.
+
+    routes is a list of (lat, lon) arrays; returns the simplified (lat, lon) arrays and
+    {points_before, points_after, tolerance_m}.
+    """
+    projected = [web_mercator(lat, lon) for lat, lon in routes]
+    stats = {"points_before": sum(len(x) for x, _ in projected), "points_after": 0, "tolerance_m": 0.0}
+    if stats["points_before"] == 0:
+        return [(np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)) for lat, lon in routes], stats
+
+    all_x = np.concatenate([x for x, _ in projected])
+    all_y = np.concatenate([y for _, y in projected])
+    tolerance = map_tolerance(all_x, all_y, width_px, height_px, pixel_tolerance)
+
+    keep = np.split(concatenated_mask(all_x, all_y, [len(x) for x, _ in projected], tolerance),
+                    np.cumsum([len(x) for x, _ in projected])[:-1])
+    simplified = []
+    for (lat, lon), route_keep in zip(routes, keep):
+        simplified.append((np.asarray(lat, dtype=float)[route_keep], np.asarray(lon, dtype=float)[route_keep]))
+        stats["points_after"] += int(route_keep.sum())
+    stats["tolerance_m"] = round(float(tolerance), 3)
+    return simplified, stats
+
+
+def reduce_route(lat, lon, width_px=MAP_WIDTH_PX, height_px=MAP_HEIGHT_PX, pixel_tolerance=PIXEL_TOLERANCE):
+    """
+    Simplify one route at the scale of a map of its own extent. A map of several routes is
+    drawn at that scale or a coarser one, so each route can be reduced as soon as it is
+    loaded and the routes simplified together once the combined extent is known.
+    """
+    (route,), _ = simplify_routes([(lat, lon)], width_px, height_px, pixel_tolerance)
+    return route
+
+
+def _folium_map(routes):
+    import folium
+
+    map_plot = folium.Map(zoom_start=10)
+    for lat, lon in routes:
+        folium.PolyLine(list(zip(lat.tolist(), lon.tolist())), weight=4).add_to(map_plot)
+    return map_plot
+
+
+def synthetic_routes(n_routes=300, n_points=2000, seed=0):
+    """(lat, lon) arrays of routes around Hong Kong for benchmarks"""
+    rng = np.random.default_rng(seed)
+    routes = []
+    for _ in range(n_routes):
+        # ~10 m steps with a slowly turning heading, like a GPS track along roads
+        heading = rng.uniform(0, 2 * np.pi) + np.cumsum(rng.normal(0, 0.05, n_points))
+        lat = 22.3 + rng.normal(0, 0.05) + np.cumsum(1e-4 * np.cos(heading))
+        lon = 114.17 + rng.normal(0, 0.05) + np.cumsum(1e-4 * np.sin(heading))
+        routes.append((lat, lon))
+    return routes
+
+
+def benchmark_simplification(n_routes=300, n_points=2000, seed=0):
+    """Build the period map of synthetic routes with and without simplification; returns a list of dicts"""
+    routes = synthetic_routes(n_routes, n_points, seed)
+
+    rows = []
+    for simplify in (False, True):
+        start = time.perf_counter()
+        drawn, stats = simplify_routes(routes) if simplify else (routes, {"points_before": n_routes * n_points})
+        simplify_time = time.perf_counter() - start
+        map_plot = _folium_map(drawn)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "map.html")
+            map_plot.save(path)
+            html_bytes = os.path.getsize(path)
+        rows.append({"simplified": simplify, "routes": n_routes, "points": sum(len(lat) for lat, _ in drawn),
+                     "points_before": stats["points_before"], "simplify_s": round(simplify_time, 4),
+                     "build_s": round(time.perf_counter() - start, 4), "html_kb": round(html_bytes / 1024, 1)})
+    return rows
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    for row in benchmark_simplification(*args):
+        print(row)
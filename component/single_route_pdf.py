@@ -2,8 +2,10 @@ import os
 from fpdf import FPDF
 from selenium import webdriver
 import time
-from geopy.distance import geodesic
+from component.geometry import track_length
+from component.static_map import MAP_RENDERER, render_static_map
 import datetime
+import numpy as np
 from PIL import Image
 
 def save_map(map_obj, path):
@@ -22,6 +24,15 @@ def capture_map_screenshot(map_path, screenshot_path):
     driver.save_screenshot(screenshot_path)
     driver.quit()
 
+def render_route_map(track_list, processed_track_list, screenshot_path):
+    # Original route in red and processed route in blue, like the dashboard map
+    lines = []
+    for track, color in ((track_list, 'red'), (processed_track_list, 'blue')):
+        if track:
+            lat, lon = np.asarray(track, dtype=float).reshape(-1, 2).T
+            lines.append({"lat": lat, "lon": lon, "color": color, "markers": "ends"})
+    return render_static_map(lines, screenshot_path)
+
 class PDF(FPDF):
     def __init__(self, route_name):
         # Use standard encoding with default fonts
@@ -175,7 +186,11 @@ class PDF(FPDF):
         self.multi_cell(0, 6, summary_text)
         self.ln(5)
 
-def generate_single_pdf(route_name, track_list, processed_track_list, route_details, estimated_result, map_obj):
+def generate_single_pdf(route_name, track_list, processed_track_list, route_details, estimated_result, map_obj=None,
+                        renderer=MAP_RENDERER):
+    # map_obj, a folium map, is only drawn by the selenium renderer; the static renderer uses the tracks
+    if renderer == "selenium" and map_obj is None:
+        raise ValueError("The selenium map renderer needs a folium map_obj")
     current_dir = os.path.dirname(os.path.abspath(__file__))  # Get the current directory
     reports_dir = os.path.join(current_dir, "../esg_single_route_reports")
     os.makedirs(reports_dir, exist_ok=True)  # Ensure the reports directory exists
@@ -246,7 +261,7 @@ def generate_single_pdf(route_name, track_list, processed_track_list, route_deta
     pdf.set_font("Arial", '', 10)
 
     # Calculate distances
-    total_distance = sum(geodesic(track_list[i], track_list[i + 1]).meters for i in range(len(track_list) - 1))
+    total_distance = track_length(track_list)
     pdf.formatted_cell(0, 10, "Original Route Distance: {:.2f} km".format(total_distance/1000))
     
     if processed_track_list:
@@ -256,9 +271,9 @@ def generate_single_pdf(route_name, track_list, processed_track_list, route_deta
             if filtered_data and 'total_distance_km' in filtered_data:
                 total_distance_processed = filtered_data['total_distance_km'] * 1000  # Convert to meters
             else:
-                total_distance_processed = sum(geodesic(processed_track_list[i], processed_track_list[i + 1]).meters for i in range(len(processed_track_list) - 1))
+                total_distance_processed = track_length(processed_track_list)
         else:
-            total_distance_processed = sum(geodesic(processed_track_list[i], processed_track_list[i + 1]).meters for i in range(len(processed_track_list) - 1))
+            total_distance_processed = track_length(processed_track_list)
             
         pdf.formatted_cell(0, 10, "Optimized Route Distance: {:.2f} km".format(total_distance_processed/1000))
         
@@ -281,10 +296,13 @@ def generate_single_pdf(route_name, track_list, processed_track_list, route_deta
     # 5. Route Map Visualization
     pdf.chapter_title("Route Visualization")
     
-    map_path = os.path.join(reports_dir, 'map.html')
     screenshot_path = os.path.join(reports_dir, 'map_screenshot.png')
-    save_map(map_obj, map_path)
-    capture_map_screenshot(map_path, screenshot_path)
+    if renderer == "selenium":
+        map_path = os.path.join(reports_dir, 'map.html')
+        save_map(map_obj, map_path)
+        capture_map_screenshot(map_path, screenshot_path)
+    else:
+        render_route_map(track_list, processed_track_list, screenshot_path)
     
     # Add map legend
     pdf.section_title("Map Legend")
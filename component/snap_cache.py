@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+import numpy as np
+
+DEFAULT_SNAP_CACHE_PATH = os.environ.get("SNAP_CACHE_PATH", os.path.join("cache", "snap_to_roads.sqlite"))
+
+
+class SnapToRoadsCache:
+    """
+    On-disk cache of Google Roads API snap_to_roads responses.
+
+    The key is a hash of the batch coordinates quantized to `precision` decimal
+    places (5 decimals is about 1 m) plus the interpolate flag, so re-processing
+    a route, or driving the same corridor again, reuses the stored response.
+    Entries are evicted least-recently-used once max_entries or max_bytes is
+    exceeded. Hit/miss counters are kept per instance.
+    """
+
+    def __init__(self, path=DEFAULT_SNAP_CACHE_PATH, max_entries=100000, max_bytes=256 * 1024 * 1024, precision=5):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.precision = precision
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS snap_cache ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS snap_cache_last_access ON snap_cache (last_access)")
+        self._conn.commit()
+
+    def make_key(self, path, interpolate):
+        quantized = np.round(np.asarray(path, dtype=float) * 10 ** self.precision).astype(np.int64)
+        digest = hashlib.sha256(quantized.tobytes())
+        digest.update(b"interpolate=1" if interpolate else b"interpolate=0")
+        return digest.hexdigest()
+
+    def get(self, path, interpolate):
+        """Return the cached snap_to_roads result for this batch, or None"""
+        key = self.make_key(path, interpolate)
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM snap_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE snap_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, path, interpolate, result):
+        key = self.make_key(path, interpolate)
+        value = zlib.compress(json.dumps(result).encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO snap_cache (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        entries, total_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM snap_cache").fetchone()
+        if entries <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+        # Drop the least recently used rows until both limits hold again
+        rows = self._conn.execute("SELECT key, size FROM snap_cache ORDER BY last_access").fetchall()
+        stale = []
+        for key, size in rows:
+            if entries <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            stale.append((key,))
+            entries -= 1
+            total_bytes -= size
+        self._conn.executemany("DELETE FROM snap_cache WHERE key = ?", stale)
+
+    def stats(self):
+        with self._lock:
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM snap_cache").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "size_bytes": total_bytes,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM snap_cache")
+            self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        self._conn.close()
+
+
+_default_cache = None
+
+
+def get_default_snap_cache():
+    """Process-wide cache shared by the dashboard and batch workers"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = SnapToRoadsCache()
+    return _default_cache
@@ -0,0 +1,213 @@
+"""
+Static route maps for the PDF reports, drawn with Pillow.
+
+Route coordinates are projected to Web Mercator pixels at the largest zoom level
+whose view holds every route, then polylines and markers are drawn on a plain
+basemap, or on the map tiles found in the local tile cache:
+
+    <MAP_TILE_DIR or cache/map_tiles>/<z>/<x>/<y>.png
+
+With MAP_TILE_URL set (e.g. "https://tile.example.com/{z}/{x}/{y}.png") missing
+tiles are downloaded into the cache. No browser is involved, so a report map takes
+tens of milliseconds instead of a headless Chrome start and fixed waits.
+
+MAP_RENDERER=selenium switches the PDF reports back to folium screenshots.
+
+Render a map of synthetic routes:
+    python -m component.static_map [out.png] [routes] [points per route]
+"""
+import os
+import sys
+import math
+import time
+import logging
+
+import numpy as np
+
+from component.geometry import web_mercator, WGS84_A
+from component.simplify import concatenated_mask, PIXEL_TOLERANCE
+
+MAP_RENDERER = os.environ.get("MAP_RENDERER", "static")
+DEFAULT_TILE_DIR = os.environ.get("MAP_TILE_DIR", os.path.join("cache", "map_tiles"))
+MAP_TILE_URL = os.environ.get("MAP_TILE_URL")
+MAP_TILE_ATTRIBUTION = os.environ.get("MAP_TILE_ATTRIBUTION", "Map data: OpenStreetMap contributors")
+
+TILE_SIZE = 256
+MAX_ZOOM = 17
+# Report maps: roughly the aspect ratio the PDF pages reserve for them
+MAP_WIDTH_PX = 1600
+MAP_HEIGHT_PX = 900
+BACKGROUND_COLOR = (242, 239, 233)
+# Lines are drawn at this multiple of the output size and scaled down, for anti-aliasing
+SUPERSAMPLE = 2
+
+# folium/Leaflet marker color names that are not CSS colors
+FOLIUM_COLORS = {
+    "lightred": "#ff8e7f",
+    "darkpurple": "#5b396b",
+}
+
+
+def map_color(name):
+    """RGB of a CSS or folium color name"""
+    from PIL import ImageColor
+
+    return ImageColor.getrgb(FOLIUM_COLORS.get(name, name))
+
+
+def world_pixels(lat, lon, zoom):
+    """Web Mercator pixel coordinates (x right, y down) at an integer or fractional zoom"""
+    x, y = web_mercator(lat, lon)
+    scale = TILE_SIZE * 2 ** zoom / (2 * math.pi * WGS84_A)
+    return (x + math.pi * WGS84_A) * scale, (math.pi * WGS84_A - y) * scale
+
+
+def fit_zoom(lat, lon, width, height, padding, max_zoom=MAX_ZOOM, integer=True):
+    """
+    Largest zoom at which all points fit into width x height minus the padding; integer
+    zoom levels are needed to draw tiles, a plain basemap can use the exact fit.
+    """
+    x, y = world_pixels(lat, lon, 0)
+    extent_x, extent_y = np.ptp(x), np.ptp(y)
+    fits = []
+    for available, extent in ((width - 2 * padding, extent_x), (height - 2 * padding, extent_y)):
+        if extent > 0:
+            fits.append(math.log2(max(available, 1) / extent))
+    if not fits:
+        return max_zoom
+    zoom = min(max(min(fits), 0), max_zoom)
+    return int(math.floor(zoom)) if integer else zoom
+
+
+def _tile(zoom, x, y, tile_dir, tile_url):
+    """One basemap tile from the cache (downloaded into it when tile_url is set), or None"""
+    from PIL import Image
+
+    path = os.path.join(tile_dir, str(zoom), str(x), f"{y}.png")
+    if not os.path.exists(path):
+        if not tile_url:
+            return None
+        import requests
+
+        try:
+            response = requests.get(tile_url.format(z=zoom, x=x, y=y), timeout=5,
+                                    headers={"User-Agent": "kerry-fleet-intelligence-tracker"})
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logging.warning(f"Map tile {zoom}/{x}/{y} download failed: {e}")
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(response.content)
+    try:
+        return Image.open(path).convert("RGB")
+    except OSError as e:
+        logging.warning(f"Unreadable map tile {path}: {e}")
+        return None
+
+
+def _draw_basemap(image, zoom, left, top, tile_dir, tile_url):
+    """Paste the cached tiles covering the view; returns the number of tiles drawn"""
+    width, height = image.size
+    tiles = 0
+    n = 2 ** zoom
+    for tile_x in range(int(left // TILE_SIZE), int((left + width) // TILE_SIZE) + 1):
+        for tile_y in range(int(top // TILE_SIZE), int((top + height) // TILE_SIZE) + 1):
+            if not 0 <= tile_y < n:
+                continue
+            tile = _tile(zoom, tile_x % n, tile_y, tile_dir, tile_url)
+            if tile is not None:
+                image.paste(tile, (int(round(tile_x * TILE_SIZE - left)), int(round(tile_y * TILE_SIZE - top))))
+                tiles += 1
+    return tiles
+
+
+def _visible_points(x, y, offsets):
+    """Mask of the pixel coordinates of the concatenated lines that change the drawing"""
+    # Consecutive points in the same half-pixel cell draw the same line: drop them first,
+    # which is one cheap pass, then simplify what is left with Douglas-Peucker
+    cell_x, cell_y = np.floor(x / PIXEL_TOLERANCE), np.floor(y / PIXEL_TOLERANCE)
+    candidates = np.r_[True, (np.diff(cell_x) != 0) | (np.diff(cell_y) != 0)]
+    candidates[offsets[:-1]] = candidates[offsets[1:] - 1] = True
+    idx = np.flatnonzero(candidates)
+    keep = np.zeros(len(x), dtype=bool)
+    keep[idx[concatenated_mask(x[idx], y[idx], np.add.reduceat(candidates, offsets[:-1]), PIXEL_TOLERANCE)]] = True
+    return keep
+
+
+def render_static_map(lines, path, width=MAP_WIDTH_PX, height=MAP_HEIGHT_PX, padding=40, tile_dir=DEFAULT_TILE_DIR,
+                      tile_url=MAP_TILE_URL, max_zoom=MAX_ZOOM, default_center=(22.3193, 114.1694)):
+    """
+    Draw lines, simplified to the pixel grid, on a map image saved to path.
+
+    lines is a list of dicts: lat and lon arrays, color (CSS or folium name), optional
+    width (px, default 4) and markers ("ends", "all" or None). Returns
+    {zoom, tiles, points, elapsed_s}.
+    """
+    from PIL import Image, ImageDraw
+
+    start = time.perf_counter()
+    lines = [line for line in lines if len(line["lat"])]
+    if lines:
+        all_lat = np.concatenate([np.asarray(line["lat"], dtype=float) for line in lines])
+        all_lon = np.concatenate([np.asarray(line["lon"], dtype=float) for line in lines])
+        zoom = fit_zoom(all_lat, all_lon, width, height, padding, max_zoom,
+                        integer=bool(tile_url) or os.path.isdir(tile_dir))
+        x, y = world_pixels(all_lat, all_lon, zoom)
+        center_x, center_y = (x.min() + x.max()) / 2, (y.min() + y.max()) / 2
+    else:
+        # Nothing to draw: the default area at city scale
+        zoom = min(10, max_zoom)
+        x, y = world_pixels([default_center[0]], [default_center[1]], zoom)
+        center_x, center_y = x[0], y[0]
+    left, top = center_x - width / 2, center_y - height / 2
+
+    image = Image.new("RGB", (width, height), BACKGROUND_COLOR)
+    tiles = _draw_basemap(image, zoom, left, top, tile_dir, tile_url) if float(zoom).is_integer() else 0
+
+    # Nearest-neighbour up and box filter down gives the basemap pixels back unchanged
+    canvas = image.resize((width * SUPERSAMPLE, height * SUPERSAMPLE), Image.NEAREST)
+    draw = ImageDraw.Draw(canvas)
+    lengths = [len(line["lat"]) for line in lines]
+    offsets = np.r_[0, np.cumsum(lengths)]
+    keep = _visible_points(x, y, offsets) if lines else None
+    for i, line in enumerate(lines):
+        line_slice = slice(offsets[i], offsets[i + 1])
+        px, py = (x[line_slice] - left) * SUPERSAMPLE, (y[line_slice] - top) * SUPERSAMPLE
+        line_keep = keep[line_slice]
+        points = list(zip(px[line_keep].tolist(), py[line_keep].tolist()))
+        color = map_color(line.get("color", "blue"))
+        line_width = line.get("width", 4) * SUPERSAMPLE
+        if len(points) > 1:
+            draw.line(points, fill=color, width=line_width, joint="curve")
+        markers = {"ends": [points[0], points[-1]],
+                   "all": list(zip(px.tolist(), py.tolist()))}.get(line.get("markers"), [])
+        radius = 5 * SUPERSAMPLE
+        for marker_x, marker_y in markers:
+            draw.ellipse((marker_x - radius, marker_y - radius, marker_x + radius, marker_y + radius),
+                         fill=color, outline=(255, 255, 255), width=SUPERSAMPLE)
+    image = canvas.reduce(SUPERSAMPLE)
+
+    if tiles:
+        ImageDraw.Draw(image).text((8, height - 18), MAP_TILE_ATTRIBUTION, fill=(80, 80, 80))
+    image.save(path)
+    return {"zoom": zoom, "tiles": tiles, "points": sum(len(line["lat"]) for line in lines),
+            "elapsed_s": round(time.perf_counter() - start, 4)}
+
+
+def benchmark_render(path="static_map.png", n_routes=300, n_points=2000):
+    """Simplify and render synthetic routes like the period report does; returns timings"""
+    from component.simplify import synthetic_routes, simplify_routes
+
+    start = time.perf_counter()
+    routes, stats = simplify_routes(synthetic_routes(n_routes, n_points), MAP_WIDTH_PX, MAP_HEIGHT_PX)
+    colors = ["red", "blue", "green", "purple", "orange", "darkred", "lightred", "darkblue", "cadetblue"]
+    lines = [{"lat": lat, "lon": lon, "color": colors[i % len(colors)], "markers": "ends"}
+             for i, (lat, lon) in enumerate(routes)]
+    summary = render_static_map(lines, path)
+    return {**stats, **summary, "total_s": round(time.perf_counter() - start, 4)}
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    print(benchmark_render(*args[:1], *[int(arg) for arg in args[1:]]))
@@ -0,0 +1,48 @@
+import threading
+
+import pytest
+
+from tests import fake_firestore
+
+
+@pytest.fixture(autouse=True)
+def fake_transactional(monkeypatch):
+    """Run @firestore.transactional functions against the in-memory client"""
+    from firebase_admin import firestore
+
+    monkeypatch.setattr(firestore, "transactional", fake_firestore.transactional)
+
+
+@pytest.fixture
+def db():
+    return fake_firestore.InMemoryFirestore()
+
+
+class FakeRoadsClient:
+    """snapToRoads stand-in: every point moved slightly north, plus one interpolated midpoint per segment"""
+    requests = []
+    lock = threading.Lock()
+
+    def __init__(self, key=None, **options):
+        pass
+
+    def snap_to_roads(self, path, interpolate=True):
+        with self.lock:
+            self.requests.append(len(path))
+        result = []
+        for i, (lat, lon) in enumerate(path):
+            result.append({"location": {"latitude": lat + 1e-6, "longitude": lon}, "originalIndex": i})
+            if interpolate and i + 1 < len(path):
+                result.append({"location": {"latitude": (lat + path[i + 1][0]) / 2,
+                                            "longitude": (lon + path[i + 1][1]) / 2}})
+        return result
+
+
+@pytest.fixture
+def roads_api(monkeypatch):
+    """Google Roads API calls go to FakeRoadsClient, which records the size of every request"""
+    from component import roads_client
+
+    FakeRoadsClient.requests = []
+    monkeypatch.setattr(roads_client.googlemaps, "Client", FakeRoadsClient)
+    return FakeRoadsClient
@@ -0,0 +1,230 @@
+"""
+Dict-backed stand-in for the parts of the Firestore client that the repository, the
+route index, the route store and the rollups use, for tests without Firebase.
+
+firebase_admin.firestore.transactional drives the SDK Transaction internals, so the
+tests replace it with transactional() below (see conftest.py).
+"""
+import datetime
+import itertools
+
+_clock = itertools.count(1)
+
+_OPERATORS = {
+    "==": lambda value, operand: value == operand,
+    "<": lambda value, operand: value < operand,
+    "<=": lambda value, operand: value <= operand,
+    ">": lambda value, operand: value > operand,
+    ">=": lambda value, operand: value >= operand,
+    "in": lambda value, operand: value in operand,
+}
+
+
+def transactional(function):
+    """Run function(transaction, ...) once and commit its writes, like one successful attempt"""
+
+    def run(transaction, *args, **kwargs):
+        result = function(transaction, *args, **kwargs)
+        transaction.commit()
+        return result
+
+    return run
+
+
+class _Snapshot:
+    def __init__(self, reference, data, update_time):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+        self.update_time = update_time
+
+    def to_dict(self):
+        return None if self._data is None else dict(self._data)
+
+    def get(self, field):
+        return self._data.get(field)
+
+
+class _DocumentReference:
+    def __init__(self, db, collection, doc_id):
+        self._db = db
+        self.collection_name = collection
+        self.id = doc_id
+
+    @property
+    def path(self):
+        return f"{self.collection_name}/{self.id}"
+
+    def get(self, field_paths=None, transaction=None):
+        self._db.reads += 1
+        return self._db._snapshot(self)
+
+    def set(self, document, merge=False):
+        self._db._write(self, document, merge)
+
+    def update(self, fields):
+        if self._db._documents.get(self.path) is None:
+            raise KeyError(f"No document to update: {self.path}")
+        self._db._write(self, fields, True)
+
+    def delete(self):
+        self._db._documents.pop(self.path, None)
+
+    def collection(self, name):
+        return _CollectionReference(self._db, f"{self.path}/{name}")
+
+
+class _Query:
+    """where / order_by / start_after / limit / select over one collection"""
+
+    def __init__(self, db, collection, filters=(), orders=(), cursor=None, limit=None, field_paths=None):
+        self._db = db
+        self._collection = collection
+        self._filters = list(filters)
+        self._orders = list(orders)
+        self._cursor = cursor
+        self._limit = limit
+        self._field_paths = field_paths
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, orders=self._orders, cursor=self._cursor, limit=self._limit,
+                     field_paths=self._field_paths)
+        state.update(changes)
+        return _Query(self._db, self._collection, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + [(field_path, direction == "DESCENDING")])
+
+    def start_after(self, fields):
+        return self._copy(cursor=fields)
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def select(self, field_paths):
+        return self._copy(field_paths=list(field_paths))
+
+    @staticmethod
+    def _value(snapshot, field_path):
+        return snapshot.id if field_path == "__name__" else snapshot._data.get(field_path)
+
+    def stream(self):
+        snapshots = [self._db._snapshot(_DocumentReference(self._db, self._collection, doc_id))
+                     for doc_id in self._db._ids(self._collection)]
+        for field_path, op_string, operand in self._filters:
+            snapshots = [snapshot for snapshot in snapshots if field_path in snapshot._data
+                         and snapshot._data[field_path] is not None
+                         and _OPERATORS[op_string](snapshot._data[field_path], operand)]
+        # Like Firestore, ordering on a field drops the documents without it
+        for field_path, _ in self._orders:
+            if field_path != "__name__":
+                snapshots = [snapshot for snapshot in snapshots if field_path in snapshot._data]
+        for field_path, descending in reversed(self._orders):
+            snapshots.sort(key=lambda snapshot: (self._value(snapshot, field_path) is not None,
+                                                 self._value(snapshot, field_path)), reverse=descending)
+        if self._cursor is not None:
+            cursor = tuple(self._cursor[field_path] for field_path, _ in self._orders)
+            for position, snapshot in enumerate(snapshots):
+                if tuple(self._value(snapshot, field_path) for field_path, _ in self._orders) == cursor:
+                    snapshots = snapshots[position + 1:]
+                    break
+        if self._limit is not None:
+            snapshots = snapshots[:self._limit]
+        for snapshot in snapshots:
+            self._db.reads += 1
+            if self._field_paths is not None:
+                snapshot._data = {key: value for key, value in snapshot._data.items() if key in self._field_paths}
+            yield snapshot
+
+
+class _CollectionReference(_Query):
+    def __init__(self, db, name):
+        super().__init__(db, name)
+        self.name = name
+
+    def document(self, doc_id):
+        return _DocumentReference(self._db, self.name, doc_id)
+
+    def list_documents(self):
+        """Like Firestore, also lists missing documents that only have subcollections"""
+        prefix = self.name + "/"
+        doc_ids = dict.fromkeys(path[len(prefix):].split("/", 1)[0] for path in self._db._documents
+                                if path.startswith(prefix))
+        return [self.document(doc_id) for doc_id in doc_ids]
+
+
+class _WriteBatch:
+    def __init__(self):
+        self._writes = []
+
+    def set(self, reference, document, merge=False):
+        self._writes.append(lambda: reference.set(document, merge))
+
+    def update(self, reference, fields):
+        self._writes.append(lambda: reference.update(fields))
+
+    def delete(self, reference):
+        self._writes.append(reference.delete)
+
+    def commit(self):
+        for write in self._writes:
+            write()
+        self._writes = []
+
+
+class _Transaction(_WriteBatch):
+    """Writes apply on commit; run with the transactional() stand-in from conftest.py"""
+
+
+class InMemoryFirestore:
+    """Dict-backed Firestore client; `reads` counts document reads like Firestore billing does"""
+
+    def __init__(self, collections=None):
+        self._documents = {}
+        self._update_times = {}
+        self.reads = 0
+        for name, documents in (collections or {}).items():
+            for doc_id, document in documents.items():
+                self.collection(name).document(doc_id).set(document)
+
+    def _write(self, reference, document, merge):
+        from google.cloud.firestore_v1.transforms import Sentinel
+
+        stored = dict(self._documents.get(reference.path) or {}) if merge else {}
+        for key, value in document.items():
+            # SERVER_TIMESTAMP and other transforms resolve to the write time
+            stored[key] = datetime.datetime.now(datetime.timezone.utc) if isinstance(value, Sentinel) else value
+        self._documents[reference.path] = stored
+        self._update_times[reference.path] = (datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+                                              + datetime.timedelta(microseconds=next(_clock)))
+
+    def _snapshot(self, reference):
+        return _Snapshot(reference, self._documents.get(reference.path), self._update_times.get(reference.path))
+
+    def _ids(self, collection):
+        prefix = collection + "/"
+        return [path[len(prefix):] for path in self._documents
+                if path.startswith(prefix) and "/" not in path[len(prefix):]]
+
+    def collection(self, name):
+        return _CollectionReference(self, name)
+
+    def document(self, path):
+        collection, doc_id = path.rsplit("/", 1)
+        return _DocumentReference(self, collection, doc_id)
+
+    def get_all(self, references, field_paths=None):
+        for reference in references:
+            yield reference.get()
+
+    def batch(self):
+        return _WriteBatch()
+
+    def transaction(self):
+        return _Transaction()
@@ -0,0 +1,189 @@
+import itertools
+
+import numpy as np
+import pytest
+import requests
+from PIL import Image, TiffImagePlugin, TiffTags
+
+from component import elevation
+from component.elevation import (HGT_VOID, ElevationCache, LocalDem, fetch_remote_elevation, open_geotiff,
+                                 open_hgt)
+
+
+def write_hgt(directory, name, data):
+    path = directory / name
+    np.asarray(data, dtype=">i2").tofile(path)
+    return str(path)
+
+
+def write_geotiff(path, data, west, north, scale_x, scale_y, nodata=None):
+    """Float32 GeoTIFF (PixelIsArea) whose top-left pixel corner is at (north, west)"""
+    info = TiffImagePlugin.ImageFileDirectory_v2()
+    info[elevation.GEOTIFF_PIXEL_SCALE] = (scale_x, scale_y, 0.0)
+    info.tagtype[elevation.GEOTIFF_PIXEL_SCALE] = TiffTags.DOUBLE
+    info[elevation.GEOTIFF_TIEPOINT] = (0.0, 0.0, 0.0, west, north, 0.0)
+    info.tagtype[elevation.GEOTIFF_TIEPOINT] = TiffTags.DOUBLE
+    if nodata is not None:
+        info[elevation.GDAL_NODATA] = str(nodata)
+        info.tagtype[elevation.GDAL_NODATA] = TiffTags.ASCII
+    Image.fromarray(np.asarray(data, dtype=np.float32)).save(path, tiffinfo=info)
+    return str(path)
+
+
+def test_hgt_tile_is_sampled_bilinearly(tmp_path):
+    # 3x3 nodes, 0.5 degree apart, node (0, 0) at the north-west corner (23N, 114E)
+    tile = open_hgt(write_hgt(tmp_path, "N22E114.hgt", [[0, 10, 20], [40, 50, 60], [80, 90, HGT_VOID]]))
+
+    assert (tile.south, tile.north, tile.west, tile.east) == (22, 23, 114, 115)
+    lat = np.array([23.0, 22.5, 22.75, 23.0, 22.5, 22.25])
+    lon = np.array([114.0, 114.5, 114.25, 114.75, 114.0, 114.75])
+    result = tile.sample(lat, lon)
+    np.testing.assert_allclose(result[:5], [0, 50, 25, 15, 40])
+    # A void corner makes the whole cell unknown instead of dragging it towards -32768
+    assert np.isnan(result[5])
+
+
+def test_hgt_tile_name_and_size_are_checked(tmp_path):
+    with pytest.raises(ValueError):
+        open_hgt(write_hgt(tmp_path, "tile.hgt", np.zeros((3, 3))))
+    with pytest.raises(ValueError):
+        open_hgt(write_hgt(tmp_path, "N22E114.hgt", np.zeros(10)))
+
+
+def test_geotiff_nodes_are_pixel_centres(tmp_path):
+    data = np.arange(12).reshape(3, 4) * 10.0
+    data[2, 3] = -9999
+    raster = open_geotiff(write_geotiff(tmp_path / "dem.tif", data, 114.0, 23.0, 0.5, 0.25, nodata=-9999))
+
+    assert (raster.west, raster.north) == (114.25, 22.875)
+    assert (raster.east, raster.south) == (115.75, 22.375)
+    assert raster.nodata == -9999
+    result = raster.sample(np.array([22.875, 22.75, 22.5]), np.array([114.25, 114.5, 115.5]))
+    np.testing.assert_allclose(result[:2], [0, 25])
+    assert np.isnan(result[2])
+
+
+def test_local_dem_uses_hgt_tiles_then_geotiffs(tmp_path):
+    write_hgt(tmp_path, "N22E114.hgt", np.full((3, 3), 100))
+    write_geotiff(tmp_path / "dem.tif", np.full((3, 3), 7.0), 120.0, 31.0, 0.5, 0.5)
+    (tmp_path / "notes.tif").write_text("not a tiff")
+
+    dem = LocalDem(str(tmp_path))
+
+    result = dem.lookup([22.5, 30.0, 10.0], [114.5, 120.5, 10.0])
+    np.testing.assert_allclose(result[:2], [100, 7])
+    assert np.isnan(result[2])
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # Strictly increasing access times, so LRU order does not depend on the clock resolution
+    clock = itertools.count(1)
+    monkeypatch.setattr(elevation.time, "time", lambda: float(next(clock)))
+    cache = ElevationCache(str(tmp_path / "elevation.sqlite"), grid_m=10.0, max_entries=3)
+    yield cache
+    cache.close()
+
+
+def cells(*indices):
+    """One point per 10 m cell, well apart from each other"""
+    lat = np.array([22.3 + i * 1e-3 for i in indices])
+    return lat, np.full(len(lat), 114.1)
+
+
+def test_cache_hit_and_miss(cache):
+    lat, lon = cells(0, 1)
+    assert np.isnan(cache.get_many(lat, lon)).all()
+
+    cache.put_many(lat, lon, [5.0, np.nan])
+
+    # Failed lookups are not stored; a point a metre away falls in the same cell
+    result = cache.get_many(np.append(lat, lat[0] + 1e-5), np.append(lon, lon[0]))
+    np.testing.assert_array_equal(result[[0, 2]], [5.0, 5.0])
+    assert np.isnan(result[1])
+    assert cache.stats()["entries"] == 1
+    assert (cache.hits, cache.misses) == (2, 3)
+
+
+def test_cache_evicts_least_recently_used(cache):
+    cache.put_many(*cells(0, 1, 2), [0.0, 1.0, 2.0])
+    cache.get_many(*cells(0))  # cell 1 is now the least recently used
+
+    cache.put_many(*cells(3), [3.0])
+
+    assert cache.stats()["entries"] == 3
+    result = cache.get_many(*cells(0, 1, 2, 3))
+    np.testing.assert_array_equal(result[[0, 2, 3]], [0.0, 2.0, 3.0])
+    assert np.isnan(result[1])
+
+
+class FakeResponse:
+    def __init__(self, locations):
+        self.locations = locations
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"results": [{"elevation": loc["latitude"] * 10} for loc in self.locations]}
+
+
+class FakeSession:
+    """Open-Elevation stand-in: elevation = 10 × latitude, batches starting at a failing latitude raise"""
+    failing = set()
+    calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def post(self, url, json, timeout):
+        locations = json["locations"]
+        self.calls.append(len(locations))
+        if locations[0]["latitude"] in self.failing:
+            raise requests.ConnectionError("connection reset")
+        return FakeResponse(locations)
+
+
+@pytest.fixture
+def elevation_api(monkeypatch):
+    FakeSession.failing = set()
+    FakeSession.calls = []
+    backoff = []
+
+    async def no_sleep(seconds):
+        backoff.append(seconds)
+
+    monkeypatch.setattr(requests, "Session", FakeSession)
+    monkeypatch.setattr(elevation.asyncio, "sleep", no_sleep)
+    FakeSession.backoff = backoff
+    return FakeSession
+
+
+def test_remote_batches_fill_one_array(elevation_api):
+    lat = np.arange(23, dtype=float)
+
+    result, failures = fetch_remote_elevation(lat, lat, batch_size=5, requests_per_second=1000)
+
+    assert failures == []
+    assert elevation_api.calls == [5, 5, 5, 5, 3]
+    np.testing.assert_array_equal(result, lat * 10)
+
+
+def test_failed_batch_is_nan_and_reported(elevation_api):
+    lat = np.arange(15, dtype=float)
+    elevation_api.failing = {5.0}
+
+    result, failures = fetch_remote_elevation(lat, lat, batch_size=5, requests_per_second=1000, max_retries=3)
+
+    assert len(failures) == 1
+    assert failures[0]["start"] == 5 and failures[0]["stop"] == 10 and failures[0]["points"] == 5
+    assert "connection reset" in failures[0]["error"]
+    assert np.isnan(result[5:10]).all()
+    np.testing.assert_array_equal(result[:5], lat[:5] * 10)
+    np.testing.assert_array_equal(result[10:], lat[10:] * 10)
+    # Three attempts for the failing batch, with exponential backoff between them
+    assert len(elevation_api.calls) == 2 + 3
+    assert [s for s in elevation_api.backoff if s >= 1] == [1, 2]
@@ -0,0 +1,135 @@
+import datetime
+
+import pytest
+
+from component.calculate_emission_distance import calculate_total_emission_and_distance
+from component.emission_rollups import (rollup_collection_name, day_id, month_id, update_rollups, rebuild_rollups,
+                                        period_routes, period_totals)
+from component.estimated_results import period_summary
+from component.route_repository import RouteRepository, DATABASE_COLLECTIONS
+
+DATABASE = "test_database_01"
+ESTIMATED = DATABASE_COLLECTIONS[DATABASE]["estimated"]
+DAY = datetime.date(2025, 2, 3)
+
+
+def rollup_document(db, doc_id):
+    snapshot = db.collection(rollup_collection_name(ESTIMATED)).document(doc_id).get()
+    return snapshot.to_dict() if snapshot.exists else None
+
+
+def day_document(db, date=DAY):
+    return rollup_document(db, day_id(date))
+
+
+def without_timestamp(document):
+    return {key: value for key, value in document.items() if key != "updated_at"}
+
+
+def assert_month_is_sum_of_days(db, month_start):
+    month = rollup_document(db, month_id(month_start))
+    days = [document for document in (day_document(db, month_start.replace(day=day)) for day in range(1, 29))
+            if document is not None]
+    assert month["route_count"] == sum(day["route_count"] for day in days)
+    assert month["co2_emissions_kg"] == pytest.approx(sum(day["co2_emissions_kg"] for day in days))
+    assert month["total_distance_km"] == pytest.approx(sum(day["total_distance_km"] for day in days))
+    drivers = {driver for day in days for driver in day["drivers"]}
+    assert set(month["drivers"]) == drivers
+    for driver in drivers:
+        in_days = [day["drivers"][driver] for day in days if driver in day["drivers"]]
+        assert month["drivers"][driver]["route_count"] == sum(values["route_count"] for values in in_days)
+        assert month["drivers"][driver]["co2_emissions_kg"] == pytest.approx(
+            sum(values["co2_emissions_kg"] for values in in_days))
+
+
+def result(co2, distance):
+    return {"co2_emissions_kg": co2, "total_distance_km": distance}
+
+
+def test_rewriting_a_result_replaces_its_rollup_entry(db):
+    repository = RouteRepository(DATABASE, db=db)
+    repository.save_estimated_result("Route_u1_03022025_1", result(10.0, 4.0), "u1")
+    repository.save_estimated_result("Route_u2_03022025_2", result(1.0, 2.0), "u2")
+
+    repository.save_estimated_result("Route_u1_03022025_1", result(12.5, 5.0), "u1")
+
+    day = day_document(db)
+    assert day["route_count"] == 2
+    assert day["co2_emissions_kg"] == pytest.approx(13.5)
+    assert day["total_distance_km"] == pytest.approx(7.0)
+    assert day["drivers"]["u1"] == {"co2_emissions_kg": 12.5, "total_distance_km": 5.0, "route_count": 1}
+    assert day["routes"]["Route_u1_03022025_1"]["co2_emissions_kg"] == 12.5
+    # The result document is written in the same transaction
+    stored = db.collection(ESTIMATED).document("Route_u1_03022025_1_estimated_result_version").get().to_dict()
+    assert stored["co2_emissions_kg"] == 12.5
+
+
+def test_removing_a_result_removes_its_entry(db):
+    update_rollups(db, ESTIMATED, "Route_u1_03022025_1", result(10.0, 4.0), "u1")
+    update_rollups(db, ESTIMATED, "Route_u1_03022025_2", result(2.0, 1.0), "u1")
+
+    update_rollups(db, ESTIMATED, "Route_u1_03022025_1", None)
+
+    day = day_document(db)
+    assert list(day["routes"]) == ["Route_u1_03022025_2"]
+    assert (day["route_count"], day["co2_emissions_kg"]) == (1, 2.0)
+    assert day["drivers"] == {"u1": {"co2_emissions_kg": 2.0, "total_distance_km": 1.0, "route_count": 1}}
+    assert_month_is_sum_of_days(db, DAY.replace(day=1))
+
+    update_rollups(db, ESTIMATED, "Route_u1_03022025_2", None)
+    month = rollup_document(db, month_id(DAY))
+    assert (month["route_count"], month["drivers"]) == (0, {})
+
+
+def test_routes_without_a_date_only_write_the_result(db):
+    result_ref = db.collection(ESTIMATED).document("Manual_route_estimated_result_version")
+
+    assert update_rollups(db, ESTIMATED, "Manual_route", result(1.0, 1.0), "u1", result_ref=result_ref) is False
+    assert result_ref.get().exists
+    assert list(db.collection(rollup_collection_name(ESTIMATED)).stream()) == []
+
+
+def test_incremental_rollups_match_a_rebuild(db):
+    repository = RouteRepository(DATABASE, db=db)
+    for day in range(1, 6):
+        for driver in ("u1", "u2"):
+            route_name = f"Route_{driver}_{day:02d}022025_{day}"
+            repository.save_estimated_result(route_name, result(float(day), 1.0), driver)
+            repository.save_estimated_result(route_name, result(day + 0.5, 2.0), driver)
+    start, end = datetime.date(2025, 2, 1), datetime.date(2025, 2, 28)
+    incremental, _ = period_routes(db, ESTIMATED, start, end)
+    incremental_days = {date: day_document(db, date) for date in (start + datetime.timedelta(d) for d in range(5))}
+    assert_month_is_sum_of_days(db, start)
+    incremental_month = rollup_document(db, month_id(start))
+
+    summary = rebuild_rollups(db, ESTIMATED)
+
+    assert (summary["routes"], summary["days"], summary["months"]) == (10, 5, 1)
+    assert period_routes(db, ESTIMATED, start, end)[0] == incremental
+    for date, document in incremental_days.items():
+        assert without_timestamp(day_document(db, date)) == without_timestamp(document)
+    rebuilt_month = rollup_document(db, month_id(start))
+    assert rebuilt_month["route_count"] == incremental_month["route_count"]
+    assert rebuilt_month["co2_emissions_kg"] == pytest.approx(incremental_month["co2_emissions_kg"])
+    totals = period_summary(db, ESTIMATED, start, end, ttl_seconds=0)
+    assert totals["source"] == "rollups"
+    assert totals["route_count"] == 10
+    assert totals["co2_emissions_kg"] == pytest.approx(2 * sum(day + 0.5 for day in range(1, 6)))
+
+
+def test_period_totals_read_whole_months_and_partial_days(db):
+    repository = RouteRepository(DATABASE, db=db)
+    for date in (datetime.date(2025, 1, 31), datetime.date(2025, 2, 1), datetime.date(2025, 2, 28),
+                 datetime.date(2025, 3, 1), datetime.date(2025, 3, 2)):
+        repository.save_estimated_result(f"Route_u1_{date:%d%m%Y}_1", result(float(date.day), 1.0), "u1")
+    rebuild_rollups(db, ESTIMATED)
+
+    totals = period_totals(db, ESTIMATED, datetime.date(2025, 1, 31), datetime.date(2025, 3, 1))
+
+    # January 31 as a day, February as its month document, March 1 as a day
+    assert totals["documents_read"] == 3
+    assert totals["route_count"] == 4
+    assert totals["co2_emissions_kg"] == pytest.approx(31 + 1 + 28 + 1)
+    assert totals["drivers"]["u1"]["route_count"] == 4
+    assert calculate_total_emission_and_distance("31-01-2025", "01-03-2025", DATABASE, db) == \
+        (pytest.approx(61.0), pytest.approx(4.0), 4)
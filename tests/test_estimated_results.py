@@ -0,0 +1,88 @@
+import datetime
+
+import pytest
+
+from component.emission_rollups import rebuild_rollups
+from component.estimated_results import backfill_estimated_results, invalidate_period_summaries, period_summary
+from component.route_repository import RouteRepository, DATABASE_COLLECTIONS
+
+DATABASE = "test_database_01"
+ESTIMATED = DATABASE_COLLECTIONS[DATABASE]["estimated"]
+START, END = datetime.date(2025, 2, 1), datetime.date(2025, 2, 28)
+
+
+def save_results(db):
+    repository = RouteRepository(DATABASE, db=db)
+    for name, co2, driver in (("Route_u2_10022025_1", 3.0, "u2"), ("Route_u1_01022025_1", 1.0, "u1"),
+                              ("Route_u1_28022025_1", 2.0, "u1"), ("Route_u1_31012025_1", 50.0, "u1"),
+                              ("Route_u1_01032025_1", 60.0, "u1")):
+        repository.save_estimated_result(name, {"co2_emissions_kg": co2, "total_distance_km": 10 * co2}, driver)
+    repository.save_estimated_result("Route_u1_15022025_1", {"co2_emissions_kg": "n/a", "total_distance_km": 1.0},
+                                     "u1")
+
+
+def test_period_summary_without_rollups_queries_the_results(db):
+    save_results(db)
+
+    summary = period_summary(db, ESTIMATED, START, END, ttl_seconds=0)
+
+    assert summary["source"] == "estimated_results"
+    assert summary["route_ids"] == ["Route_u1_01022025_1", "Route_u2_10022025_1", "Route_u1_28022025_1"]
+    assert summary["route_count"] == 3
+    assert summary["co2_emissions_kg"] == pytest.approx(6.0)
+    assert summary["total_distance_km"] == pytest.approx(60.0)
+    # The unusable result is read but not counted
+    assert summary["documents_read"] == 4
+    assert summary["routes"][1] == {"route_name": "Route_u2_10022025_1", "route_date": "2025-02-10",
+                                    "driver_id": "u2", "co2_emissions_kg": 3.0, "total_distance_km": 30.0}
+
+
+def test_period_summary_switches_to_rollups_once_built(db):
+    save_results(db)
+    before = period_summary(db, ESTIMATED, START, END, ttl_seconds=0)
+
+    rebuild_rollups(db, ESTIMATED)
+    after = period_summary(db, ESTIMATED, START, END, ttl_seconds=0)
+
+    assert after["source"] == "rollups"
+    for key in ("route_ids", "routes", "route_count", "co2_emissions_kg", "total_distance_km"):
+        assert after[key] == before[key]
+
+
+def test_period_summary_is_shared_until_invalidated(db):
+    invalidate_period_summaries()
+    save_results(db)
+    first = period_summary(db, ESTIMATED, START, END)
+    first["route_ids"].clear()
+    reads = db.reads
+
+    assert period_summary(db, ESTIMATED, START, END)["route_count"] == 3
+    assert db.reads == reads
+    invalidate_period_summaries(ESTIMATED)
+    period_summary(db, ESTIMATED, START, END)
+    assert db.reads > reads
+
+
+def test_backfill_fills_in_missing_fields_only(db, capsys):
+    db.collection(DATABASE).document("u1").set({"Route_u1_01022025_1": [], "Route_u1_02022025_1": []})
+    estimated = db.collection(ESTIMATED)
+    estimated.document("Route_u1_01022025_1_estimated_result_version").set({"co2_emissions_kg": 1.0})
+    estimated.document("Route_u1_02022025_1_estimated_result_version").set(
+        {"co2_emissions_kg": 1.0, "route_date": "2025-02-02", "driver_id": "u1"})
+    # A route that is no longer in any driver document, and a legacy name without a date
+    estimated.document("Route_u9_03022025_1_estimated_result_version").set({"co2_emissions_kg": 1.0})
+    estimated.document("legacy_estimated_result_version").set({"co2_emissions_kg": 1.0})
+
+    dry_run = backfill_estimated_results(db, DATABASE, ESTIMATED, dry_run=True)
+    assert "Route_u1_01022025_1_estimated_result_version" in capsys.readouterr().out
+    assert estimated.document("Route_u1_01022025_1_estimated_result_version").get().get("route_date") is None
+
+    summary = backfill_estimated_results(db, DATABASE, ESTIMATED)
+
+    for result in (dry_run, summary):
+        assert (result["documents"], result["updated"], result["no_date"], result["no_driver"]) == (4, 2, 1, 2)
+    document = estimated.document("Route_u1_01022025_1_estimated_result_version").get().to_dict()
+    assert document == {"co2_emissions_kg": 1.0, "route_date": "2025-02-01", "driver_id": "u1"}
+    orphan = estimated.document("Route_u9_03022025_1_estimated_result_version").get().to_dict()
+    assert orphan == {"co2_emissions_kg": 1.0, "route_date": "2025-02-03"}
+    assert backfill_estimated_results(db, DATABASE, ESTIMATED)["updated"] == 0
@@ -0,0 +1,38 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from component.GPS_cleaning_nonML import filter_by_angle
+
+
+def random_trace(n, seed, nan_points=0, duplicates=False):
+    rng = np.random.default_rng(seed)
+    lat = 22.3 + np.cumsum(rng.normal(0, 1e-4, n))
+    lon = 114.1 + np.cumsum(rng.normal(0, 1e-4, n))
+    if nan_points:
+        lat[rng.integers(0, n, nan_points)] = np.nan
+    if duplicates:
+        lat[5:8], lon[5:8] = lat[5], lon[5]
+    return pd.DataFrame({"timestamp": pd.date_range("2025-02-01", periods=n, freq="5s"),
+                         "latitude": lat, "longitude": lon})
+
+
+@pytest.mark.parametrize("n, seed, nan_points, duplicates", [
+    (3, 0, 0, False),
+    (50, 1, 0, False),
+    (400, 2, 3, False),
+    (400, 3, 0, True),
+    (600, 4, 5, True),
+])
+def test_vectorized_angle_filter_matches_row_by_row(n, seed, nan_points, duplicates):
+    df = random_trace(n, seed, nan_points, duplicates)
+    # The row-by-row version prints every flagged triple
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = filter_by_angle(df.copy(), 90, vectorized=False)
+        actual = filter_by_angle(df.copy(), 90, vectorized=True)
+
+    for expected_df, actual_df in zip(expected, actual):
+        pd.testing.assert_frame_equal(actual_df, expected_df, check_exact=True)
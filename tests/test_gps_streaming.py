@@ -0,0 +1,50 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from component.GPS_cleaning_nonML import clean_gps_data
+from component.gps_streaming import GpsCleaner
+
+
+def irregular_trace(n=1000, seed=0):
+    """Mixed sampling intervals with speed spikes and long stops, in strict timestamp order"""
+    rng = np.random.default_rng(seed)
+    # Tied timestamps are left out: the batch path's sort does not keep their order
+    steps = rng.choice([1, 3, 5, 7, 60, 400], n, p=[0.23, 0.3, 0.3, 0.1, 0.05, 0.02])
+    timestamps = pd.Timestamp("2025-02-01 08:00:03") + pd.to_timedelta(np.cumsum(steps), unit="s")
+    return pd.DataFrame({"timestamp": timestamps,
+                         "latitude": 22.3 + np.cumsum(rng.normal(0, 1e-4, n) + 2e-5),
+                         "longitude": 114.0 + np.cumsum(rng.normal(0, 1e-4, n) + 2e-5)})
+
+
+@pytest.fixture(scope="module")
+def batch_result():
+    df = irregular_trace()
+    # The streaming cleaner skips Layer 1 and snap-to-roads; without an API key Layer 3 keeps the points
+    with contextlib.redirect_stdout(io.StringIO()):
+        cleaned, total_time, total_distance_km, _ = clean_gps_data(df.copy(), None, outlier_method="none",
+                                                                   snap_cache=False, smoother="pykalman")
+    return df, cleaned, total_time, total_distance_km
+
+
+@pytest.mark.parametrize("chunk_size", [1000, 100, 7, 3])
+def test_streaming_cleaner_matches_batch_cleaner(batch_result, chunk_size):
+    df, expected, total_time, total_distance_km = batch_result
+    cleaner = GpsCleaner()
+    with contextlib.redirect_stdout(io.StringIO()):
+        parts = list(cleaner.stream(df.iloc[i:i + chunk_size] for i in range(0, len(df), chunk_size)))
+    actual = pd.concat(parts, ignore_index=True)
+
+    assert list(actual.columns) == list(expected.columns)
+    assert len(actual) == len(expected)
+    assert (actual["timestamp"].to_numpy() == expected["timestamp"].to_numpy()).all()
+    for column in ("time_diff", "distance", "speed"):
+        np.testing.assert_array_equal(actual[column].to_numpy(), expected[column].to_numpy())
+    # Fixed-lag smoothing: within 1e-9 degrees of the full pykalman smoother (documented on GpsCleaner)
+    for column in ("latitude", "longitude"):
+        np.testing.assert_allclose(actual[column].to_numpy(), expected[column].to_numpy(), rtol=0, atol=1e-9)
+    assert cleaner.total_time == pytest.approx(total_time)
+    assert cleaner.total_distance_km == pytest.approx(total_distance_km)
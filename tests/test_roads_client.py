@@ -0,0 +1,36 @@
+import pytest
+
+from component.roads_client import plan_batches, snap_path_to_roads
+
+
+@pytest.mark.parametrize("n_points", [1, 5, 100, 101, 191, 1000])
+def test_overlapping_batches_are_stitched_once(roads_api, n_points):
+    path = [[22.3 + i * 1e-4, 114.1 + i * 1e-4] for i in range(n_points)]
+
+    snapped = snap_path_to_roads(path, "key", snap_cache=False)
+
+    batches = plan_batches(n_points, 100, 10)
+    assert sorted(roads_api.requests) == sorted(stop - start for start, stop in batches)
+    # Every input point once and in order, with one interpolated point between neighbours
+    assert [p["original_index"] for p in snapped if p["original_index"] is not None] == list(range(n_points))
+    assert len(snapped) == 2 * n_points - 1
+    latitudes = [p["latitude"] for p in snapped]
+    assert latitudes == sorted(latitudes)
+
+
+def test_batches_overlap_and_cover_the_path():
+    batches = plan_batches(1000, 100, 10)
+    assert batches[0][0] == 0 and batches[-1][1] == 1000
+    assert all(stop - start <= 100 for start, stop in batches)
+    assert all(next_start == stop - 10 for (_, stop), (next_start, _) in zip(batches, batches[1:]))
+
+
+def test_sampled_trace_keeps_original_indices(roads_api):
+    path = [[22.3 + i * 1e-5, 114.1] for i in range(2000)]
+
+    snapped = snap_path_to_roads(path, "key", snap_cache=False, quota={"max_requests_per_route": 5})
+
+    indices = [p["original_index"] for p in snapped if p["original_index"] is not None]
+    assert len(roads_api.requests) == 5
+    assert indices[0] == 0 and indices[-1] == 1999
+    assert indices == sorted(set(indices))
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from component.route_encoding import (COORDINATE_SCALE, encode_coordinates, decode_coordinates,
+                                      encoded_coordinates_fields, route_coordinate_arrays, route_coordinates)
+
+
+def random_route(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return 22.3 + np.cumsum(rng.normal(0, 1e-4, n)), 114.1 + np.cumsum(rng.normal(0, 1e-4, n))
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 10000])
+def test_round_trip_within_half_a_micro_degree(n):
+    lat, lon = random_route(n)
+
+    decoded_lat, decoded_lon = route_coordinate_arrays(encoded_coordinates_fields(lat, lon))
+
+    assert len(decoded_lat) == len(decoded_lon) == n
+    np.testing.assert_allclose(decoded_lat, lat, rtol=0, atol=0.5 / COORDINATE_SCALE + 1e-12)
+    np.testing.assert_allclose(decoded_lon, lon, rtol=0, atol=0.5 / COORDINATE_SCALE + 1e-12)
+
+
+def test_extreme_coordinates_round_trip():
+    lat = np.array([-90.0, 90.0, 0.0, 45.123456])
+    lon = np.array([-180.0, 180.0, -180.0, 179.999999])
+
+    decoded_lat, decoded_lon = decode_coordinates(encode_coordinates(lat, lon), len(lat))
+
+    np.testing.assert_array_equal(decoded_lat, lat)
+    np.testing.assert_array_equal(decoded_lon, lon)
+
+
+def test_version_1_documents_are_read():
+    document = {"coordinates": [{"latitude": 22.3, "longitude": 114.1}, {"latitude": 22.31, "longitude": 114.12}]}
+
+    lat, lon = route_coordinate_arrays(document)
+
+    np.testing.assert_array_equal(lat, [22.3, 22.31])
+    np.testing.assert_array_equal(lon, [114.1, 114.12])
+    assert route_coordinates(document) == [(22.3, 114.1), (22.31, 114.12)]
+    assert route_coordinate_arrays({})[0].size == 0
+
+
+def test_point_count_mismatch_is_rejected():
+    lat, lon = random_route(5)
+    document = encoded_coordinates_fields(lat, lon)
+    document["point_count"] = 6
+
+    with pytest.raises(ValueError):
+        route_coordinate_arrays(document)
+
+
+@pytest.mark.parametrize("bad", [np.nan, np.inf, -np.inf])
+def test_non_finite_coordinates_are_rejected(bad):
+    lat, lon = random_route(5)
+    lon[3] = bad
+
+    with pytest.raises(ValueError, match="point 3"):
+        encode_coordinates(lat, lon)
@@ -0,0 +1,89 @@
+import datetime
+
+from component import route_repository
+from component.route_repository import RouteRepository
+from tests.fake_firestore import InMemoryFirestore
+
+DATABASE = "test_database_01"
+COLLECTIONS = route_repository.DATABASE_COLLECTIONS[DATABASE]
+
+# Two routes per day from 30 Jan to 3 Feb 2025, out of date order, plus one without a date
+ROUTE_NAMES = [f"Route_u1_{day}_{n}" for day in ("03022025", "30012025", "01022025", "31012025", "02022025")
+               for n in (2, 1)] + ["legacy_route"]
+
+
+def driver_db():
+    point = {"latitude": 22.3, "longitude": 114.1}
+    routes = {name: [point] * (i + 1) for i, name in enumerate(ROUTE_NAMES)}
+    return InMemoryFirestore({
+        DATABASE: {"u1": routes},
+        COLLECTIONS["processed"]: {"Route_u1_01022025_1_filtered_version": {}},
+    })
+
+
+def names(entries):
+    return [entry["route_name"] for entry in entries]
+
+
+def test_index_is_built_on_first_use():
+    repository = RouteRepository(DATABASE, db=driver_db())
+
+    entries = repository.list_routes("u1")
+
+    assert sorted(names(entries)) == sorted(ROUTE_NAMES)
+    entry = next(entry for entry in entries if entry["route_name"] == "Route_u1_01022025_1")
+    assert entry["route_date"] == "2025-02-01"
+    assert entry["has_processed"] and not entry["has_estimated"]
+    assert entry["point_count"] == ROUTE_NAMES.index("Route_u1_01022025_1") + 1
+    assert repository.list_routes("u2") is None
+
+
+def test_date_range_is_inclusive():
+    repository = RouteRepository(DATABASE, db=driver_db())
+
+    entries = repository.list_routes("u1", start_date=datetime.date(2025, 1, 31), end_date=datetime.date(2025, 2, 2))
+
+    assert names(entries) == ["Route_u1_31012025_1", "Route_u1_31012025_2", "Route_u1_01022025_1",
+                              "Route_u1_01022025_2", "Route_u1_02022025_1", "Route_u1_02022025_2"]
+
+
+def test_pages_cover_the_range_once_in_order():
+    repository = RouteRepository(DATABASE, db=driver_db())
+    start, end = datetime.date(2025, 1, 30), datetime.date(2025, 2, 3)
+
+    pages, last = [], None
+    while True:
+        page = repository.list_routes("u1", start, end, limit=4, start_after=last)
+        if not page:
+            break
+        pages.append(names(page))
+        last = page[-1]
+
+    assert [len(page) for page in pages] == [4, 4, 2]
+    everything = repository.list_routes("u1", start, end)
+    assert sum(pages, []) == names(everything)
+    # By date, then by name within a day; the undated route is outside every range
+    assert [(entry["route_date"], entry["route_name"]) for entry in everything] == sorted(
+        (entry["route_date"], entry["route_name"]) for entry in everything)
+    assert "legacy_route" not in names(everything)
+
+
+def test_descending_pages_start_from_the_latest_route():
+    repository = RouteRepository(DATABASE, db=driver_db())
+
+    first = repository.list_routes("u1", start_date=datetime.date(2025, 1, 1), limit=3, descending=True)
+    second = repository.list_routes("u1", start_date=datetime.date(2025, 1, 1), limit=3, descending=True,
+                                    start_after=first[-1])
+
+    assert names(first) == ["Route_u1_03022025_2", "Route_u1_03022025_1", "Route_u1_02022025_2"]
+    assert names(second) == ["Route_u1_02022025_1", "Route_u1_01022025_2", "Route_u1_01022025_1"]
+
+
+def test_index_is_rebuilt_after_the_driver_document_changes():
+    db = driver_db()
+    RouteRepository(DATABASE, db=db).list_routes("u1")
+    db.collection(DATABASE).document("u1").set({"Route_u1_04022025_1": []}, merge=True)
+
+    entries = RouteRepository(DATABASE, db=db).list_routes("u1", start_date=datetime.date(2025, 2, 3))
+
+    assert names(entries) == ["Route_u1_03022025_1", "Route_u1_03022025_2", "Route_u1_04022025_1"]
@@ -0,0 +1,111 @@
+from component import route_repository
+from component.route_repository import RouteRepository
+from tests.fake_firestore import InMemoryFirestore
+
+DATABASE = "test_database_01"
+COLLECTIONS = route_repository.DATABASE_COLLECTIONS[DATABASE]
+
+
+class CountingFirestore(InMemoryFirestore):
+    """Records the number of references of every get_all call"""
+
+    def __init__(self, collections=None):
+        super().__init__(collections)
+        self.get_all_calls = []
+
+    def get_all(self, references, field_paths=None):
+        references = list(references)
+        self.get_all_calls.append(len(references))
+        return super().get_all(references, field_paths)
+
+
+def route_names(n):
+    return [f"Route_u1_01022025_{i}" for i in range(n)]
+
+
+def route_collections(names):
+    return {
+        COLLECTIONS["processed"]: {f"{name}_filtered_version": {"route_name": name} for name in names},
+        COLLECTIONS["estimated"]: {f"{name}_estimated_result_version": {"co2_emissions_kg": 1.0} for name in names},
+        COLLECTIONS["routes"]: {name: {"driver_id": "u1"} for name in names},
+    }
+
+
+def test_second_read_is_memoized():
+    name = route_names(1)[0]
+    db = CountingFirestore(route_collections([name]))
+    repository = RouteRepository(DATABASE, db=db)
+
+    first = repository.processed_route(name)
+    assert db.reads == 1
+    second = repository.processed_route(name + "_filtered_version")
+
+    assert first == second == {"route_name": name}
+    assert db.reads == 1
+    assert repository.reads == 1
+
+
+def test_missing_document_is_memoized():
+    db = CountingFirestore()
+    repository = RouteRepository(DATABASE, db=db)
+
+    assert repository.estimated_result("Route_u1_01022025_9") is None
+    assert repository.estimated_result("Route_u1_01022025_9") is None
+    assert db.reads == 1
+
+
+def test_route_bundle_reads_with_one_get_all():
+    name = route_names(1)[0]
+    db = CountingFirestore(route_collections([name]))
+    repository = RouteRepository(DATABASE, db=db)
+
+    bundle = repository.route_bundle(name)
+
+    assert db.get_all_calls == [3]
+    assert bundle == {"processed": {"route_name": name}, "estimated": {"co2_emissions_kg": 1.0},
+                      "details": {"driver_id": "u1"}}
+    assert db.reads == 3
+
+
+def test_prefetch_batches_get_all(monkeypatch):
+    monkeypatch.setattr(route_repository, "GET_ALL_CHUNK_SIZE", 4)
+    names = route_names(5)
+    db = CountingFirestore(route_collections(names))
+    repository = RouteRepository(DATABASE, db=db)
+
+    repository.prefetch_routes(names)
+    # 15 documents in chunks of 4
+    assert db.get_all_calls == [4, 4, 4, 3]
+    assert db.reads == 15
+
+    for name in names:
+        assert repository.processed_route(name) == {"route_name": name}
+        assert repository.route_details(name) == {"driver_id": "u1"}
+    repository.prefetch_routes(names)
+    assert len(db.get_all_calls) == 4
+    assert db.reads == 15
+
+
+def test_iter_processed_routes_keeps_the_order_of_route_names():
+    names = route_names(23)
+    collections = route_collections(names)
+    del collections[COLLECTIONS["processed"]][f"{names[7]}_filtered_version"]
+    db = CountingFirestore(collections)
+    repository = RouteRepository(DATABASE, db=db)
+    repository.processed_route(names[20])
+
+    routes = list(repository.iter_processed_routes(names, chunk_size=5, max_workers=2))
+
+    # The memo hit first, then the fetched routes in order; missing documents are None
+    assert [name for name, _ in routes] == [names[20]] + names[:20] + names[21:]
+    assert dict(routes)[names[7]] is None
+    assert db.get_all_calls == [5, 5, 5, 5, 2]
+
+
+def test_driver_ids_skip_missing_driver_documents():
+    db = CountingFirestore({DATABASE: {"u1": {"Route_u1_01022025_1": []}, "u2": {}}})
+    # A driver document deleted after its route index was built
+    db.collection(DATABASE).document("u3").collection("route_index").document("Route_u3_01022025_1").set({})
+    repository = RouteRepository(DATABASE, db=db)
+
+    assert sorted(repository.driver_ids()) == ["u1", "u2"]
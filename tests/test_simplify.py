@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from rdp import rdp
+
+from component.simplify import (douglas_peucker_mask, concatenated_mask, simplify_routes, reduce_route,
+                                synthetic_routes)
+
+
+# rdp's 2-D cross product is deprecated in NumPy 2
+pytestmark = pytest.mark.filterwarnings("ignore::DeprecationWarning:rdp")
+
+
+def random_line(n, seed):
+    rng = np.random.default_rng(seed)
+    heading = rng.uniform(0, 2 * np.pi) + np.cumsum(rng.normal(0, 0.3, n))
+    return np.cumsum(10 * np.cos(heading)), np.cumsum(10 * np.sin(heading))
+
+
+@pytest.mark.parametrize("n, seed, tolerance", [
+    (2, 0, 1.0),
+    (3, 1, 1.0),
+    (200, 2, 0.5),
+    (1000, 3, 5.0),
+    (1000, 4, 50.0),
+])
+def test_mask_matches_rdp(n, seed, tolerance):
+    x, y = random_line(n, seed)
+
+    expected = rdp(np.column_stack([x, y]), epsilon=tolerance, return_mask=True)
+
+    np.testing.assert_array_equal(douglas_peucker_mask(x, y, tolerance), expected)
+
+
+def test_repeated_points_and_closed_loops_match_rdp():
+    x = np.array([0.0, 0.0, 5.0, 5.0, 10.0, 5.0, 0.0, 0.0])
+    y = np.array([0.0, 0.0, 3.0, 3.0, 0.0, -3.0, 0.0, 0.0])
+
+    expected = rdp(np.column_stack([x, y]), epsilon=1.0, return_mask=True)
+
+    np.testing.assert_array_equal(douglas_peucker_mask(x, y, 1.0), expected)
+
+
+def test_concatenated_lines_are_simplified_separately():
+    lines = [random_line(n, seed) for n, seed in ((300, 5), (1, 6), (0, 7), (500, 8))]
+    x = np.concatenate([line_x for line_x, _ in lines])
+    y = np.concatenate([line_y for _, line_y in lines])
+
+    mask = concatenated_mask(x, y, [len(line_x) for line_x, _ in lines], 5.0)
+
+    parts = np.split(mask, np.cumsum([len(line_x) for line_x, _ in lines])[:-1])
+    for (line_x, line_y), part in zip(lines, parts):
+        if len(line_x):
+            np.testing.assert_array_equal(part, rdp(np.column_stack([line_x, line_y]), epsilon=5.0,
+                                                    return_mask=True))
+
+
+def test_simplified_routes_keep_their_ends():
+    routes = synthetic_routes(20, 500)
+
+    simplified, stats = simplify_routes(routes)
+
+    assert stats["points_after"] == sum(len(lat) for lat, _ in simplified) < stats["points_before"] == 20 * 500
+    for (lat, lon), (simple_lat, simple_lon) in zip(routes, simplified):
+        assert (simple_lat[0], simple_lon[0], simple_lat[-1], simple_lon[-1]) == (lat[0], lon[0], lat[-1], lon[-1])
+        assert np.isin(simple_lat, lat).all()
+
+
+def test_reduce_route_is_a_single_route_map():
+    (lat, lon), = synthetic_routes(1, 2000)
+
+    (expected_lat, expected_lon), = simplify_routes([(lat, lon)], 800, 600)[0]
+    reduced_lat, reduced_lon = reduce_route(lat, lon, 800, 600)
+
+    np.testing.assert_array_equal(reduced_lat, expected_lat)
+    np.testing.assert_array_equal(reduced_lon, expected_lon)
@@ -0,0 +1,83 @@
+import contextlib
+import io
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from component import snap_cache
+from component.GPS_cleaning_nonML import clean_gps_data
+from component.snap_cache import SnapToRoadsCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # Strictly increasing access times, so LRU order does not depend on the clock resolution
+    clock = itertools.count(1)
+    monkeypatch.setattr(snap_cache.time, "time", lambda: float(next(clock)))
+    cache = SnapToRoadsCache(str(tmp_path / "snap.sqlite"))
+    yield cache
+    cache.close()
+
+
+def batch(offset):
+    return [[22.3 + offset * 1e-3, 114.1], [22.3 + offset * 1e-3, 114.2]]
+
+
+def response(offset):
+    return [{"location": {"latitude": 22.3 + offset * 1e-3, "longitude": 114.1}, "originalIndex": 0}]
+
+
+def test_hit_and_miss(cache):
+    assert cache.get(batch(0), True) is None
+    cache.put(batch(0), True, response(0))
+
+    assert cache.get(batch(0), True) == response(0)
+    # Below the quantization precision (5 decimals) the batch is the same
+    assert cache.get(np.asarray(batch(0)) + 1e-7, True) == response(0)
+    assert cache.get(batch(0), False) is None
+    assert cache.get(batch(1), True) is None
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 3
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    cache.max_entries = 2
+    cache.put(batch(0), True, response(0))
+    cache.put(batch(1), True, response(1))
+    cache.get(batch(0), True)
+
+    cache.put(batch(2), True, response(2))
+
+    assert cache.stats()["entries"] == 2
+    assert cache.get(batch(1), True) is None
+    assert cache.get(batch(0), True) == response(0)
+    assert cache.get(batch(2), True) == response(2)
+
+
+def test_size_limit_evicts(cache):
+    cache.put(batch(0), True, response(0))
+    cache.max_bytes = cache.stats()["size_bytes"] * 3 // 2
+
+    cache.put(batch(1), True, response(1))
+
+    assert cache.stats()["entries"] == 1
+    assert cache.get(batch(1), True) == response(1)
+
+
+def test_cleaning_an_unchanged_route_again_makes_no_calls(cache, roads_api):
+    rng = np.random.default_rng(0)
+    n = 600
+    df = pd.DataFrame({"timestamp": pd.date_range("2025-02-01 08:00", periods=n, freq="5s"),
+                       "latitude": 22.3 + np.cumsum(rng.normal(1e-4, 2e-5, n)),
+                       "longitude": 114.1 + np.cumsum(rng.normal(1e-4, 2e-5, n))})
+    calls = []
+    for _ in range(3):
+        before = len(roads_api.requests)
+        with contextlib.redirect_stdout(io.StringIO()):
+            clean_gps_data(df.copy(), "key", snap_cache=cache)
+        calls.append(len(roads_api.requests) - before)
+
+    assert calls[0] > 0
+    assert calls[1:] == [0, 0]
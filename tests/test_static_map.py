@@ -0,0 +1,87 @@
+import math
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from component.static_map import MAX_ZOOM, fit_zoom, render_static_map, world_pixels, _visible_points
+
+
+def test_single_point_uses_max_zoom():
+    assert fit_zoom([22.3], [114.1], 800, 600, 40) == MAX_ZOOM
+    assert fit_zoom([22.3, 22.3], [114.1, 114.1], 800, 600, 40, max_zoom=12) == 12
+
+
+@pytest.mark.parametrize("lat, lon, available", [
+    ([22.3, 22.4], [114.1, 114.1], 600 - 80),   # north-south line: only the height limits the zoom
+    ([22.3, 22.3], [114.1, 114.3], 800 - 80),   # east-west line: only the width does
+])
+def test_degenerate_extent_uses_the_other_axis(lat, lon, available):
+    x, y = world_pixels(lat, lon, 0)
+    extent = max(np.ptp(x), np.ptp(y))
+
+    zoom = fit_zoom(lat, lon, 800, 600, 40, integer=False)
+
+    assert zoom == pytest.approx(math.log2(available / extent))
+    assert fit_zoom(lat, lon, 800, 600, 40) == math.floor(zoom)
+
+
+def test_zoom_is_clamped():
+    assert fit_zoom([-80.0, 80.0], [-179.0, 179.0], 256, 256, 0) == 0
+    assert fit_zoom([22.3, 22.3000001], [114.1, 114.1], 800, 600, 40) == MAX_ZOOM
+
+
+def test_visible_points_keep_the_ends_of_every_line():
+    # Three straight lines, each much denser than a pixel, plus one inside a single pixel
+    x = np.r_[np.linspace(0, 100, 50), np.linspace(200, 300, 80), np.linspace(0, 0.1, 5), np.linspace(50, 50, 3)]
+    y = np.r_[np.zeros(50), np.linspace(0, 100, 80), np.zeros(5), np.linspace(0, 100, 3)]
+    offsets = np.array([0, 50, 130, 135, 138])
+
+    keep = _visible_points(x, y, offsets)
+
+    assert keep[offsets[:-1]].all() and keep[offsets[1:] - 1].all()
+    # Straight lines need nothing but their ends
+    assert np.flatnonzero(keep).tolist() == [0, 49, 50, 129, 130, 134, 135, 137]
+
+
+def lines():
+    t = np.linspace(0, 1, 500)
+    return [{"lat": 22.3 + 0.05 * t, "lon": 114.1 + 0.05 * np.sin(6 * t), "color": "lightred", "markers": "ends"},
+            {"lat": 22.32 + 0.0 * t[:20], "lon": 114.12 + 0.01 * t[:20], "color": "blue"},
+            {"lat": [], "lon": []}]
+
+
+def test_render_without_tiles_uses_the_exact_fit(tmp_path):
+    path = tmp_path / "map.png"
+
+    summary = render_static_map(lines(), str(path), width=400, height=300, padding=20,
+                                tile_dir=str(tmp_path / "no_tiles"), tile_url=None)
+
+    all_lat = np.concatenate([line["lat"] for line in lines()[:2]])
+    all_lon = np.concatenate([line["lon"] for line in lines()[:2]])
+    assert summary["zoom"] == pytest.approx(fit_zoom(all_lat, all_lon, 400, 300, 20, integer=False))
+    assert not float(summary["zoom"]).is_integer()
+    assert summary["tiles"] == 0
+    assert summary["points"] == 520
+    with Image.open(path) as image:
+        assert image.size == (400, 300)
+        # Something was drawn on the plain basemap
+        assert len(image.getcolors(400 * 300)) > 1
+
+
+def test_render_with_a_tile_directory_uses_integer_zoom(tmp_path):
+    (tmp_path / "tiles").mkdir()
+
+    summary = render_static_map(lines(), str(tmp_path / "map.png"), width=400, height=300, padding=20,
+                                tile_dir=str(tmp_path / "tiles"), tile_url=None)
+
+    assert isinstance(summary["zoom"], int)
+    assert summary["tiles"] == 0
+
+
+def test_render_nothing(tmp_path):
+    summary = render_static_map([{"lat": [], "lon": []}], str(tmp_path / "map.png"), width=200, height=100,
+                                tile_dir=str(tmp_path / "no_tiles"), tile_url=None)
+
+    assert summary["zoom"] == 10 and summary["points"] == 0
+    assert (tmp_path / "map.png").exists()
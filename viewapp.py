@@ -2,16 +2,22 @@ import streamlit as st
 from component.authenticator import handle_authentication, authenticator, save_config
 import folium
 from streamlit_folium import folium_static
-import firebase_admin
-from firebase_admin import credentials, firestore
 from rdp import rdp
-from geopy.distance import geodesic
+from component.geometry import track_length
+from component.route_encoding import route_coordinates
+from component.route_store import get_route_store
+from component.route_repository import RouteRepository, init_firebase
 import os
 from component.single_route_pdf import generate_single_pdf
+from component.static_map import MAP_RENDERER
 import component.send_email as send_email
-from component.calculate_emission_distance import calculate_total_emission_and_distance
+from component.calculate_emission_distance import calculate_period_summary
 from component.multi_route_pdf import generate_muti_pdf
-from component.GPS_cleaning_nonML import clean_gps_data, add_elevation_data, analyze_elevation
+from component.GPS_cleaning_nonML import (clean_gps_data, add_elevation_data, analyze_elevation,
+                                          route_data_to_dataframe, processed_route_document, MAP_MATCHERS,
+                                          DEFAULT_RESAMPLE_GAP_SECONDS)
+from component.map_matching import DEFAULT_ROAD_GRAPH_PATH
+from component.outlier_detection import OUTLIER_DETECTORS
 from component.emission import calculate_co2_emissions
 # Import style module
 from component.style import apply_custom_styles, show_kerry_header, display_metrics_row, get_marker_icon_color
@@ -38,31 +44,7 @@ if 'logout' not in st.session_state:
 handle_authentication(st)
 
 if st.session_state['authentication_status']:
-    # Initialize Firebase if not already initialized
-    if not firebase_admin._apps:
-        # Use Streamlit secrets to initialize Firebase Admin SDK
-        firebase_secrets = st.secrets["firebase"]
-        
-        # Convert secrets to the format expected by Firebase Admin SDK
-        firebase_creds = {
-            "type": firebase_secrets["type"],
-            "project_id": firebase_secrets["project_id"],
-            "private_key_id": firebase_secrets["private_key_id"],
-            "private_key": firebase_secrets["private_key"],
-            "client_email": firebase_secrets["client_email"],
-            "client_id": firebase_secrets["client_id"],
-            "auth_uri": firebase_secrets["auth_uri"],
-            "token_uri": firebase_secrets["token_uri"],
-            "auth_provider_x509_cert_url": firebase_secrets["auth_provider_x509_cert_url"],
-            "client_x509_cert_url": firebase_secrets["client_x509_cert_url"],
-            "universe_domain": firebase_secrets["universe_domain"]
-        }
-        
-        # Initialize Firebase Admin SDK with credentials from secrets
-        cred = credentials.Certificate(firebase_creds)
-        firebase_admin.initialize_app(cred)
-
-    db = firestore.client()
+    db = init_firebase()
 
     # Add database selection dropdown
     if 'selected_database' not in st.session_state:
@@ -101,61 +83,32 @@ if st.session_state['authentication_status']:
         else:
             st.markdown(f'<div class="db-badge db-badge-info">Test DB: {selected_database.replace("test_database_", "")}</div>', unsafe_allow_html=True)
 
-    # Update the corresponding routes collection name
-    if selected_database == "test_database_02":
-        routes_collection = "test_routes_detail_02"
-        processed_collection = "processed_routes"
-        estimated_result_collection = "estimated_result"
-    elif selected_database == "test_database_01":
-        routes_collection = "test_routes_detail_01"
-        processed_collection = "processed_routes"
-        estimated_result_collection = "estimated_result"
-    else:  # real_database_01
-        routes_collection = "real_routes_detail_01"
-        processed_collection = "real_processed_routes_ricky"
-        estimated_result_collection = "real_estimated_result"
-
-    def fetch_driver_ids_and_names():
-        driver_info = {}
-        docs = db.collection(selected_database).stream()
-        for doc in docs:
-            driver_id = doc.id
-            driver_name_doc = db.collection('Driver_Name').document(driver_id).get()
-            if driver_name_doc.exists:
-                driver_name = driver_name_doc.to_dict().get("displayName", driver_id)
-            else:
-                driver_name = driver_id
-            driver_info[driver_id] = driver_name
-        return driver_info
+    # Local Parquet copy of the database; page loads read it instead of Firestore while it is fresh
+    route_store = get_route_store()
+    with st.sidebar.expander("Local Route Store", expanded=False):
+        if st.button("Sync now"):
+            with st.spinner("Syncing changed documents..."):
+                sync_summary = RouteRepository(selected_database, db).sync_store(route_store)
+            st.caption(f"Fetched {sum(sync_summary[kind]['fetched'] for kind in ('raw', 'processed', 'estimated'))} "
+                       f"changed documents in {sync_summary['elapsed_s']} s")
+        store_last_sync = route_store.last_sync(selected_database)
+        if store_last_sync is None:
+            st.caption("Not synced yet: reading from Firestore")
+        else:
+            st.caption(f"Last sync: {store_last_sync.astimezone():%Y-%m-%d %H:%M}")
+    # One repository per rerun: reads are memoized for this run only
+    repository = RouteRepository(selected_database, db, route_store)
 
     def fetch_and_process_data(driver_id, route_name):
-        doc_ref = db.collection(selected_database).document(driver_id)
-        doc = doc_ref.get()
-
-        if doc.exists:
-            data = doc.to_dict()
-            if route_name in data:
-                input_data = data[route_name]
-            else:
-                st.error(f'No such field "{route_name}" in the document!')
-                st.stop()
-        else:
+        if repository.route_names(driver_id) is None:
             st.error('No such document!')
             st.stop()
-
+        input_data = repository.raw_route(driver_id, route_name)
+        if input_data is None:
+            st.error(f'No such field "{route_name}" in the document!')
+            st.stop()
         return input_data
 
-    def fetch_route_details(route_name):
-        doc_ref = db.collection(routes_collection).document(route_name)
-        doc = doc_ref.get()
-
-        if doc.exists:
-            route_details = doc.to_dict()
-        else:
-            route_details = None
-
-        return route_details
-
     def translate_data(input_data):
         track_list = []
         track_dict = {}
@@ -172,37 +125,13 @@ if st.session_state['authentication_status']:
         return track_list, track_dict
 
     def translate_processed_data(data):
-        coordinates = data.get("coordinates", [])
-        translated_coords = [(coord["latitude"], coord["longitude"]) for coord in coordinates]
-        return translated_coords
-
-    def fetch_processed_data(route_id):
-        doc_ref = db.collection(processed_collection).document(route_id)
-        doc = doc_ref.get()
-
-        if doc.exists:
-            processed_data = doc.to_dict()
-        else:
-            processed_data = []
-
-        return processed_data
-
-    def fetch_estimated_result(route_name):
-        doc_id = route_name + "_estimated_result_version"
-        doc_ref = db.collection(estimated_result_collection).document(doc_id)
-        doc = doc_ref.get()
-
-        if doc.exists:
-            estimated_result = doc.to_dict()
-        else:
-            estimated_result = None
-
-        return estimated_result
+        # Handles both the legacy coordinate list and the compact encoded format
+        return route_coordinates(data)
 
     if page == "Single Route":
         st.sidebar.header("Select Driver and Route")
 
-        driver_info = fetch_driver_ids_and_names()
+        driver_info = repository.driver_directory()
         driver_ids = list(driver_info.keys())
 
         drivers_with_names = [driver_id for driver_id in driver_ids if driver_info[driver_id] != driver_id]
@@ -221,11 +150,8 @@ if st.session_state['authentication_status']:
             st.session_state.confirm_clicked = False
 
         if driver_id:
-            doc_ref = db.collection(selected_database).document(driver_id)
-            doc = doc_ref.get()
-            if doc.exists:
-                data = doc.to_dict()
-                route_names = list(data.keys())
+            route_names = repository.route_names(driver_id)
+            if route_names is not None:
                 route_name = st.sidebar.selectbox("Select Route", route_names)
 
                 if route_name:
@@ -241,9 +167,12 @@ if st.session_state['authentication_status']:
                             mid = len(simplified_route)
                             centre = simplified_route[int(mid / 2)]
 
+                            # Processed route, estimated result and route details in one batched read
+                            repository.prefetch_routes([route_name])
+
                             # Check if processed route exists
                             filtered_route_name = route_name + '_filtered_version'
-                            processed_data = fetch_processed_data(filtered_route_name)
+                            processed_data = repository.processed_route(route_name)
                             has_processed_route = processed_data and isinstance(processed_data, dict)
                             
                             # If processed route exists, add route selection option
@@ -267,12 +196,12 @@ if st.session_state['authentication_status']:
                                     folium.Marker(location=point, icon=folium.Icon(color=original_color)).add_to(map_plot)
                                 folium.PolyLine(track_list, color=original_color).add_to(map_plot)
 
-                            total_distance = sum(geodesic(track_list[i], track_list[i + 1]).meters for i in range(len(track_list) - 1))
+                            total_distance = track_length(track_list)
 
                             st.header("Route Comparison")
 
                             filtered_route_name = route_name + '_filtered_version'
-                            processed_data = fetch_processed_data(filtered_route_name)
+                            processed_data = repository.processed_route(route_name)
 
                             if processed_data:
                                 processed_track_list = translate_processed_data(processed_data)
@@ -286,7 +215,7 @@ if st.session_state['authentication_status']:
                                     total_distance_processed = processed_data.get('total_distance_km', 0)
                                     if total_distance_processed == 0:
                                         # Fallback to calculation if the value isn't stored
-                                        total_distance_processed = sum(geodesic(processed_track_list[i], processed_track_list[i + 1]).meters for i in range(len(processed_track_list) - 1)) / 1000
+                                        total_distance_processed = track_length(processed_track_list) / 1000
                                 else:
                                     st.warning("Processed route data is empty.")
                             else:
@@ -297,7 +226,7 @@ if st.session_state['authentication_status']:
                             folium_static(map_plot)
                             st.markdown('</div>', unsafe_allow_html=True)
 
-                            estimated_result = fetch_estimated_result(route_name)
+                            estimated_result = repository.estimated_result(route_name)
                             st.header("Carbon emission")
                             if estimated_result:
                                 # Use metrics row to display carbon emission data
@@ -326,7 +255,7 @@ if st.session_state['authentication_status']:
                                 
                                 display_metrics_row(metrics)
 
-                            route_details = fetch_route_details(route_name)
+                            route_details = repository.route_details(route_name)
                             if route_details:
                                 st.header("Route Details")
                                 st.markdown('<div class="metric-card">', unsafe_allow_html=True)
@@ -375,44 +304,50 @@ if st.session_state['authentication_status']:
                         if input_data:
                             track_list, track_dict = translate_data(input_data)
 
-                            epsilon = 0.0003
-                            simplified_route = rdp(track_list, epsilon=epsilon)
+                            # Only the screenshot renderer needs a folium map; the static renderer
+                            # draws the PDF map from the tracks
+                            map_plot = None
+                            if MAP_RENDERER == "selenium":
+                                epsilon = 0.0003
+                                simplified_route = rdp(track_list, epsilon=epsilon)
 
-                            mid = len(simplified_route)
-                            centre = simplified_route[int(mid / 2)]
+                                mid = len(simplified_route)
+                                centre = simplified_route[int(mid / 2)]
 
-                            map_plot = folium.Map(location=centre, zoom_start=14)
+                                map_plot = folium.Map(location=centre, zoom_start=14)
 
-                            # Get the display option that was selected (default to "both" if not set)
-                            route_display_option = "both"
-                            if 'route_display_option' in locals():
-                                route_display_option = route_display_option
-                            
-                            # Show original route if selected for PDF
-                            if route_display_option in ["original", "both"]:
-                                for point in track_list:
-                                    folium.Marker(location=point, icon=folium.Icon(color='red')).add_to(map_plot)
-                                folium.PolyLine(track_list, color='red').add_to(map_plot)
+                                # Get the display option that was selected (default to "both" if not set)
+                                route_display_option = "both"
+                                if 'route_display_option' in locals():
+                                    route_display_option = route_display_option
+
+                                # Show original route if selected for PDF
+                                if route_display_option in ["original", "both"]:
+                                    for point in track_list:
+                                        folium.Marker(location=point, icon=folium.Icon(color='red')).add_to(map_plot)
+                                    folium.PolyLine(track_list, color='red').add_to(map_plot)
 
-                            total_distance = sum(geodesic(track_list[i], track_list[i + 1]).meters for i in range(len(track_list) - 1))
+                            total_distance = track_length(track_list)
 
+                            repository.prefetch_routes([route_name])
                             filtered_route_name = route_name + '_filtered_version'
-                            processed_data = fetch_processed_data(filtered_route_name)
+                            processed_data = repository.processed_route(route_name)
 
                             if processed_data:
                                 processed_track_list = translate_processed_data(processed_data)
 
-                                if processed_track_list:
+                                if processed_track_list and map_plot is not None:
                                     for point in processed_track_list:
                                         folium.Marker(location=point, icon=folium.Icon(color='blue')).add_to(map_plot)
                                     folium.PolyLine(processed_track_list, color='blue').add_to(map_plot)
 
                             else:
                                 st.warning("Processed route data is empty.")
-                            folium_static(map_plot)
+                            if map_plot is not None:
+                                folium_static(map_plot)
 
-                            route_details = fetch_route_details(route_name)
-                            estimated_result = fetch_estimated_result(route_name)
+                            route_details = repository.route_details(route_name)
+                            estimated_result = repository.estimated_result(route_name)
                             st.header("Carbon emission")
 
                         pdf_path = generate_single_pdf(route_name, track_list, processed_track_list, route_details, estimated_result, map_plot)
@@ -480,10 +415,15 @@ if st.session_state['authentication_status']:
                         start_date_str = start_date.strftime('%d-%m-%Y')
                         end_date_str = end_date.strftime('%d-%m-%Y')
                         
-                        total_emission, total_distance, routes_count = calculate_total_emission_and_distance(start_date_str, end_date_str)
+                        # One pass for totals, route ids and per-route rows; the PDF reuses it
+                        period_summary = calculate_period_summary(start_date_str, end_date_str, db=db)
+                        total_emission = period_summary['co2_emissions_kg']
+                        total_distance = period_summary['total_distance_km']
+                        routes_count = period_summary['route_count']
                         
                         # Store in session state
                         st.session_state.multi_route_calculated = True
+                        st.session_state.multi_period_summary = period_summary
                         st.session_state.multi_emission_data = total_emission
                         st.session_state.multi_distance_data = total_distance
                         st.session_state.routes_count = routes_count
@@ -611,7 +551,8 @@ if st.session_state['authentication_status']:
                                 st.session_state.end_date_str, 
                                 st.session_state.multi_emission_data, 
                                 st.session_state.multi_distance_data,
-                                routes_count
+                                routes_count,
+                                summary=st.session_state.get('multi_period_summary')
                             )
                             
                             with open(pdf_path_2, "rb") as file:
@@ -636,7 +577,7 @@ if st.session_state['authentication_status']:
     elif page == "GPS Filtering":
         st.sidebar.header("Filter GPS Data")
         
-        driver_info = fetch_driver_ids_and_names()
+        driver_info = repository.driver_directory()
         driver_ids = list(driver_info.keys())
 
         drivers_with_names = [driver_id for driver_id in driver_ids if driver_info[driver_id] != driver_id]
@@ -653,18 +594,21 @@ if st.session_state['authentication_status']:
 
         route_name = None
         if driver_id:
-            doc_ref = db.collection(selected_database).document(driver_id)
-            doc = doc_ref.get()
-            if doc.exists:
-                data = doc.to_dict()
-                route_names = list(data.keys())
+            route_names = repository.route_names(driver_id)
+            if route_names is not None:
                 route_name = st.sidebar.selectbox("Select Route", route_names)
 
+        outlier_method = st.sidebar.selectbox("Outlier Detection", list(OUTLIER_DETECTORS))
+        # 'osm' 用本地道路圖離線匹配，唔使 Google API
+        map_matcher = st.sidebar.selectbox("Map Matching", MAP_MATCHERS)
+        if map_matcher == 'osm' and not os.path.exists(DEFAULT_ROAD_GRAPH_PATH):
+            st.sidebar.warning(f"Road graph not found at {DEFAULT_ROAD_GRAPH_PATH}")
+
         if driver_id and route_name:
             filtered_route_name = route_name + '_filtered_version'
             
             # Check if filtered route already exists
-            existing_filtered_data = fetch_processed_data(filtered_route_name)
+            existing_filtered_data = repository.processed_route(route_name)
             
             if existing_filtered_data:
                 st.success(f"Filtered route data already exists for {route_name}")
@@ -694,15 +638,13 @@ if st.session_state['authentication_status']:
                         st.markdown('</div>', unsafe_allow_html=True)
                         
                         # Calculate distances
-                        total_distance = sum(geodesic(track_list[i], track_list[i + 1]).meters 
-                                         for i in range(len(track_list) - 1)) / 1000  # km
+                        total_distance = track_length(track_list) / 1000  # km
                                          
                         # Get the stored total_distance_km value from processed data instead of recalculating
                         total_distance_processed = existing_filtered_data.get('total_distance_km', 0)
                         if total_distance_processed == 0:
                             # Fallback to calculation if the value isn't stored
-                            total_distance_processed = sum(geodesic(processed_track_list[i], processed_track_list[i + 1]).meters 
-                                                for i in range(len(processed_track_list) - 1)) / 1000  # km
+                            total_distance_processed = track_length(processed_track_list) / 1000  # km
                                                 
                         st.write(f"Original route distance: {total_distance:.2f} km")
                         st.write(f"Filtered route distance: {total_distance_processed:.2f} km")
@@ -722,27 +664,9 @@ if st.session_state['authentication_status']:
                         track_list, _ = translate_data(input_data)
                         st.info(f"Translated {len(track_list)} GPS points for processing")
                         
-                        # Create a DataFrame with timestamp, latitude, longitude
-                        df = pd.DataFrame()
-                        
-                        # If input_data contains timestamps, use them; otherwise create dummy timestamps
-                        if isinstance(input_data, list):
-                            # Create timestamps spaced 5 seconds apart
-                            timestamps = pd.date_range(start=pd.Timestamp.now() - pd.Timedelta(seconds=5*len(input_data)), 
-                                                    periods=len(input_data), freq='5S')
-                            df['timestamp'] = timestamps
-                            df['latitude'] = [point[0] for point in track_list]
-                            df['longitude'] = [point[1] for point in track_list]
-                            st.info("Created DataFrame with list-based data structure")
-                        else:
-                            # Handle dict input with route_data
-                            route_data = input_data.get('route_data', [])
-                            timestamps = pd.date_range(start=pd.Timestamp.now() - pd.Timedelta(seconds=5*len(route_data)), 
-                                               periods=len(route_data), freq='5S')
-                            df['timestamp'] = timestamps
-                            df['latitude'] = [item.get('latitude') for item in route_data if isinstance(item, dict)]
-                            df['longitude'] = [item.get('longitude') for item in route_data if isinstance(item, dict)]
-                            st.info("Created DataFrame with dictionary-based data structure")
+                        # Create a DataFrame with timestamp, latitude, longitude (timestamps spaced 5 seconds apart)
+                        df = route_data_to_dataframe(input_data)
+                        st.info(f"Created DataFrame with {len(df)} GPS points")
                         
                         # For displaying sample of raw GPS data
                         if len(df) > 0:
@@ -772,9 +696,34 @@ if st.session_state['authentication_status']:
                         try:
                             # 更新 clean_gps_data 調用以接收角度可靠性數據
                             with st.spinner("Cleaning GPS data - this may take a while..."):
-                                cleaned_df, total_time, total_distance, angle_reliability_data = clean_gps_data(df, GOOGLE_MAPS_API_KEY)
+                                cleaned_df, total_time, total_distance, angle_reliability_data, cleaning_profile = clean_gps_data(
+                                    df, GOOGLE_MAPS_API_KEY, profile=True, route_name=route_name,
+                                    outlier_method=outlier_method, map_matcher=map_matcher,
+                                    resample_gap_seconds=DEFAULT_RESAMPLE_GAP_SECONDS)
                                 st.success(f"GPS cleaning complete! Retained {len(cleaned_df)} of {len(df)} points")
                                 
+                                # Per-layer timing and point counts
+                                st.subheader("Cleaning Pipeline Profile")
+                                st.table(cleaning_profile.to_dataframe())
+                                st.caption(f"Total: {cleaning_profile.total_wall_time:.2f} s wall, "
+                                           f"{cleaning_profile.total_cpu_time:.2f} s CPU, "
+                                           f"{cleaning_profile.total_api_calls} API calls")
+                                outlier_stats = cleaning_profile.layers[1]['details'] if len(cleaning_profile.layers) > 1 else {}
+                                if outlier_stats:
+                                    st.caption(f"Outlier detection ({outlier_stats['method']}): removed {outlier_stats['outliers']} "
+                                               f"of {outlier_stats['points']} points at {outlier_stats['points_per_second']:.0f} points/s")
+                                snap_stats = cleaning_profile.layers[3]['details'] if len(cleaning_profile.layers) > 3 else {}
+                                if 'snap_cache_hits' in snap_stats:
+                                    st.caption(f"Snap-to-roads cache: {snap_stats['snap_cache_hits']} hits, "
+                                               f"{snap_stats['snap_cache_misses']} misses")
+                                segments = cleaned_df.attrs.get('segments', [])
+                                if len(segments) > 1:
+                                    st.caption(f"Trip split into {len(segments)} driving segments at gaps over "
+                                               f"{DEFAULT_RESAMPLE_GAP_SECONDS} s")
+                                if 'matched_points' in snap_stats:
+                                    st.caption(f"Offline map matching: {snap_stats['matched_points']} of "
+                                               f"{snap_stats['points']} points matched in {snap_stats['match_elapsed_s']:.2f} s")
+                                
                                 if len(cleaned_df) > 0:
                                     # Show sample of cleaned data
                                     st.write("Sample of cleaned GPS data:")
@@ -800,10 +749,22 @@ if st.session_state['authentication_status']:
                                     st.write(f"Total: {len(cleaned_df)} GPS points after cleaning")
                                     
                                     # Add elevation data
-                                    with st.spinner("Fetching elevation data from API..."):
+                                    with st.spinner("Looking up elevation data (local DEM tiles, then API)..."):
                                         st.info(f"Processing elevation data for {len(cleaned_df)} GPS points...")
                                         cleaned_df = add_elevation_data(cleaned_df)
                                         st.success("Elevation data successfully added")
+                                        source_stats = cleaned_df.attrs.get('elevation_stats', {})
+                                        if source_stats:
+                                            cache_lookups = source_stats['cache_hits'] + source_stats['cache_misses']
+                                            hit_rate = source_stats['cache_hits'] / cache_lookups if cache_lookups else 0.0
+                                            st.caption(f"Elevation sources: {source_stats['local_dem']} local DEM, "
+                                                       f"{source_stats['cache_hits']} cache hits / {source_stats['cache_misses']} misses "
+                                                       f"({hit_rate:.0%} hit rate), "
+                                                       f"{source_stats.get('remote_requested', 0)} requested from the API")
+                                            if source_stats['remote_failed']:
+                                                st.warning(f"Elevation lookup failed for {source_stats['remote_failed']} points "
+                                                           f"({len(source_stats['failed_batches'])} batches); they are left out "
+                                                           f"of the elevation statistics")
                                     
                                     # Analyze elevation
                                     with st.spinner("Analyzing elevation profile..."):
@@ -812,22 +773,11 @@ if st.session_state['authentication_status']:
                                     
                                     # Upload to Firebase
                                     with st.spinner("Uploading processed data to Firestore..."):
-                                        coordinates = [{"latitude": row['latitude'], "longitude": row['longitude']} 
-                                                      for _, row in cleaned_df.iterrows()]
+                                        processed_document = processed_route_document(cleaned_df, total_time, total_distance, elevation_stats)
                                         
-                                        st.info(f"Preparing to upload {len(coordinates)} GPS points to Firestore")
-                                        doc_ref = db.collection(processed_collection).document(filtered_route_name)
-                                        doc_ref.set({
-                                            "coordinates": coordinates,
-                                            "timestamp": firestore.SERVER_TIMESTAMP,
-                                            "total_distance_km": total_distance,
-                                            "total_time_seconds": total_time,
-                                            "total_elevation_gain": elevation_stats['total_ascent'],
-                                            "total_elevation_loss": elevation_stats['total_descent'],
-                                            "max_elevation": elevation_stats['max_elevation'],
-                                            "min_elevation": elevation_stats['min_elevation']
-                                        })
-                                        st.success(f"Data successfully uploaded to Firestore collection: {processed_collection}/{filtered_route_name}")
+                                        st.info(f"Preparing to upload {processed_document['point_count']} GPS points to Firestore")
+                                        repository.save_processed_route(route_name, processed_document, driver_id)
+                                        st.success(f"Data successfully uploaded to Firestore collection: {repository.collections['processed']}/{filtered_route_name}")
                                     
                                     # 創建地圖顯示
                                     with st.spinner("Generating map visualization..."):
@@ -929,7 +879,7 @@ if st.session_state['authentication_status']:
             if st.sidebar.button("Calculate CO2 Emissions"):
                 try:
                     # Get the filtered route data
-                    filtered_data = fetch_processed_data(filtered_route_name)
+                    filtered_data = repository.processed_route(route_name)
                     
                     if filtered_data:
                         # Extract route parameters
@@ -939,7 +889,7 @@ if st.session_state['authentication_status']:
                         total_elevation_loss = filtered_data.get('total_elevation_loss', 0)
                         
                         # Get route details for vehicle parameters
-                        route_details = fetch_route_details(route_name) or {}
+                        route_details = repository.route_details(route_name) or {}
                         
                         # Set default values if not found
                         fuel_efficiency = route_details.get('fuel_efficiency', 10.0)  # km/L
@@ -960,12 +910,10 @@ if st.session_state['authentication_status']:
                         )
                         
                         # Save result to Firebase
-                        result_doc_id = route_name + "_estimated_result_version"
-                        db.collection(estimated_result_collection).document(result_doc_id).set({
+                        repository.save_estimated_result(route_name, {
                             'co2_emissions_kg': emissions,
-                            'total_distance_km': total_distance,
-                            'timestamp': firestore.SERVER_TIMESTAMP
-                        })
+                            'total_distance_km': total_distance
+                        }, driver_id)
                         
                         # Display results
                         st.success(f"CO2 Emissions calculated successfully!")